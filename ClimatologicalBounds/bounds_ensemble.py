@@ -0,0 +1,213 @@
+"""Create an ensemble of perturbed climatological boundary files for
+STEM boundary uncertainty runs.
+
+NOAA observations are bootstrapped within each site and altitude bin
+(the same 1000 m bins used by SiteClimMean).  Each bootstrap member's
+bin means are pushed through the same STEM-level averaging and
+vertical interpolation as the climatological profile, so member
+profiles are computed for all members at once as a matrix product.
+The ensemble is stored compactly as one base profile per site plus a
+float32 delta per member, site and level; full lateral and top
+boundary files are then expanded from base + delta for all members in
+one vectorized operation.
+"""
+
+import os
+import os.path
+import sys
+import numpy as np
+import netCDF4
+
+# shared helper modules (ioapi_tools, ...) live in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+import ioapi_tools
+from climatological_bounds_vertprofile import (
+    get_consts, ClimatologicalLateralBoundNAmerica)
+
+
+def profile_weights(site):
+    """calculate the matrix that maps a site's observed STEM-level means
+    onto its full, gap-filled vertical profile.
+
+    SiteClimMean.get_all_z_agl keeps observed levels as they are and
+    linearly interpolates (clamping at the ends) the remaining levels
+    in height above ground.  Both operations are linear in the
+    observed values, so the profile is W.dot(level_values).
+
+    ARGS:
+    site (SiteClimMean): a site with z_obs_mean populated
+
+    RETURNS:
+    obs_rows (numpy.ndarray): indices (into site.z_obs_mean) of the
+       levels containing observations
+    W (numpy.ndarray): array of shape [n_levels, len(obs_rows)]
+    """
+    zm = site.z_obs_mean
+    obs_rows = np.flatnonzero(np.isfinite(zm['analysis_value'].values))
+    alt = zm['sample_altitude'].values[obs_rows]
+    n_obs = obs_rows.size
+    eye = np.eye(n_obs)
+    W = np.empty((len(zm), n_obs))
+    for j in range(n_obs):
+        W[:, j] = np.interp(zm['z_agl'].values, alt, eye[j])
+    W[obs_rows, :] = eye
+    return obs_rows, W
+
+
+def bootstrap_site_profiles(site, n_members, rng):
+    """bootstrap a site's July-August mean vertical profile.
+
+    Observations are resampled with replacement within each altitude
+    bin.  All members are drawn at once as one index matrix per bin.
+
+    ARGS:
+    site (SiteClimMean): the site to resample
+    n_members (int): number of ensemble members
+    rng (numpy.random.RandomState): random number generator
+
+    RETURNS:
+    numpy.ndarray of shape [n_members, n_levels] containing the
+       members' gap-filled [COS] profiles (ppt)
+    """
+    obs = site.noaa_site.obs
+    obs_rows, W = profile_weights(site)
+    level_z = site.z_obs_mean['z_stem'].values[obs_rows]
+
+    bins = site.bin_z_stem.index.values
+    # A averages bin means into STEM level means, mirroring the
+    # groupby('z_stem').mean() in SiteClimMean.get_z_lev_mean
+    A = (site.bin_z_stem.values[:, np.newaxis] ==
+         level_z[np.newaxis, :]).astype(float)
+    A = A / A.sum(axis=0)
+
+    bin_means = np.empty((n_members, bins.size))
+    for i, this_bin in enumerate(bins):
+        vals = obs['analysis_value'].values[
+            obs['altitude_bin'].values == this_bin]
+        idx = rng.randint(0, vals.size, size=(n_members, vals.size))
+        bin_means[:, i] = vals[idx].mean(axis=1)
+
+    return bin_means.dot(A).dot(W.T)
+
+
+class BoundsEnsemble(object):
+    """bootstrap ensemble of climatological lateral and top boundaries
+
+    ATTRIBUTES:
+    site_codes (list): NOAA site codes included in the ensemble
+    base (numpy.ndarray): [n_sites, n_levels] climatological profiles
+       (ppt), identical to SiteClimMean.get_col_vals()
+    deltas (numpy.ndarray): [n_members, n_sites, n_levels] float32
+       member minus base [COS] (ppt)
+    """
+
+    def __init__(self, sites_dict, n_members=100, seed=None):
+        """create a BoundsEnsemble
+
+        ARGS:
+        sites_dict (dict): dict of SiteClimMean objects, as returned
+           by climatological_bounds_vertprofile.create_sites_dict
+        n_members (int): number of ensemble members
+        seed (int): seed for the random number generator
+        """
+        rng = np.random.RandomState(seed)
+        self.n_members = n_members
+        self.site_codes = sorted(sites_dict.keys())
+        self.base = np.vstack([sites_dict[s].get_col_vals()[:, 0]
+                               for s in self.site_codes])
+        self.deltas = np.empty((n_members,) + self.base.shape, dtype='f4')
+        for i, s in enumerate(self.site_codes):
+            self.deltas[:, i, :] = (
+                bootstrap_site_profiles(sites_dict[s], n_members, rng) -
+                self.base[i])
+
+    def member_profiles(self):
+        """return dict site code -> [n_members, n_levels] profiles"""
+        return dict((s, self.base[i] + self.deltas[:, i, :])
+                    for i, s in enumerate(self.site_codes))
+
+    def lateral_bounds(self):
+        """return all members' lateral boundaries (ppt), shape
+        [n_members, n_levels, n_perimeter_cells]"""
+        return ClimatologicalLateralBoundNAmerica.assemble_perimeter(
+            self.member_profiles())
+
+    def top_bounds(self, top_bnd):
+        """return all members' top boundaries (ppt)
+
+        ARGS:
+        top_bnd (ClimatologicalTopBound): the climatological top
+           boundary; supplies the nearest-site map and top level.
+
+        RETURNS:
+        array of shape [n_members, nx, ny]
+        """
+        rows = [self.site_codes.index(s) for s in top_bnd.site_codes]
+        top = (self.base[rows, top_bnd.nz] +
+               self.deltas[:, rows, top_bnd.nz])
+        return top[:, top_bnd.site_idx]
+
+    def write_compact(self, fname='bounds_ensemble.nc'):
+        """write the shared base profiles and per-member deltas to a
+        compressed netCDF file"""
+        nc = netCDF4.Dataset(fname, 'w', format='NETCDF4')
+        nc.createDimension('member', self.n_members)
+        nc.createDimension('site', len(self.site_codes))
+        nc.createDimension('level', self.base.shape[1])
+        v = nc.createVariable('site_code', str, ('site',))
+        v[:] = np.array(self.site_codes, dtype=object)
+        v = nc.createVariable('base', 'f4', ('site', 'level'), zlib=True)
+        v.units = 'ppt'
+        v.long_name = 'climatological July-August [COS] profile'
+        v[:] = self.base
+        v = nc.createVariable('delta', 'f4', ('member', 'site', 'level'),
+                              zlib=True, shuffle=True,
+                              chunksizes=(1, len(self.site_codes),
+                                          self.base.shape[1]))
+        v.units = 'ppt'
+        v.long_name = 'bootstrap member [COS] minus base'
+        v[:] = self.deltas
+        nc.close()
+
+    def write_ioapi_files(self,
+                          top_bnd,
+                          lateral_fname_fmt='climatological_COS_bdy_'
+                          '22levs_124x124_m{:03d}.nc',
+                          top_fname_fmt='upbound_124x124-climatological_'
+                          '124x124_m{:03d}.nc',
+                          zlib=False, fmt='NETCDF3_64BIT_OFFSET'):
+        """write one lateral and one top I/O API boundary file per
+        ensemble member
+
+        ARGS:
+        top_bnd (ClimatologicalTopBound): the climatological top
+           boundary
+        lateral_fname_fmt (string): format string for the lateral
+           boundary file names; formatted with the member number
+        top_fname_fmt (string): format string for the top boundary
+           file names; formatted with the member number
+        zlib (bool): if True compress the boundary variables (requires
+           a netCDF4 fmt)
+        fmt (string): netCDF file format; the default netCDF3 format
+           is readable by I/O API builds without netCDF4/HDF5
+        """
+        consts = get_consts()
+        grid = consts.grid('ARCNAGRID')
+        lateral = self.lateral_bounds() * consts.ppt_2_ppbv
+        top = self.top_bounds(top_bnd) * consts.ppt_2_ppbv
+        var = [('CO2_TRACER1', 'ppbv', 'bootstrap climatological [COS]')]
+        for m in range(self.n_members):
+            with ioapi_tools.IOAPIWriter(
+                    lateral_fname_fmt.format(m), grid, var,
+                    ftype=ioapi_tools.BNDARY3, nlays=lateral.shape[1],
+                    fdesc='bootstrap member {} of {}'.format(
+                        m, self.n_members),
+                    upnam='BoundsEnsemble', zlib=zlib, fmt=fmt) as w:
+                w.write_timestep(0, {'CO2_TRACER1': lateral[m]})
+            with ioapi_tools.IOAPIWriter(
+                    top_fname_fmt.format(m), grid, var, nlays=1,
+                    fdesc='bootstrap member {} of {}'.format(
+                        m, self.n_members),
+                    upnam='BoundsEnsemble', zlib=zlib, fmt=fmt) as w:
+                w.write_timestep(0, {'CO2_TRACER1': top[m][np.newaxis]})
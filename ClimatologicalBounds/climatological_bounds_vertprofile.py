@@ -8,12 +8,17 @@ matplotlib.use('AGG')
 import matplotlib.pyplot as plt
 import os
 import os.path
+import sys
 import numpy as np
-import netCDF4
 import pandas as pd
 import brewer2mpl
 
-from IOAPIpytools.ioapi_pytools import boundaries_from_csv, dummy_top_bounds
+# shared helper modules (ioapi_tools, ...) live in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+import ioapi_tools
+import noaa_obs_tools
+import data_paths
 from stem_pytools import noaa_ocs
 from stem_pytools import domain
 from stem_pytools import STEM_mapper
@@ -41,45 +46,62 @@ class Consts(object):
 
     fname_griddesc (string): full path to the Models-3 I/O API
         GRIDDESC file describing the STEM domain grid.  Default is
-        $HOME/Code/Regrid/GEOS-Chem_Regrid/GRIDDESC_GC
+        data path griddesc (see data_paths)
     noaa_dir (str): full path to the directory containing NOAA
-        observation files.  Default is $PROJ/Data/NOAA_95244993
-    topo_fname (string): full path to the Models-3 I/O API topography
-        file.  Default is $SARIKA_INPUT/TOPO-124x124.nc
-    wrf_height_fname (string): full path to the Models-3 I/O API WRF height
-        file.  Default is $SARIKA_INPUT/wrfheight-124x124-22levs.nc
+        observation files.  Default is data path noaa_dir
 
     ATTRIBUTES:
 
     fname_griddesc (string): full path to the Models-3 I/O API
         GRIDDESC file describing the STEM domain grid.
     noaa_dir (str): full path to the directory containing NOAA
-        observation files.  Default is $PROJ/Data/NOAA_95244993
+        observation files.
     topo_fname (string): full path to the Models-3 I/O API topography
-        file.  Default is $SARIKA_INPUT/TOPO-124x124.nc
-    wrf_height_fname (string): full path to the Models-3 I/O API WRF height
-        file.  Default is $SARIKA_INPUT/wrfheight-124x124-22levs.nc
+        file (data path topo)
+    wrfheight_fname (string): full path to the Models-3 I/O API WRF
+        height file (data path wrfheight)
     ppt_2_molecules_m3 (real) = conversion factor for converting
         parts per trillion by volume (ppt) to molecules per m^3
     ppt_2_ppbv = conversion factor for converting parts per trillion
         by volume (ppt) to parts per billion by volume (ppbv)
     """
 
-    def __init__(self,
-                 fname_griddesc=os.path.join(os.environ['HOME'],
-                                             'Code', 'Regrid',
-                                             'GEOS-Chem_Regrid',
-                                             'GRIDDESC_GC'),
-                 noaa_dir=os.path.join(
-                     os.getenv('PROJ'), 'Data', 'NOAA_95244993')):
+    def __init__(self, fname_griddesc=None, noaa_dir=None):
+        if fname_griddesc is None:
+            fname_griddesc = data_paths.get_path('griddesc')
+        if noaa_dir is None:
+            noaa_dir = data_paths.get_path('noaa_dir')
         self.fname_griddesc = fname_griddesc
         self.noaa_dir = noaa_dir
-        self.topo_fname = os.path.join(os.getenv('SARIKA_INPUT'),
-                                       'TOPO-124x124.nc')
-        self.wrfheight_fname = os.path.join(os.getenv('SARIKA_INPUT'),
-                                            'wrfheight-124x124-22levs.nc')
+        self.topo_fname = data_paths.get_path('topo')
+        self.wrfheight_fname = data_paths.get_path('wrfheight')
         self.ppt_2_molecules_m3 = 1e-12
         self.ppt_2_ppbv = 1e-3
+        self._grids = {}
+
+    def grid(self, gdnam='ARCNAGRID'):
+        """return the ioapi_tools grid gdnam of fname_griddesc; the
+        GRIDDESC file is parsed once per Consts object
+        """
+        if gdnam not in self._grids:
+            self._grids[gdnam] = ioapi_tools.parse_griddesc(
+                self.fname_griddesc, gdnam)
+        return self._grids[gdnam]
+
+
+# (data_paths registry, Consts) of the process; see get_consts
+_consts = (None, None)
+
+
+def get_consts():
+    """return the Consts object of this process (default paths),
+    creating it on first use and again after data_paths.reset()
+    """
+    global _consts
+    registry = data_paths.get_registry()
+    if _consts[0] is not registry:
+        _consts = (registry, Consts())
+    return _consts[1]
 
 
 class SiteClimMean(object):
@@ -94,11 +116,11 @@ class SiteClimMean(object):
         alt_bin_size (int): size of bins to group observation
             altitudes into (meters). Default is 1000 m.
         noaa_dir (str): full path to the directory containing NOAA
-            observation files.  Default is $PROJ/Data/NOAA_95244993
+            observation files.  Default is data path noaa_dir
         """
 
         if noaa_dir is None:
-            noaa_dir = os.path.join(os.getenv('PROJ'), 'Data', 'NOAA_95244993')
+            noaa_dir = get_consts().noaa_dir
         fname = os.path.join(
             noaa_dir,
             'ocs_{}_aircraft-pfp_1_hats_event.txt'.format(sitecode.lower()))
@@ -109,6 +131,7 @@ class SiteClimMean(object):
         self.z_all_agl = None
         self.x_stem = None
         self.y_stem = None
+        self.bin_z_stem = None
 
         self.get_jul_aug()
         self.get_z_lev_mean()
@@ -123,13 +146,10 @@ class SiteClimMean(object):
 
     def get_z_lev_mean(self):
         d = domain.STEM_Domain()
-        topo_dir = os.path.join(os.getenv('PROJ'), 'Data',
-                                'STEM_124x124_NA_inputs')
+        consts = get_consts()
         self.noaa_site.get_stem_xy(d.get_lon(), d.get_lat())
-        self.noaa_site.get_stem_z(
-            topo_fname=os.path.join(topo_dir, 'TOPO-124x124.nc'),
-            wrfheight_fname=os.path.join(topo_dir,
-                                         'wrfheight-124x124-22levs.nc'))
+        self.noaa_site.get_stem_z(topo_fname=consts.topo_fname,
+                                  wrfheight_fname=consts.wrfheight_fname)
 
         bin_min = 0  # bottom of bottom altitude bin, meters
         bin_max = 16000   # top of top altitude bin, meters
@@ -144,6 +164,7 @@ class SiteClimMean(object):
                                            'analysis_value']]
         # # change the index (which is the z level after the groupby to
         # # a column)
+        alt_bins = self.z_obs_mean.index.values
         self.z_obs_mean.reset_index(drop=True, inplace=True)
 
         # a handful of obs are in adjacent STEM cells, resulting in
@@ -159,6 +180,11 @@ class SiteClimMean(object):
             self.z_obs_mean.sample_altitude.values,
             stem_x=self.z_obs_mean.x_stem.values,
             stem_y=self.z_obs_mean.y_stem.values)
+        # remember which STEM z level each altitude bin ended up in so
+        # that individual observations can be traced to a level
+        # (used by bounds_ensemble to resample within bins)
+        self.bin_z_stem = pd.Series(self.z_obs_mean['z_stem'].values,
+                                    index=alt_bins)
 
         self.z_obs_mean = self.z_obs_mean[['x_stem', 'y_stem',
                                            'z_stem', 'sample_altitude',
@@ -172,11 +198,9 @@ class SiteClimMean(object):
         """get all STEM Z cell heights above ground level (from surface to
         top of domain).
         """
-        topo_fname = os.path.join(os.getenv('SARIKA_INPUT'), 'TOPO-124x124.nc')
-        wrfheight_fname = os.path.join(os.getenv('SARIKA_INPUT'),
-                                       'wrfheight-124x124-22levs.nc')
-        dom = domain.STEM_Domain(fname_topo=topo_fname)
-        dom.get_STEMZ_height(wrfheight_fname)
+        consts = get_consts()
+        dom = domain.STEM_Domain(fname_topo=consts.topo_fname)
+        dom.get_STEMZ_height(consts.wrfheight_fname)
 
         if self.z_obs_mean is None:
             self.get_z_lev_mean()
@@ -220,8 +244,7 @@ class ClimatologicalTopBound(object):
                  domain,
                  sites_list,
                  sites_dict=None,
-                 noaa_dir=os.path.join(
-                     os.getenv('PROJ'), 'Data', 'NOAA_95244993')):
+                 noaa_dir=None):
         """create a ClimatologicalTopBound object
 
         ARGS:
@@ -234,8 +257,10 @@ class ClimatologicalTopBound(object):
             each site in sites_list, with the keys the codes in
             site_list.
         noaa_dir (string): full path to the directory containing NOAA
-            observation files.  Default is $PROJ/Data/NOAA_95244993
+            observation files.  Default is data path noaa_dir
         """
+        if noaa_dir is None:
+            noaa_dir = get_consts().noaa_dir
         self.noaa_dir = noaa_dir
         self.d = domain
         self.sites_dict = sites_dict
@@ -289,31 +314,51 @@ class ClimatologicalTopBound(object):
         nx = self.nearest_site_array.shape[0]
         ny = self.nearest_site_array.shape[1]
         self.d.get_STEMZ_height()
-        nz = self.d.asl.shape[0] - 1
-        self.top_bnd = np.zeros([nx, ny])
-        for i in range(nx):
-            for j in range(ny):
-                self.top_bnd[i, j] = self.sites_dict[
-                    self.nearest_site_array[i, j]].z_obs_mean['ocs_interp'][nz]
-
-    def write_ioapi(self, fname_bdy='top_bounds.nc'):
+        self.nz = self.d.asl.shape[0] - 1
+        # self.site_codes[self.site_idx] reproduces nearest_site_array
+        self.site_codes, self.site_idx = np.unique(self.nearest_site_array,
+                                                   return_inverse=True)
+        self.site_idx = self.site_idx.reshape([nx, ny])
+        top_vals = np.array(
+            [self.sites_dict[s].z_obs_mean['ocs_interp'][self.nz]
+             for s in self.site_codes])
+        self.top_bnd = top_vals[self.site_idx]
+
+    def write_ioapi(self, fname_bdy='top_bounds.nc',
+                    sdate=0, stime=0, tstep=0, nsteps=1, zlib=False,
+                    fmt='NETCDF3_64BIT_OFFSET'):
         """write a Models-3 I/O API top boundary file from the
         object's top_bnd field.
 
+        The header and the data are written in one pass by
+        ioapi_tools.IOAPIWriter.
+
         ARGS:
         fname_bdy (string): name of the boundary file to create
+        sdate, stime, tstep (int): I/O API start date (YYYYDDD),
+           start time (HHMMSS), and time step (HHMMSS).  The default
+           tstep of 0 writes a time-independent file.
+        nsteps (int): number of (identical) timesteps to write
+        zlib (bool): if True compress the boundary variable (requires a
+           netCDF4 fmt)
+        fmt (string): netCDF file format.  The default netCDF3 format
+           is readable by I/O API builds without netCDF4/HDF5, as the
+           files IOAPIpytools wrote were; pass fmt='NETCDF4_CLASSIC'
+           and zlib=True for compressed files read only from Python.
         """
         fdesc = "climatological mean [COS] from nearest noaa site at Z = 22)"
-        dummy_top_bounds(fname_bdy,
-                         Consts().fname_griddesc,
-                         'ARCNAGRID',
-                         fdesc)
-
-        # place the climatological bounds in the dummy boundary file
-        nc = netCDF4.Dataset(fname_bdy, 'a')
-        nc.variables['CO2_TRACER1'][...] = (
-            self.top_bnd[np.newaxis, np.newaxis, ...] * Consts().ppt_2_ppbv)
-        nc.close()
+        consts = get_consts()
+        grid = consts.grid('ARCNAGRID')
+        top_bnd = (self.top_bnd * consts.ppt_2_ppbv)[np.newaxis, ...]
+        with ioapi_tools.IOAPIWriter(fname_bdy, grid,
+                                     [('CO2_TRACER1', 'ppbv',
+                                       'climatological [COS]')],
+                                     nlays=1, sdate=sdate, stime=stime,
+                                     tstep=tstep, fdesc=fdesc,
+                                     upnam='ClimTopBound',
+                                     zlib=zlib, fmt=fmt) as w:
+            for t in range(nsteps):
+                w.write_timestep(t, {'CO2_TRACER1': top_bnd})
 
     def map_nearest_noaa_site(self):
         """Plot the top boundary using
@@ -383,6 +428,20 @@ class ClimatologicalLateralBoundNAmerica(object):
 
     """
 
+    # starting in "lower left" with SW corner of domain and going counter
+    # clockwise, pfa could do north and northern pacific, esp a little
+    # lower on the pacific, and thd for rest of pacific and southwestern,
+    # tgc for rest of south, and maybe an average of nha/sca/cma for the
+    # east (which shouldn't matter).  (site, number of perimeter cells)
+    perimeter_sites = [('TGC', 31),
+                       ('NHA', 31),
+                       ('CMA', 31),
+                       ('SCA', 31),
+                       ('PFA', 126 + 42),
+                       ('ESP', 42),
+                       ('THD', 42 + 42),
+                       ('TGC', 82)]
+
     def __init__(self,
                  sites_dict):
         """set up a ClimatologicalLateralBoundNAmerica instance.
@@ -392,54 +451,69 @@ class ClimatologicalLateralBoundNAmerica(object):
            present in the dict; they will be ignored.
         """
 
-        # starting in "lower left" with SW corner of domain and going counter
-        # clockwise, pfa could do north and northern pacific, esp a little
-        # lower on the pacific, and thd for rest of pacific and southwestern,
-        # tgc for rest of south, and maybe an average of nha/sca/cma for the
-        # east (which shouldn't matter).
-
-        self.bounds = np.hstack(
-            (np.tile(sites_dict['TGC'].get_col_vals(), 31),
-             np.tile(sites_dict['NHA'].get_col_vals(), 31),
-             np.tile(sites_dict['CMA'].get_col_vals(), 31),
-             np.tile(sites_dict['SCA'].get_col_vals(), 31),
-             np.tile(sites_dict['PFA'].get_col_vals(), 126 + 42),
-             np.tile(sites_dict['ESP'].get_col_vals(), 42),
-             np.tile(sites_dict['THD'].get_col_vals(), 42 + 42),
-             np.tile(sites_dict['TGC'].get_col_vals(), 82)))
+        self.bounds = self.assemble_perimeter(
+            dict((s, sites_dict[s].get_col_vals()[:, 0])
+                 for s, n in self.perimeter_sites))
+
+    @classmethod
+    def assemble_perimeter(cls, profiles):
+        """place vertical profiles around the domain perimeter according
+        to cls.perimeter_sites.
+
+        ARGS:
+        profiles (dict): site code -> array of shape [..., nz].  Any
+           leading dimensions (e.g. ensemble members) are carried
+           through.
+
+        RETURNS:
+        array of shape [..., nz, n_perimeter_cells]
+        """
+        cols = np.stack([profiles[s] for s, n in cls.perimeter_sites],
+                        axis=-1)
+        return np.repeat(cols, [n for s, n in cls.perimeter_sites], axis=-1)
 
     def write_bounds_ioapi_file(
             self,
-            fname_bdy='climatological_COS_bdy_22levs_124x124.nc'):
+            fname_bdy='climatological_COS_bdy_22levs_124x124.nc',
+            sdate=0, stime=0, tstep=0, nsteps=1, zlib=False,
+            fmt='NETCDF3_64BIT_OFFSET'):
 
         """write a lateral boundary file in I/O API format
 
+        The header and the data are written in one pass by
+        ioapi_tools.IOAPIWriter.
+
         ARGS:
         fname_bdy (string): name for the boundary file to create.
+        sdate, stime, tstep (int): I/O API start date (YYYYDDD),
+           start time (HHMMSS), and time step (HHMMSS).  The default
+           tstep of 0 writes a time-independent file.
+        nsteps (int): number of (identical) timesteps to write
+        zlib (bool): if True compress the boundary variable (requires a
+           netCDF4 fmt)
+        fmt (string): netCDF file format.  The default netCDF3 format
+           is readable by I/O API builds without netCDF4/HDF5, as the
+           files IOAPIpytools wrote were; pass fmt='NETCDF4_CLASSIC'
+           and zlib=True for compressed files read only from Python.
         """
-
-        fname_csv = 'simple_climatological_bounds.csv'
-
         nlevs = 22
         fdesc = ("PFA for N and N pacific, ESP a little "
                  "lower on the pacific, and THD for rest of pacific and "
                  "SW, TGC for rest of S, and NHA/CMA/SCA mean for the E "
                  "(which shouldn't matter).")
-        # delete_if_exists(fname_csv)
-        # np.savetxt(fname_csv,
-        #            bounds.reshape([-1, 1]) * ppt_2_molecules_m3,
-        #            delimiter=',')
-
-        # write a "dummy" boundary file filled with 0.0
-        boundaries_from_csv(fname_csv, fname_bdy,
-                            Consts().fname_griddesc,
-                            'ARCNAGRID', nlevs, fdesc)
-
-        # place the climatological bounds in the dummy boundary file
-        nc = netCDF4.Dataset(fname_bdy, 'a')
-        nc.variables['CO2_TRACER1'][...] = (self.bounds[np.newaxis, ...] *
-                                            Consts().ppt_2_ppbv)
-        nc.close()
+        consts = get_consts()
+        grid = consts.grid('ARCNAGRID')
+        bounds = self.bounds * consts.ppt_2_ppbv
+        with ioapi_tools.IOAPIWriter(fname_bdy, grid,
+                                     [('CO2_TRACER1', 'ppbv',
+                                       'climatological [COS]')],
+                                     ftype=ioapi_tools.BNDARY3,
+                                     nlays=nlevs, sdate=sdate, stime=stime,
+                                     tstep=tstep, fdesc=fdesc,
+                                     upnam='ClimLatBound',
+                                     zlib=zlib, fmt=fmt) as w:
+            for t in range(nsteps):
+                w.write_timestep(t, {'CO2_TRACER1': bounds})
 
 
 def create_sites_dict(sites_list):
@@ -515,11 +589,11 @@ if __name__ == "__main__":
 
     # --
     # get STEM domain parameteres
-    d = domain.STEM_Domain(Consts().topo_fname)
+    d = domain.STEM_Domain(get_consts().topo_fname)
 
     # --
     # read NOAA [COS] observations data
-    sites = noaa_ocs.get_all_NOAA_airborne_data(Consts().noaa_dir)
+    sites = noaa_obs_tools.load_NOAA_airborne_data(get_consts().noaa_dir)
     sites_list = list(sites.obs.sample_site_code.unique())
     # drop WGC because there are no Jul/Aug observations
     if 'WGC' in sites_list:
@@ -543,6 +617,16 @@ if __name__ == "__main__":
     top_bnd = ClimatologicalTopBound(d, sites_list, sites_dict)
     top_bnd.write_ioapi(fname_bdy='upbound_124x124-climatological_124x124.nc')
     top_bnd.map_nearest_noaa_site()
+
+    # --
+    # optionally create a bootstrap ensemble of perturbed boundaries
+    # for boundary uncertainty runs
+    n_ensemble = 0
+    if n_ensemble > 0:
+        from bounds_ensemble import BoundsEnsemble
+        bnd_ens = BoundsEnsemble(sites_dict, n_members=n_ensemble, seed=0)
+        bnd_ens.write_compact('bounds_ensemble.nc')
+        bnd_ens.write_ioapi_files(top_bnd)
     # top_bounds_QC('upbound_124x124-climatological_124x124.nc')
 
     # plot_vertical_profiles([sites_dict[k] for k in lateral_bounds_sites_list],
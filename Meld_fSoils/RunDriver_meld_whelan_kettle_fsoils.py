@@ -1,30 +1,37 @@
 import sys
 import os
 import os.path
-import subprocess
+
+# shared helper modules (fortran_build_cache, ...) live in the
+# repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+import fortran_build_cache
+import data_paths
 
 if __name__ == "__main__":
 
-    os.environ['GRIDDESC'] = os.path.join(os.environ['HOME'],
-                                          'Data',
-                                          'STEM',
-                                          'input',
-                                          'GRIDDESC.txt')
-    os.environ['WRF_sfc_met'] = os.path.join(
-        os.environ['SARIKA_INPUT'],
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = {}
+    env['GRIDDESC'] = data_paths.get_path('ioapi_griddesc')
+    env['WRF_sfc_met'] = os.path.join(
+        data_paths.get_path('stem_input_dir'),
         'meteo2d-124x124-18levs-2008-2009.nc')
-    os.environ['kettle_fsoil'] = os.path.join(
-        os.environ['SARIKA_INPUT'],
+    env['kettle_fsoil'] = os.path.join(
+        data_paths.get_path('stem_input_dir'),
         'surfem-124x124-kettle-soil-cos_2008_2009.nc')
-    os.environ['crop_pct'] = os.path.join(
-        os.environ['HOME'],
-        'projects', 'COS (ecampbell3)', 'Fractional_US_Cropland',
-        'Ramankutty_etal_Cropland2000_pct_124x124_IOAPI.nc')
-    outfile = './whelan_kettle_hybrid_fsoil_124x124.nc'
-    os.environ['fsoil_out'] = outfile
+    env['crop_pct'] = data_paths.get_path('cropland_pct')
+    outfile = os.path.abspath('./whelan_kettle_hybrid_fsoil_124x124.nc')
+    env['fsoil_out'] = outfile
     if os.path.exists(outfile):
         sys.stdout.write('removing {}'.format(outfile))
         sys.stdout.flush()
         os.remove(outfile)
-    subprocess.call('make -f meld_whelan_kettle_fsoils.mk', shell=True)
-    subprocess.call('./meld_whelan_kettle_fsoils.x > log.log', shell=True)
+    exe = fortran_build_cache.FortranBuild(
+        here, 'meld_whelan_kettle_fsoils.mk',
+        'meld_whelan_kettle_fsoils.x').build()
+    fortran_build_cache.run_all(
+        exe,
+        [fortran_build_cache.FortranRun('meld_whelan_kettle_fsoils',
+                                        env=env)],
+        os.path.join(here, 'runs'))
@@ -0,0 +1,205 @@
+"""Generate many Whelan-Kettle melded soil COS flux (Fsoil) variants in
+one pass over the inputs.
+
+meld_whelan_kettle_fsoils.F90 produces one melded Fsoil file per run:
+a cropland-weighted average of the Whelan et al (2015) soil flux
+model (driven by WRF TSOIL and SMOIS) and the Kettle et al (2002)
+soil flux.  For sensitivity studies this module instead reads WRF
+TSOIL/SMOIS, the Kettle fluxes and the cropland fraction once, a chunk
+of time steps at a time, evaluates every requested MeldScenario
+(Whelan coefficients, cropland weighting scheme, Kettle scaling) for
+the chunk in one broadcast, and appends each scenario's chunk to its
+own Models-3 I/O API output file.
+
+The melded time axis follows meld_whelan_kettle_fsoils.F90: the
+period both WRF_sfc_met and kettle_fsoil cover, at the shorter of the
+two time steps, with each input taken from the record containing the
+output time.
+"""
+
+import os
+import os.path
+import sys
+import numpy as np
+import netCDF4
+
+# shared helper modules (ioapi_tools, ...) live in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+import ioapi_tools
+import data_paths
+from soil_flux_constants import WHELAN_FSOIL_COEFS
+
+pmol_per_mol = 1e12
+
+
+def crop_weight_linear(pct):
+    """Whelan weight equal to the cropland fraction (the weighting of
+    meld_whelan_kettle_fsoils.F90)"""
+    return pct
+
+
+def crop_weight_threshold(threshold=0.5):
+    """return a weighting function that uses the Whelan model only
+    (weight 1) where the cropland fraction is at least threshold, and
+    the Kettle flux only (weight 0) elsewhere"""
+    def weight(pct):
+        return (pct >= threshold).astype(pct.dtype)
+    return weight
+
+
+class MeldScenario(object):
+    """one melded Fsoil variant
+
+    ATTRIBUTES:
+    name (string): short name of the variant
+    fname_out (string): full path of the I/O API file to create
+    whelan_coefs (dict): Whelan model coefficients; keys vwc, Tsoil
+       and intercept (see soil_flux_constants.WHELAN_FSOIL_COEFS)
+    crop_weight (function): maps the cropland fraction array to the
+       weight given to the Whelan model (the Kettle flux gets
+       1 - weight)
+    kettle_scale (float): factor applied to the Kettle fluxes
+    """
+
+    def __init__(self, name, fname_out, whelan_coefs=None,
+                 crop_weight=crop_weight_linear, kettle_scale=1.0):
+        self.name = name
+        self.fname_out = fname_out
+        self.whelan_coefs = dict(WHELAN_FSOIL_COEFS)
+        if whelan_coefs is not None:
+            self.whelan_coefs.update(whelan_coefs)
+        self.crop_weight = crop_weight
+        self.kettle_scale = kettle_scale
+
+    def description(self):
+        """FILEDESC string for the scenario's output file"""
+        return ('hybrid soil COS flux ({}): Whelan model (vwc {vwc}, '
+                'Tsoil {Tsoil}, intercept {intercept}) on croplands, '
+                'Kettle soil COS flux x {} elsewhere'.format(
+                    self.name, self.kettle_scale, **self.whelan_coefs))
+
+
+def _file_times(nc):
+    """return (record timestamps as datetime64[s], time step in
+    seconds) of an open I/O API file"""
+    return (ioapi_tools.get_tflag_datetimes(nc),
+            ioapi_tools.tstep_to_seconds(nc.TSTEP))
+
+
+def melded_times(nc_wrf, nc_kettle):
+    """return the output timestamps (datetime64[s]) and the I/O API
+    time step (HHMMSS) of the melded files"""
+    t_w, dt_w = _file_times(nc_wrf)
+    t_k, dt_k = _file_times(nc_kettle)
+    t0 = max(t_w[0], t_k[0])
+    t1 = min(t_w[-1], t_k[-1])
+    if dt_w <= dt_k:
+        dt, tstep = dt_w, nc_wrf.TSTEP
+    else:
+        dt, tstep = dt_k, nc_kettle.TSTEP
+    t_out = np.arange(t0, t1 + np.timedelta64(1, 's'),
+                      np.timedelta64(int(dt), 's'))
+    return t_out, int(tstep)
+
+
+def meld_scenarios(scenarios, fname_wrf, fname_kettle, fname_crop_pct,
+                   fname_griddesc, gdnam='ARCNAGRID', chunk_tsteps=64,
+                   zlib=True):
+    """calculate melded Whelan-Kettle Fsoil for many scenarios in one
+    pass over the input files
+
+    ARGS:
+    scenarios (list): MeldScenario objects
+    fname_wrf (string): I/O API file containing WRF TSOIL (K) and
+       SMOIS (fraction)
+    fname_kettle (string): I/O API file containing the Kettle et al
+       (2002) soil COS flux (variable cos, mol m-2 s-1)
+    fname_crop_pct (string): I/O API file containing the Ramankutty
+       et al (2008) cropland fraction (variable crop_pct)
+    fname_griddesc (string): GRIDDESC file describing the grid
+    gdnam (string): grid name in the GRIDDESC file
+    chunk_tsteps (int): number of output time steps computed at once
+    zlib (bool): if True (default) compress the output files
+    """
+    grid = ioapi_tools.parse_griddesc(fname_griddesc, gdnam)
+    nc_wrf = netCDF4.Dataset(fname_wrf, 'r')
+    nc_kettle = netCDF4.Dataset(fname_kettle, 'r')
+    writers = []
+    try:
+        for nc in (nc_wrf, nc_kettle):
+            nc.set_auto_mask(False)
+        nc_pct = netCDF4.Dataset(fname_crop_pct, 'r')
+        pct = np.asarray(nc_pct.variables['crop_pct'][0, 0, ...],
+                         dtype='f8')
+        nc_pct.close()
+
+        t_out, tstep = melded_times(nc_wrf, nc_kettle)
+        t_w = ioapi_tools.get_tflag_datetimes(nc_wrf)
+        t_k = ioapi_tools.get_tflag_datetimes(nc_kettle)
+        sdate, stime = ioapi_tools.datetime_to_ioapi(
+            t_out[0].astype('datetime64[s]').tolist())
+
+        # per-scenario parameters, shaped to broadcast against
+        # [scenario, time, row, col]
+        def coef(key):
+            return np.array([s.whelan_coefs[key] for s in scenarios])[
+                :, np.newaxis, np.newaxis, np.newaxis]
+        a_vwc, a_T, a_0 = coef('vwc'), coef('Tsoil'), coef('intercept')
+        w = np.array([s.crop_weight(pct) for s in scenarios])[:, np.newaxis]
+        kettle_scale = np.array([s.kettle_scale for s in scenarios])[
+            :, np.newaxis, np.newaxis, np.newaxis]
+
+        var = [('cos', 'pmol COS m-2 s-1', 'hybrid Whelan-Kettle COS Fsoil')]
+        for s in scenarios:
+            writers.append(ioapi_tools.IOAPIWriter(
+                s.fname_out, grid, var, sdate=sdate, stime=stime,
+                tstep=tstep, fdesc=s.description(),
+                upnam='meld_scenarios', zlib=zlib))
+
+        for i0 in range(0, t_out.size, chunk_tsteps):
+            t_chunk = t_out[i0:i0 + chunk_tsteps]
+            rec_w = ioapi_tools.record_index(t_w, t_chunk)
+            rec_k = ioapi_tools.record_index(t_k, t_chunk)
+            vwc = ioapi_tools.read_records(nc_wrf.variables['SMOIS'], rec_w)
+            Tsoil = ioapi_tools.read_records(nc_wrf.variables['TSOIL'], rec_w)
+            fk = ioapi_tools.read_records(nc_kettle.variables['cos'], rec_k)
+            fk *= pmol_per_mol
+
+            # [scenario, time, row, col]
+            fsoil = a_vwc * vwc
+            fsoil += a_T * Tsoil
+            fsoil += a_0
+            fsoil *= w
+            fsoil += (1.0 - w) * (kettle_scale * fk)
+
+            for s_idx, wr in enumerate(writers):
+                wr.write_var('cos', fsoil[s_idx, :, np.newaxis, ...],
+                             t0=i0)
+    finally:
+        for wr in writers:
+            wr.close()
+        nc_wrf.close()
+        nc_kettle.close()
+
+
+if __name__ == "__main__":
+
+    stem_input_dir = data_paths.get_path('stem_input_dir')
+    fname_griddesc = data_paths.get_path('ioapi_griddesc')
+    fname_wrf = os.path.join(stem_input_dir,
+                             'meteo2d-124x124-18levs-2008-2009.nc')
+    fname_kettle = os.path.join(stem_input_dir,
+                                'surfem-124x124-kettle-soil-cos_2008_2009.nc')
+    fname_crop_pct = data_paths.get_path('cropland_pct')
+
+    fname_fmt = './whelan_kettle_hybrid_fsoil_124x124_{}.nc'
+    scenarios = [MeldScenario('base', fname_fmt.format('base')),
+                 MeldScenario('crop50', fname_fmt.format('crop50'),
+                              crop_weight=crop_weight_threshold(0.5)),
+                 MeldScenario('kettle_x0.5', fname_fmt.format('kettle_x0.5'),
+                              kettle_scale=0.5),
+                 MeldScenario('kettle_x2', fname_fmt.format('kettle_x2'),
+                              kettle_scale=2.0)]
+    meld_scenarios(scenarios, fname_wrf, fname_kettle, fname_crop_pct,
+                   fname_griddesc)
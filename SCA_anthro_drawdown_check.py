@@ -1,6 +1,7 @@
 import matplotlib
 matplotlib.use('AGG')
 
+import os.path
 import numpy as np
 import netCDF4
 import matplotlib.pyplot as plt
@@ -9,6 +10,8 @@ from stem_pytools import STEM_parsers as sp
 from stem_pytools import calc_drawdown
 from timutils import colormap_nlevs
 
+import data_paths
+
 # STEM 124x124 domain grid coordinates of NOAA sites
 #                   stem_x  stem_y  climatological boundaries  Anthropogenic, Zumkehr  Anthropogenic, Zumkehr, clim
 # sample_site_code
@@ -45,9 +48,12 @@ def plot_site_dd(dd, sitename, x, y):
             'median (10 Jul - 31 Aug): {:0.1f}'.format(
                 np.median(this_dd[240:].squeeze())))
     ax.set_title(sitename)
-    fig.savefig('/global/homes/t/twhilton/plots/{}_dd.pdf'.format(sitename))
+    fig.savefig(os.path.join(data_paths.get_path('plot_dir'),
+                             '{}_dd.pdf'.format(sitename)))
 
-cos_clim = sp.parse_STEM_var(nc_fname='/project/projectdirs/m2319/STEM_Runs/STEM_NAmerica_Climatological_Bounds/output/AQOUT.climatological_bnd.nc',
+cos_clim = sp.parse_STEM_var(nc_fname=os.path.join(
+                                 data_paths.get_path('clim_bounds_run_dir'),
+                                 'AQOUT.climatological_bnd.nc'),
                              t0=datetime(2008, 7, 1),
                              t1=datetime(2008, 8, 31, 23, 59, 59),
                              varname='CO2_TRACER1')
@@ -16,6 +16,7 @@ from stem_pytools import na_map
 from stem_pytools.domain import STEM_Domain
 
 import map_grid
+import data_paths
 
 # I put the Whelan-Kettle hybrid soil fluxes through STEM in pmol m-2
 # s-1 when it was expecting mol m-2 s-1.  So the AQOUT concentrations
@@ -155,7 +156,7 @@ def get_COS_concentration(run_key):
     raw_data = aqc.data[0]
     # aqc.sum()
     # aqc.calc_stats()
-    # aqc.stats_to_netcdf(os.path.join(os.getenv('SCRATCH'),
+    # aqc.stats_to_netcdf(os.path.join(data_paths.get_path('output_dir'),
     #                                  'STEM_run_daily.nc'))
 
     print('calculating drawdown')
@@ -242,8 +243,8 @@ def draw_anthro_maps():
                          panel_lab='d')
 
     maps_anthro.fig.tight_layout()
-    maps_anthro.save(fname=os.path.join(os.getenv('HOME'),
-                                        'plots', 'map_anthro.pdf'))
+    maps_anthro.save(fname=os.path.join(data_paths.get_path('plot_dir'),
+                                        'map_anthro.pdf'))
 
 
 def draw_soil_maps():
@@ -317,8 +318,8 @@ def draw_soil_maps():
                        extend='both',
                        panel_lab='d')
 
-    maps_soil.save(fname=os.path.join(os.getenv('HOME'),
-                                      'plots', 'map_soil.pdf'))
+    maps_soil.save(fname=os.path.join(data_paths.get_path('plot_dir'),
+                                      'map_soil.pdf'))
 
 
 if __name__ == "__main__":
@@ -348,8 +349,8 @@ if __name__ == "__main__":
 #                'climatological boundaries'),
 #         cmap=cmap,
 #         norm=norm)
-#     plt.gcf().savefig(os.path.join(os.getenv('HOME'),
-#                                    'plots', 'dd_map_clim_bounds.png'))
+#     plt.gcf().savefig(os.path.join(data_paths.get_path('plot_dir'),
+#                                    'dd_map_clim_bounds.png'))
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
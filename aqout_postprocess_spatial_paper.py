@@ -4,17 +4,26 @@ specific to the spatial paper).
 """
 
 import numpy as np
+import netCDF4
 from stem_pytools import aqout_postprocess as aqpp
 from stem_pytools import noaa_ocs
 from stem_pytools import domain as domain_tools
 from timutils import std_error
+import bootstrap_ci
+import instrument
+
+
+def _key(aqc, *args, **kwargs):
+    """detail of the instrumentation records of a container's methods"""
+    return aqc.key
 
 
 class AqoutContainerSpatialPaper(aqpp.aqout_container):
     """Derived class implements July-August-specific functionality
 
     This functionality is specifically pertinent to the spatial paper;
-    it populates fields dd_JA_midday, dd_se, dd_se_neff, dd_neff
+    it populates fields dd_JA_midday, dd_se, dd_se_neff, dd_neff,
+    dd_se_boot, dd_boot_ci_lo, dd_boot_ci_hi
 
     dd_JA_midday (numpy array): dimensions [time, x, y]; contains
        July-August mean COS vertical drawdown in each STEM horizontal
@@ -27,6 +36,14 @@ class AqoutContainerSpatialPaper(aqpp.aqout_container):
     dd_neff: (numpy array): dimensions [time, x, y]; "effective sample
        size" adjusted for autocorrelation within the STEM [COS].  The
        number of effectively independent [COS] data points from STEM.
+    dd_se_boot: (numpy array): dimensions [x, y]; July-August mean COS
+       drawdown standard error from a block bootstrap of the daily
+       drawdowns (no AR(1) assumption)
+    dd_boot_ci_lo, dd_boot_ci_hi: (numpy arrays): dimensions [x, y];
+       bootstrap percentile confidence interval for the July-August
+       mean COS drawdown
+    site_vals (pandas.DataFrame): drawdown statistics at the NOAA
+       observation sites; see extract_noaa_sites and calc_site_vals_ci
     """
     def parse(self, const_bounds=4.5e-10, *args, **kwargs):
         """Parse aqout data by calling parent class parse method.  Then apply:
@@ -41,7 +58,8 @@ class AqoutContainerSpatialPaper(aqpp.aqout_container):
            constant boundaries STEM runs
         """
         # call the parent class parse method
-        super(AqoutContainerSpatialPaper, self).parse(*args, **kwargs)
+        with instrument.stage('parse', detail=self.key):
+            super(AqoutContainerSpatialPaper, self).parse(*args, **kwargs)
 
         # clim_idx = None
         # for i, this_key in enumerate(self.aq_keys):
@@ -60,6 +78,16 @@ class AqoutContainerSpatialPaper(aqpp.aqout_container):
         #     del(self.aq_keys[clim_idx])
 
 
+    @instrument.timed('sum', detail=_key)
+    def sum(self, *args, **kwargs):
+        return super(AqoutContainerSpatialPaper, self).sum(*args, **kwargs)
+
+    @instrument.timed('calc_stats', detail=_key)
+    def calc_stats(self, *args, **kwargs):
+        return super(AqoutContainerSpatialPaper, self).calc_stats(
+            *args, **kwargs)
+
+    @instrument.timed('midday_drawdown', detail=_key)
     def calc_JA_midday_drawdown(self):
         """calculates and populates fields dd_JA_midday (see
         AqoutContainerSpatialPaper docstring)
@@ -72,9 +100,25 @@ class AqoutContainerSpatialPaper(aqpp.aqout_container):
         self.dd_JA_midday = self.calc_drawdown().squeeze()
         self.dd_JA_midday_mean = self.dd_JA_midday.mean(axis=0)
 
-    def calc_JA_midday_drawdown_stderr(self):
-        """calculates and populates fields, dd_se, dd_se_neff, dd_neff (see
+    @instrument.timed('stderr', detail=_key)
+    def calc_JA_midday_drawdown_stderr(self, n_boot=0, block_length=7,
+                                       bootstrap='moving', n_procs=1,
+                                       alpha=0.05):
+        """calculates and populates fields, dd_se, dd_se_neff, dd_neff,
+        dd_se_boot, dd_boot_ci_lo, dd_boot_ci_hi (see
         AqoutContainerSpatialPaper docstring)
+
+        ARGS:
+        n_boot (int): number of bootstrap resamples for dd_se_boot and
+           the bootstrap confidence intervals (e.g. 1000).  If 0
+           (default) they are not calculated; the bootstrap resamples
+           the full [t, x, y] drawdown field and is expensive.
+        block_length (int): bootstrap (mean) block length, days
+        bootstrap (string): 'moving' (moving block bootstrap) or
+           'stationary' (stationary bootstrap)
+        n_procs (int): number of processes to use for the bootstrap
+        alpha (float): the bootstrap confidence intervals have
+           coverage 1 - alpha
         """
 
         if self.dd_JA_midday is None:
@@ -86,7 +130,15 @@ class AqoutContainerSpatialPaper(aqpp.aqout_container):
         self.dd_se = se.std_err
         self.dd_se_neff = se.std_err_neff
         self.dd_neff = se.neff
+        if n_boot > 0:
+            (self.dd_se_boot,
+             self.dd_boot_ci_lo,
+             self.dd_boot_ci_hi) = bootstrap_ci.block_bootstrap_se(
+                self.dd_JA_midday, n_boot=n_boot,
+                block_length=block_length, method=bootstrap,
+                n_procs=n_procs, alpha=alpha)
 
+    @instrument.timed('site_extraction', detail=_key)
     def extract_noaa_sites(self, noaa_dir):
         """extract drawdown, standard error for each NOAA observation site
 
@@ -118,5 +170,144 @@ class AqoutContainerSpatialPaper(aqpp.aqout_container):
                                         site_vals.stem_y]
         site_vals['dd_se_neff'] = self.dd_se_neff[site_vals.stem_x,
                                                   site_vals.stem_y]
+        if getattr(self, 'dd_se_boot', None) is not None:
+            site_vals['dd_se_boot'] = self.dd_se_boot[site_vals.stem_x,
+                                                      site_vals.stem_y]
         self.site_vals = site_vals
         site_vals.insert(0, 'model', self.key)
+
+    def site_dd_series(self):
+        """return the daily midday drawdown time series in the STEM
+        cells containing the NOAA sites in self.site_vals
+
+        RETURNS:
+        numpy.ndarray of shape [n_sites, n_days]; masked days are NaN
+        """
+        dd = np.ma.filled(np.ma.asarray(self.dd_JA_midday, dtype=float),
+                          np.nan)
+        return dd[:, self.site_vals.stem_x.values,
+                  self.site_vals.stem_y.values].T
+
+    def calc_site_vals_ci(self, **kwargs):
+        """add bootstrap drawdown confidence intervals to
+        self.site_vals; see add_site_vals_ci
+        """
+        add_site_vals_ci([self], **kwargs)
+
+
+@instrument.timed('site_vals_ci')
+def add_site_vals_ci(containers, n_boot=5000, alpha=0.05, method='bca',
+                     block_length=7, seed=None):
+    """bootstrap drawdown confidence intervals at every NOAA site for
+    several STEM runs at once
+
+    The daily midday drawdown series of every site x model are
+    resampled in a single batch using a moving-block bootstrap (the
+    daily STEM drawdowns are autocorrelated).  Populates columns
+    dd_ci_lo and dd_ci_hi of each container's site_vals.
+
+    ARGS:
+    containers (list): AqoutContainerSpatialPaper objects on which
+       extract_noaa_sites has been called
+    n_boot (int): number of bootstrap resamples
+    alpha (float): the intervals have coverage 1 - alpha
+    method (string): 'percentile', 'basic' or 'bca'
+    block_length (int): bootstrap block length (days)
+    seed (int): seed for the random number generator
+    """
+    series = [c.site_dd_series() for c in containers]
+    est, ci_lo, ci_hi, boot = bootstrap_ci.bootstrap_mean_ci(
+        [row for s in series for row in s],
+        n_boot=n_boot, alpha=alpha, method=method,
+        block_length=block_length, seed=seed)
+    i0 = 0
+    for c, s in zip(containers, series):
+        c.site_vals['dd_ci_lo'] = ci_lo[i0:i0 + s.shape[0]]
+        c.site_vals['dd_ci_hi'] = ci_hi[i0:i0 + s.shape[0]]
+        i0 += s.shape[0]
+
+
+# (attribute, long_name, units) of the gridded statistics written by
+# write_drawdown_stats_netcdf
+DRAWDOWN_STATS_VARS = [
+    ('dd_JA_midday_mean', 'July-August mean midday COS drawdown', 'ppt'),
+    ('dd_se', 'July-August mean COS drawdown standard error', 'ppt'),
+    ('dd_se_neff', 'July-August mean COS drawdown standard error, '
+     'effective sample size adjusted', 'ppt'),
+    ('dd_neff', 'effective sample size of daily COS drawdown', '1'),
+    ('dd_se_boot', 'July-August mean COS drawdown block bootstrap '
+     'standard error', 'ppt'),
+    ('dd_boot_ci_lo', 'July-August mean COS drawdown bootstrap '
+     'confidence interval lower bound', 'ppt'),
+    ('dd_boot_ci_hi', 'July-August mean COS drawdown bootstrap '
+     'confidence interval upper bound', 'ppt')]
+
+
+def write_drawdown_stats_netcdf(containers, fname, zlib=True, complevel=4):
+    """write gridded drawdown statistics for many STEM runs to a single
+    netCDF file with a model dimension.
+
+    Each container is written as soon as it is received, so containers
+    may be a generator that parses and processes one STEM run at a
+    time.  Statistics a container has not calculated are left as the
+    fill value.
+
+    ARGS:
+    containers (iterable): AqoutContainerSpatialPaper objects on which
+       calc_JA_midday_drawdown_stderr has been called
+    fname (string): full path of the netCDF file to create
+    zlib (bool): if True (default) compress the variables
+    complevel (int): zlib compression level
+    """
+    with instrument.stage('netcdf_write', detail=fname):
+        nc = None
+        try:
+            for i, aqc in enumerate(containers):
+                if nc is None:
+                    nx, ny = np.shape(aqc.dd_JA_midday_mean)
+                    nc = netCDF4.Dataset(fname, 'w', format='NETCDF4')
+                    nc.createDimension('model', None)
+                    nc.createDimension('x', nx)
+                    nc.createDimension('y', ny)
+                    nc.createVariable('model', str, ('model',))
+                    for name, long_name, units in DRAWDOWN_STATS_VARS:
+                        v = nc.createVariable(name, 'f4', ('model', 'x', 'y'),
+                                              zlib=zlib, complevel=complevel,
+                                              chunksizes=(1, nx, ny),
+                                              fill_value=np.float32(np.nan))
+                        v.long_name = long_name
+                        v.units = units
+                nc.variables['model'][i] = aqc.key
+                for name, long_name, units in DRAWDOWN_STATS_VARS:
+                    val = getattr(aqc, name, None)
+                    if val is not None:
+                        nc.variables[name][i, ...] = np.ma.filled(
+                            np.ma.asarray(val, dtype='f4'), np.nan)
+        finally:
+            if nc is not None:
+                nc.close()
+
+
+def read_drawdown_stats_netcdf(fname, model=None):
+    """read gridded drawdown statistics written by
+    write_drawdown_stats_netcdf
+
+    ARGS:
+    fname (string): full path of the netCDF file
+    model (string): key of a single STEM run to read.  If None
+       (default) read all runs.
+
+    RETURNS:
+    dict with key 'model' (list of run keys) and one [model, x, y]
+       (or [x, y] if model is specified) numpy array per statistic
+    """
+    nc = netCDF4.Dataset(fname, 'r')
+    try:
+        models = list(nc.variables['model'][:])
+        idx = slice(None) if model is None else models.index(model)
+        stats = dict((name, nc.variables[name][idx, ...])
+                     for name, long_name, units in DRAWDOWN_STATS_VARS)
+    finally:
+        nc.close()
+    stats['model'] = models if model is None else model
+    return stats
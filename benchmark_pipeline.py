@@ -0,0 +1,315 @@
+"""Benchmark the stages of the spatial paper pipeline on synthetic data.
+
+This script runs the stages of error_bar_framework.py and
+sib_check_DD.py on one set of synthetic STEM AQOUT, GPP/fCOS and NOAA
+files (see synthetic_data.py; by default the real dimensions: hourly,
+22 x 124 x 124, 62 days) and records for each stage, as an instrument
+stage,
+
+    - wall clock and CPU time,
+    - peak resident memory during the stage,
+    - bytes read: all bytes returned by read calls (read_mb, including
+      reads served from the page cache) and bytes fetched from storage
+      (disk_read_mb),
+
+and optionally a cProfile profile.  The stages are
+
+    parse             AqoutContainerSpatialPaper.parse
+    sum               AqoutContainerSpatialPaper.sum
+    midday_drawdown   calc_JA_midday_drawdown
+    stderr            calc_JA_midday_drawdown_stderr
+    site_extraction   extract_noaa_sites, add_site_vals_ci
+    flux_integration  time_integrator.integrate_ioapi of GPP and fCOS
+    boundaries        climatological lateral boundaries from the NOAA
+                      files, written with ioapi_tools
+    map               map_grid.draw_map of the mean drawdown
+
+The instrumented pipeline code records its own stages (the I/O API
+write of the boundaries stage, ...) nested in these.  All records are
+written to JSON and CSV.  Given the JSON of an earlier
+run (--baseline), stages whose wall time grew by more than --tolerance
+are reported and the script exits with status 1, so the benchmark can
+catch regressions.  See instrument.py for how peak memory and bytes
+read are measured.
+
+The inputs are a synthetic_data fixture: the AQOUT files of one
+combination of STEM runs (--combo; by default one plant, one soil and
+one anthropogenic run, as in error_bar_framework.py) are looked up in
+the fixture's run registry through local_data_paths, and the
+data_paths registry is pointed at the fixture's inputs (see
+synthetic_data.use_fixture).
+"""
+
+import os
+import os.path
+import sys
+import json
+import time
+import socket
+import argparse
+import traceback
+import importlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import synthetic_data
+import local_data_paths
+import instrument
+
+DEFAULT_COMBO = ('casa_gfed_161', 'Fsoil_Kettle', 'Anthro_Kettle')
+STAGES = ('parse', 'sum', 'midday_drawdown', 'stderr', 'site_extraction',
+          'flux_integration', 'boundaries', 'map')
+
+
+class PipelineBenchmark(object):
+    """run and time the spatial paper pipeline stages on a set of
+    synthetic inputs
+
+    ATTRIBUTES:
+    runs (OrderedDict): run key -> local_data_paths.STEMRun of the runs
+       whose AQOUT files are summed
+    paths (dict): the fixture, as returned by
+       synthetic_data.write_fixture
+    t0, t1 (datetime.datetime): the period parsed from the AQOUT files
+    n_boot (int): bootstrap resamples for the standard errors and site
+       confidence intervals
+    out_dir (string): directory for the output files (boundary file,
+       map, profiles)
+    profile (bool): if True, profile every stage with cProfile,
+       writing the profiles to out_dir
+    results (list): the instrument records of the stages run, and of
+       the stages nested in them
+    """
+
+    def __init__(self, runs, paths, t0, t1, n_boot=1000, out_dir='.',
+                 profile=False):
+        self.runs = runs
+        self.paths = paths
+        self.t0 = t0
+        self.t1 = t1
+        self.n_boot = n_boot
+        self.out_dir = out_dir
+        self.profile = profile
+        self.results = []
+        self.aqc = None
+        self.flux_totals = None
+
+    def _import(self, name):
+        return importlib.import_module(name)
+
+    def stage_parse(self):
+        aqpp_sp = self._import('aqout_postprocess_spatial_paper')
+        keys = list(self.runs.keys())
+        self.aqc = aqpp_sp.AqoutContainerSpatialPaper(
+            aqout_paths=[r.aqout_path for r in self.runs.values()],
+            aq_keys=keys, key='-'.join(keys))
+        self.aqc.parse(t0=self.t0, t1=self.t1, verbose=False)
+
+    def stage_sum(self):
+        self.aqc.sum()
+
+    def stage_midday_drawdown(self):
+        self.aqc.calc_JA_midday_drawdown()
+
+    def stage_stderr(self):
+        self.aqc.calc_JA_midday_drawdown_stderr(n_boot=self.n_boot)
+
+    def stage_site_extraction(self):
+        aqpp_sp = self._import('aqout_postprocess_spatial_paper')
+        self.aqc.extract_noaa_sites(self.paths['noaa_dir'])
+        aqpp_sp.add_site_vals_ci([self.aqc], n_boot=self.n_boot, seed=0)
+
+    def stage_flux_integration(self):
+        time_integrator = self._import('time_integrator')
+        window = time_integrator.TimeWindow('benchmark', self.t0, self.t1)
+        run = [r for r in self.runs.values() if r.gpp_path is not None][0]
+        self.flux_totals = dict(
+            (varname, time_integrator.integrate_ioapi(
+                fname, varname, [window]).totals()['benchmark'])
+            for fname, varname in ((run.gpp_path, 'GPP'),
+                                   (run.fcos_path, 'cos')))
+
+    def stage_boundaries(self):
+        cbv = self._import('climatological_bounds_vertprofile')
+        sites = [s for s, n in
+                 cbv.ClimatologicalLateralBoundNAmerica.perimeter_sites]
+        sites_dict = cbv.create_sites_dict(sorted(set(sites)))
+        lat_bnd = cbv.ClimatologicalLateralBoundNAmerica(sites_dict)
+        lat_bnd.write_bounds_ioapi_file(
+            fname_bdy=os.path.join(self.out_dir, 'benchmark_bdy.nc'))
+
+    def stage_map(self):
+        map_grid = self._import('map_grid')
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import Normalize
+        dd = np.ma.filled(np.ma.asarray(self.aqc.dd_JA_midday_mean,
+                                        dtype=float), np.nan)
+        vmin, vmax = np.nanmin(dd), np.nanmax(dd)
+        fig, ax = plt.subplots()
+        map_grid.draw_map('benchmark drawdown', ax, dd, vmin, vmax,
+                          norm=Normalize(vmin, vmax))
+        fig.savefig(os.path.join(self.out_dir, 'benchmark_map.png'))
+        plt.close(fig)
+
+    # stages that need the results of earlier stages
+    requires = {'sum': 'parse',
+                'midday_drawdown': 'sum',
+                'stderr': 'midday_drawdown',
+                'site_extraction': 'stderr',
+                'map': 'midday_drawdown'}
+
+    def run(self, stages=STAGES):
+        """run stages in order, recording their measurements in
+        self.results
+
+        The stages are measured by a new instrument recorder for the
+        process.  An exception raised in a stage is printed and
+        recorded (status 'failed') so that the remaining stages still
+        run; a stage whose prerequisite failed or was not run is
+        recorded as 'skipped'.
+
+        RETURNS:
+        self.results
+        """
+        rec = instrument.configure(
+            profile='cprofile' if self.profile else None,
+            profile_dir=self.out_dir)
+        status = {}
+        for name in stages:
+            req = self.requires.get(name)
+            if req is not None and status.get(req) != 'ok':
+                # dependencies run in order: sum -> parse, etc.
+                result = instrument.empty_record(name)
+                result.update(status='skipped',
+                              note='requires {}'.format(req))
+                rec.records.append(result)
+            else:
+                print('running {}'.format(name))
+                try:
+                    with rec.stage(name) as st:
+                        getattr(self, 'stage_' + name)()
+                except Exception:
+                    traceback.print_exc()
+                result = st.record
+            status[name] = result['status']
+        self.results = rec.records
+        return self.results
+
+
+def compare_to_baseline(results, fname_baseline, tolerance=0.2):
+    """compare the wall times of the benchmark stages (the top-level
+    records) to those of an earlier run
+
+    ARGS:
+    results (list): stage measurements (PipelineBenchmark.results)
+    fname_baseline (string): JSON file written by write_results
+    tolerance (float): allowed fractional increase of the wall time
+
+    RETURNS:
+    list of (stage, baseline wall_s, wall_s) of the stages that got
+       slower by more than tolerance
+    """
+    with open(fname_baseline) as f:
+        baseline = dict((r['stage'], r) for r in json.load(f)['stages']
+                        if r.get('parent') is None)
+    slower = []
+    for r in results:
+        if r['parent'] is not None:
+            continue
+        b = baseline.get(r['stage'])
+        if (b is None or r['status'] != 'ok' or b['status'] != 'ok'):
+            continue
+        if r['wall_s'] > b['wall_s'] * (1.0 + tolerance):
+            slower.append((r['stage'], b['wall_s'], r['wall_s']))
+    return slower
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='benchmark the spatial paper pipeline on synthetic '
+        'data')
+    parser.add_argument('data_dir',
+                        help='directory of the synthetic inputs; written '
+                        'if it does not contain them yet')
+    parser.add_argument('--out_dir', default='.',
+                        help='directory for the results (default .)')
+    parser.add_argument('--ndays', type=int, default=62)
+    parser.add_argument('--nrows', type=int, default=124)
+    parser.add_argument('--ncols', type=int, default=124)
+    parser.add_argument('--nlays', type=int, default=22)
+    parser.add_argument('--combo', default=','.join(DEFAULT_COMBO),
+                        help='comma-separated keys of the runs whose '
+                        'AQOUT files are summed (default {})'.format(
+                            ','.join(DEFAULT_COMBO)))
+    parser.add_argument('--n_boot', type=int, default=1000)
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help='comma-separated stages to run (default all)')
+    parser.add_argument('--profile', action='store_true',
+                        help='profile each stage with cProfile')
+    parser.add_argument('--regenerate', action='store_true',
+                        help='rewrite the synthetic inputs')
+    parser.add_argument('--baseline',
+                        help='JSON results of an earlier run to compare '
+                        'against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed fractional wall time increase '
+                        'over the baseline (default 0.2)')
+    args = parser.parse_args()
+
+    t0 = datetime(2008, 7, 1)
+    t1 = t0 + timedelta(days=args.ndays)
+    combo = args.combo.split(',')
+    if not os.path.isdir(args.out_dir):
+        os.makedirs(args.out_dir)
+    params, paths = synthetic_data.read_fixture(args.data_dir)
+    if (args.regenerate or params is None or
+            [params[k] for k in ('nrows', 'ncols', 'nlays', 'ndays')] !=
+            [args.nrows, args.ncols, args.nlays, args.ndays] or
+            params['t0'] != t0.isoformat() or
+            not set(combo) <= set(params['runs'])):
+        print('writing synthetic inputs to {}'.format(args.data_dir))
+        t_gen = time.time()
+        paths = synthetic_data.write_fixture(
+            args.data_dir, grid=synthetic_data.make_grid(args.nrows,
+                                                         args.ncols),
+            t0=t0, ndays=args.ndays, nlays=args.nlays, runs=combo)
+        print('done ({:0.1f} s)'.format(time.time() - t_gen))
+        params, paths = synthetic_data.read_fixture(args.data_dir)
+    synthetic_data.use_fixture(paths)
+    # the ClimatologicalBounds modules are not in the repository root
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'ClimatologicalBounds'))
+
+    all_runs = local_data_paths.get_runs()
+    runs = OrderedDict((k, all_runs[k]) for k in combo)
+    bench = PipelineBenchmark(runs, paths, t0, t1, n_boot=args.n_boot,
+                              out_dir=args.out_dir, profile=args.profile)
+    results = bench.run([s for s in args.stages.split(',') if s])
+    instrument.print_records(results)
+
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    fname_json = os.path.join(args.out_dir,
+                              'benchmark_{}.json'.format(stamp))
+    metadata = OrderedDict([('date', datetime.now().isoformat()),
+                            ('host', socket.gethostname()),
+                            ('python', sys.version.split()[0]),
+                            ('numpy', np.__version__),
+                            ('data_dir', os.path.abspath(args.data_dir)),
+                            ('params', params),
+                            ('combo', combo),
+                            ('n_boot', args.n_boot)])
+    instrument.write_records(results, fname_json, metadata)
+    instrument.write_records(results,
+                             os.path.splitext(fname_json)[0] + '.csv')
+    print('wrote {}'.format(fname_json))
+
+    if args.baseline is not None:
+        slower = compare_to_baseline(results, args.baseline,
+                                     args.tolerance)
+        for stage, t_base, t_now in slower:
+            print('REGRESSION {}: {:0.2f} s -> {:0.2f} s'.format(
+                stage, t_base, t_now))
+        if slower:
+            sys.exit(1)
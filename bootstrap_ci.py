@@ -0,0 +1,324 @@
+"""Bootstrap confidence intervals for means of many groups at once.
+
+Replaces the R boot() calls in gradient_plot_error_bars.R.  The
+resamples for every group are drawn as a single index matrix of shape
+[n_boot, n], converted to a matrix of resample counts, and applied to
+all groups that have n values with one matrix product, so every site
+x model combination is bootstrapped in one vectorized batch.  Groups
+of different length (ragged groups, e.g. sites with different numbers
+of flight days) are passed NaN-padded; one count matrix is built per
+distinct group length.
+
+Missing values (NaN) inside a group keep their position, so blocks of
+a moving-block resample stay blocks of adjacent time steps; each
+resample's mean is taken over the valid values it drew.
+
+Moving-block resampling is available for autocorrelated series
+(e.g. daily STEM drawdown time series).  Percentile, basic and BCa
+intervals are supported.
+
+block_bootstrap_se estimates the standard error of the time mean of
+every cell of a [t, x, y] field (moving-block or stationary
+bootstrap) with the same count-matrix product, so all grid cells are
+resampled together with no per-cell loop.
+"""
+
+import multiprocessing
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+
+def resample_indices(n, n_boot, rng, block_length=1):
+    """draw bootstrap resample indices
+
+    ARGS:
+    n (int): number of values in the series to resample
+    n_boot (int): number of bootstrap resamples
+    rng (numpy.random.RandomState): random number generator
+    block_length (int): length of the moving blocks.  The default, 1,
+       is the ordinary iid bootstrap.
+
+    RETURNS:
+    numpy.ndarray of shape [n_boot, n] of indices into the series
+    """
+    block_length = max(1, min(int(block_length), n))
+    if block_length == 1:
+        return rng.randint(0, n, size=(n_boot, n))
+    n_blocks = -(-n // block_length)
+    starts = rng.randint(0, n - block_length + 1, size=(n_boot, n_blocks))
+    idx = starts[:, :, np.newaxis] + np.arange(block_length)
+    return idx.reshape(n_boot, -1)[:, :n]
+
+
+def stationary_resample_indices(n, n_boot, rng, mean_block_length=7):
+    """draw stationary bootstrap (Politis and Romano, 1994) resample
+    indices: blocks of geometrically distributed length with mean
+    mean_block_length, wrapping around the end of the series
+
+    ARGS:
+    n (int): number of values in the series to resample
+    n_boot (int): number of bootstrap resamples
+    rng (numpy.random.RandomState): random number generator
+    mean_block_length (float): expected block length
+
+    RETURNS:
+    numpy.ndarray of shape [n_boot, n] of indices into the series
+    """
+    new_block = rng.rand(n_boot, n) < (1.0 / mean_block_length)
+    new_block[:, 0] = True
+    block_start = rng.randint(0, n, size=(n_boot, n))
+    pos = np.arange(n)
+    # position of the most recent block start at each step
+    last = np.maximum.accumulate(np.where(new_block, pos, 0), axis=1)
+    rows = np.arange(n_boot)[:, np.newaxis]
+    return (block_start[rows, last] + (pos - last)) % n
+
+
+def resample_counts(idx, n):
+    """convert a [n_boot, n] index matrix to a [n_boot, n] matrix
+    counting how many times each value appears in each resample"""
+    n_boot = idx.shape[0]
+    flat = (idx + n * np.arange(n_boot)[:, np.newaxis]).ravel()
+    return np.bincount(flat, minlength=n_boot * n).reshape(n_boot, n)
+
+
+def pad_groups(groups):
+    """pack a list of 1-D arrays into a NaN-padded 2-D array
+
+    NaNs within each group are kept in place (they mark missing time
+    steps of a series); padding is only added at the end of rows.
+
+    ARGS:
+    groups (list): list of array-like
+
+    RETURNS:
+    numpy.ndarray of shape [len(groups), max group length]
+    """
+    groups = [np.asarray(g, dtype=float).ravel() for g in groups]
+    n_max = max([g.size for g in groups] + [1])
+    data = np.full((len(groups), n_max), np.nan)
+    for i, g in enumerate(groups):
+        data[i, :g.size] = g
+    return data
+
+
+def series_lengths(data):
+    """length of each row of a NaN-padded 2-D array: one past its last
+    finite value (0 for rows with none)"""
+    finite = np.isfinite(data)
+    last = data.shape[1] - np.argmax(finite[:, ::-1], axis=1)
+    return np.where(finite.any(axis=1), last, 0)
+
+
+def _row_quantiles(sorted_vals, q):
+    """linearly interpolated quantiles, one probability per row, of a
+    [n_groups, n_boot] array already sorted along axis 1 (NaNs, which
+    sort last, are ignored)"""
+    n_fin = np.isfinite(sorted_vals).sum(axis=1)
+    pos = np.clip(q, 0.0, 1.0) * np.maximum(n_fin - 1, 0)
+    lo = np.floor(pos).astype(int)
+    hi = np.minimum(lo + 1, np.maximum(n_fin - 1, 0))
+    rows = np.arange(sorted_vals.shape[0])
+    frac = pos - lo
+    out = (sorted_vals[rows, lo] * (1.0 - frac) +
+           sorted_vals[rows, hi] * frac)
+    out[n_fin == 0] = np.nan
+    return out
+
+
+def _jackknife_acceleration(x):
+    """BCa acceleration constant of the mean from the delete-one
+    jackknife over the valid (finite) values of each row of x"""
+    valid = np.isfinite(x)
+    m = valid.sum(axis=1)[:, np.newaxis].astype(float)
+    total = np.where(valid, x, 0.0).sum(axis=1)[:, np.newaxis]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        theta_jack = np.where(valid, (total - x) / (m - 1.0), 0.0)
+        d = np.where(valid, theta_jack.sum(axis=1)[:, np.newaxis] / m -
+                     theta_jack, 0.0)
+        a = (d ** 3).sum(axis=1) / (6.0 * ((d ** 2).sum(axis=1)) ** 1.5)
+    return np.where(np.isfinite(a), a, 0.0)
+
+
+def bootstrap_mean_ci(data, n_boot=5000, alpha=0.05, method='bca',
+                      block_length=1, seed=None):
+    """bootstrap confidence intervals for the mean of each row of data
+
+    ARGS:
+    data (array-like): [n_groups, n] array, or a list of 1-D arrays of
+       differing lengths.  Rows may be NaN-padded.  NaNs are missing
+       values: they keep their place in the series for the block
+       resampling and are left out of every mean.
+    n_boot (int): number of bootstrap resamples
+    alpha (float): the intervals have coverage 1 - alpha
+    method (string): 'percentile', 'basic' or 'bca'
+    block_length (int): moving-block length for autocorrelated data.
+       The default, 1, is the ordinary iid bootstrap.  The BCa
+       acceleration is always estimated by the delete-one jackknife.
+    seed (int): seed for the random number generator
+
+    RETURNS:
+    est (numpy.ndarray): [n_groups] means
+    ci_lo (numpy.ndarray): [n_groups] lower interval bounds
+    ci_hi (numpy.ndarray): [n_groups] upper interval bounds
+    boot (numpy.ndarray): [n_groups, n_boot] bootstrap means
+    """
+    if method not in ('percentile', 'basic', 'bca'):
+        raise ValueError('unknown bootstrap CI method: {}'.format(method))
+    data = pad_groups(data)
+    rng = np.random.RandomState(seed)
+    valid = np.isfinite(data)
+    n_valid = valid.sum(axis=1)
+    lengths = series_lengths(data)
+    x0 = np.where(valid, data, 0.0)
+    w = valid.astype(float)
+    n_groups = data.shape[0]
+
+    est = np.full(n_groups, np.nan)
+    boot = np.full((n_groups, n_boot), np.nan)
+    accel = np.zeros(n_groups)
+    for n in np.unique(lengths[lengths > 0]):
+        rows = np.flatnonzero(lengths == n)
+        counts = resample_counts(
+            resample_indices(n, n_boot, rng, block_length), n).astype(float)
+        est[rows] = x0[rows, :n].sum(axis=1) / w[rows, :n].sum(axis=1)
+        # mean of the valid values drawn by each resample; NaN if a
+        # resample drew none
+        with np.errstate(invalid='ignore', divide='ignore'):
+            boot[rows] = (x0[rows, :n].dot(counts.T) /
+                          w[rows, :n].dot(counts.T))
+        if method == 'bca':
+            accel[rows] = _jackknife_acceleration(data[rows, :n])
+
+    boot.sort(axis=1)
+    q_lo = np.full(n_groups, alpha / 2.0)
+    q_hi = np.full(n_groups, 1.0 - alpha / 2.0)
+    if method == 'bca':
+        n_fin = np.isfinite(boot).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z0 = norm.ppf((boot < est[:, np.newaxis]).sum(axis=1) /
+                          n_fin.astype(float))
+        z0 = np.where(np.isfinite(z0), z0, 0.0)
+        for q in (q_lo, q_hi):
+            z = z0 + norm.ppf(q)
+            q[:] = norm.cdf(z0 + z / (1.0 - accel * z))
+    ci_lo = _row_quantiles(boot, q_lo)
+    ci_hi = _row_quantiles(boot, q_hi)
+    if method == 'basic':
+        ci_lo, ci_hi = 2.0 * est - ci_hi, 2.0 * est - ci_lo
+    empty = n_valid == 0
+    ci_lo[empty] = np.nan
+    ci_hi[empty] = np.nan
+    return est, ci_lo, ci_hi, boot
+
+
+def grouped_mean_ci(df, by, value_col, **kwargs):
+    """bootstrap confidence intervals for the mean of value_col within
+    each group of a data frame
+
+    ARGS:
+    df (pandas.DataFrame): the data
+    by (string or list): column(s) defining the groups
+    value_col (string): column to average
+    **kwargs: passed to bootstrap_mean_ci
+
+    RETURNS:
+    pandas.DataFrame indexed by the groups, with columns dd (group
+       mean), ci_lo, ci_hi and n
+    """
+    if isinstance(by, (list, tuple)) and len(by) == 1:
+        by = by[0]
+    groups = df.groupby(by)[value_col]
+    keys = []
+    vals = []
+    for k, v in groups:
+        keys.append(k)
+        vals.append(v.values)
+    est, ci_lo, ci_hi, boot = bootstrap_mean_ci(vals, **kwargs)
+    if isinstance(by, (list, tuple)):
+        index = pd.MultiIndex.from_tuples(keys, names=by)
+    else:
+        index = pd.Index(keys, name=by)
+    return pd.DataFrame({'dd': est,
+                         'ci_lo': ci_lo,
+                         'ci_hi': ci_hi,
+                         'n': [np.isfinite(v).sum() for v in vals]},
+                        index=index,
+                        columns=['dd', 'ci_lo', 'ci_hi', 'n'])
+
+
+def _tile_boot_se(args):
+    """standard error (and, if alpha is not None, percentile interval)
+    of the resampled means of one tile of cells; helper for
+    block_bootstrap_se (module-level so that it can be used with
+    multiprocessing)"""
+    counts, x, alpha = args
+    valid = np.isfinite(x)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = (counts.dot(np.where(valid, x, 0.0)) /
+                 counts.dot(valid.astype(float)))
+    se = np.nanstd(means, axis=0, ddof=1)
+    if alpha is None:
+        return se[np.newaxis]
+    ci = np.nanpercentile(means, [50.0 * alpha, 100.0 - 50.0 * alpha],
+                          axis=0)
+    return np.vstack((se, ci))
+
+
+def block_bootstrap_se(arr, n_boot=1000, block_length=7,
+                       method='moving', seed=None, tile_size=4096,
+                       n_procs=1, alpha=None):
+    """bootstrap standard error of the time mean of every cell of a
+    [t, ...] array
+
+    All cells share one set of resamples: the resample count matrix
+    ([n_boot, t]) multiplies the array viewed as [t, n_cells].  Masked
+    or NaN values are dropped from each resample's mean.
+
+    ARGS:
+    arr (array-like): array of shape [t, ...], e.g. [t, x, y] daily
+       drawdown.  May be a masked array.
+    n_boot (int): number of bootstrap resamples
+    block_length (float): block length ('moving') or mean block
+       length ('stationary'), in time steps
+    method (string): 'moving' or 'stationary'
+    seed (int): seed for the random number generator
+    tile_size (int): number of cells processed together; bounds the
+       [n_boot, tile_size] working array
+    n_procs (int): number of processes over which to distribute the
+       tiles.  The default, 1, uses no multiprocessing.
+    alpha (float): if not None, also return percentile intervals with
+       coverage 1 - alpha
+
+    RETURNS:
+    numpy.ndarray of shape arr.shape[1:] of standard errors.  If
+       alpha is not None, a tuple (se, ci_lo, ci_hi) of such arrays.
+    """
+    rng = np.random.RandomState(seed)
+    x = np.ma.filled(np.ma.asarray(arr, dtype=float), np.nan)
+    n = x.shape[0]
+    if method == 'moving':
+        idx = resample_indices(n, n_boot, rng, block_length)
+    elif method == 'stationary':
+        idx = stationary_resample_indices(n, n_boot, rng, block_length)
+    else:
+        raise ValueError('unknown block bootstrap method: {}'.format(method))
+    counts = resample_counts(idx, n).astype(float)
+
+    x = x.reshape(n, -1)
+    tiles = [(counts, x[:, i:i + tile_size], alpha)
+             for i in range(0, x.shape[1], tile_size)]
+    if n_procs > 1:
+        pool = multiprocessing.Pool(n_procs)
+        try:
+            se = pool.map(_tile_boot_se, tiles)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        se = [_tile_boot_se(t) for t in tiles]
+    se = np.concatenate(se, axis=1).reshape((-1,) + arr.shape[1:])
+    if alpha is None:
+        return se[0]
+    return se[0], se[1], se[2]
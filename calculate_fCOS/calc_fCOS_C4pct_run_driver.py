@@ -16,7 +16,7 @@ Timothy W. Hilton, UC Merced, 13 January 2015
 import os
 import os.path
 import sys
-import subprocess
+import shutil
 import re
 import netCDF4
 import matplotlib.pyplot as plt
@@ -30,6 +30,13 @@ from stem_pytools import na_map
 from stem_pytools import STEM_parsers as sp
 from timutils import midpt_norm
 
+# shared helper modules (fortran_build_cache, ...) live in the
+# repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+import fortran_build_cache
+import data_paths
+
 
 # ============================================================
 def fCOS_from_C4pct_diagnostics():
@@ -61,7 +68,7 @@ def draw_LRU_map():
     LRU = nc.variables['LRU'][...].squeeze()
     nc.close()
     stem_lon, stem_lat, topo = sp.parse_STEM_coordinates(
-        os.path.join(os.getenv('SARIKA_INPUT'), 'TOPO-124x124.nc'))
+        data_paths.get_path('topo'))
     fcos_norm = midpt_norm.MidpointNormalize(midpoint=1.61)
     lru_map = na_map.NAMapFigure(cb_axis=True, t_str='LRU from C4 veg pct')
     cm = lru_map.map.pcolor(stem_lon, stem_lat, LRU,
@@ -73,65 +80,85 @@ def draw_LRU_map():
     cbar.ax.set_title('LRU')
     lru_map.fig.savefig('LRU_from_c4pct.pdf')
 
-# parse arguments
-parser = argparse.ArgumentParser(description=(
-    ("script to calculate fCOS for all GPP products defined"
-     " in stem_pytools.ecampbell300_data_paths.")))
-parser.add_argument('--diagnostics',
-                    dest='run_diagnostics',
-                    action='store_true',
-                    help=('if set, some diagnostic plots are created'
-                          'after the calculations.'))
-args = parser.parse_args()
-
-#  compile the fortran code
-subprocess.call('make -f calc_fCOS_C4pct.mk clobber', shell=True)
-subprocess.call('make -f calc_fCOS_C4pct.mk', shell=True)
-
-fname_C4pct = os.path.join('/home', 'thilton', 'projects', 'COS (ecampbell3)',
-                           'C4_percentage', 'ISLSCP_C4_1DEG_932_regridded',
-                           'C4_pct_124x124.nc')
-# get the GPP I/O API file for the CASA m15 file
-runs = edp.get_C3C4runs()
-for this_run in runs.values():
-    fname_GPP = this_run.gpp_path
-    sys.stdout.write('\n\nGPP file: {}\n'.format(fname_GPP))
-    sys.stdout.write('C4 file: {}\n\n'.format(fname_C4pct))
-    sys.stdout.flush()
-
-    if os.path.exists(fname_GPP) and os.path.exists(fname_C4pct):
-        os.environ['GRIDDESC'] = os.path.join(os.environ['HOME'], 'Data',
-                                              'STEM', 'input', 'GRIDDESC.txt')
-        os.environ['GPP_INPUT'] = fname_GPP
-        os.environ['C4pct_INPUT'] = fname_C4pct
-        os.environ['RATIO_FILE'] = './COS_CO2_ratio_const_1.1.nc'
-        os.environ['LRU_FILE'] = './LRU_from_C4pct.nc'
-        os.environ['fCOS_FILE'] = (
-            './fCOS_{}_2008_124x124_LRUfromC4pct.nc'.format(
-                re.sub('[\ \-]', '', this_run.model)))
-        # run the fortran part
+
+if __name__ == "__main__":
+    # parse arguments
+    parser = argparse.ArgumentParser(description=(
+        ("script to calculate fCOS for all GPP products defined"
+         " in stem_pytools.ecampbell300_data_paths.")))
+    parser.add_argument('--diagnostics',
+                        dest='run_diagnostics',
+                        action='store_true',
+                        help=('if set, some diagnostic plots are created'
+                              'after the calculations.'))
+    parser.add_argument('--n_procs',
+                        dest='n_procs',
+                        type=int,
+                        default=4,
+                        help=('number of GPP models to calculate fCOS '
+                              'for at once'))
+    args = parser.parse_args()
+
+    #  compile the fortran code (only if the sources, compiler or I/O
+    #  API libraries changed since the last build)
+    here = os.path.dirname(os.path.abspath(__file__))
+    exe = fortran_build_cache.FortranBuild(
+        here, 'calc_fCOS_C4pct.mk', 'calc_fCOS_C4pct.x').build()
+
+    fname_C4pct = data_paths.get_path('c4pct')
+    fname_griddesc = data_paths.get_path('ioapi_griddesc')
+    # one fortran run per GPP model.  Each run gets its own working
+    # directory, so the relative RATIO_FILE, LRU_FILE and fCOS_FILE
+    # names below do not collide between concurrent runs.
+    fortran_runs = []
+    gpp_runs = {}
+    runs = edp.get_C3C4runs()
+    for this_run in runs.values():
+        fname_GPP = this_run.gpp_path
+        sys.stdout.write('GPP file: {}\n'.format(fname_GPP))
+        sys.stdout.flush()
+        if not (os.path.exists(fname_GPP) and os.path.exists(fname_C4pct)):
+            print('GPP file not found')
+            continue
+        model_str = re.sub('[\ \-]', '', this_run.model)
         if this_run.model.lower().find('casa') >= 0:
             t_step = 30000  # 3 hours expressed as HHMMSS
         else:
             t_step = 7320000  # 30.5 days expressed as HHMMSS
-        subprocess.call(
-            './calc_fCOS_C4pct.x {} {}'.format(
-                re.sub(' ', '\ ', this_run.model),
-                t_step),
-            shell=True)
-
-        # move the new fCOS file to its permanent location
-        newname = os.path.join(os.path.dirname(this_run.fcos_path),
-                               os.path.basename(os.environ['fCOS_FILE']))
-        sys.stdout.write('\n{} --> {}\n\n'.format(os.environ['fCOS_FILE'],
-                                                  newname))
+        fortran_runs.append(fortran_build_cache.FortranRun(
+            model_str,
+            args=(this_run.model, t_step),
+            env={'GRIDDESC': fname_griddesc,
+                 'GPP_INPUT': fname_GPP,
+                 'C4pct_INPUT': fname_C4pct,
+                 'RATIO_FILE': './COS_CO2_ratio_const_1.1.nc',
+                 'LRU_FILE': './LRU_from_C4pct.nc',
+                 'fCOS_FILE': (
+                     './fCOS_{}_2008_124x124_LRUfromC4pct.nc'.format(
+                         model_str))}))
+        gpp_runs[model_str] = this_run
+
+    fortran_build_cache.run_all(exe, fortran_runs,
+                                os.path.join(here, 'runs'),
+                                n_procs=args.n_procs)
+
+    # move the new fCOS files to their permanent locations
+    for fr in fortran_runs:
+        if not fr.ok():
+            continue
+        fname_fcos = fr.path(os.path.basename(fr.env['fCOS_FILE']))
+        newname = os.path.join(
+            os.path.dirname(gpp_runs[fr.name].fcos_path),
+            os.path.basename(fname_fcos))
+        sys.stdout.write('{} --> {}\n'.format(fname_fcos, newname))
         sys.stdout.flush()
-        os.rename(os.environ['fCOS_FILE'], newname)
-
-    else:
-        print('GPP file not found')
-
-if args.run_diagnostics:
-    print 'creating diagnostic plots'
-    draw_LRU_map()
-    # fCOS_from_C4pct_diagnostics()
+        shutil.move(fname_fcos, newname)
+
+    if args.run_diagnostics:
+        print 'creating diagnostic plots'
+        done = [fr for fr in fortran_runs if fr.ok()]
+        if done:
+            # the LRU file is the same for every GPP model
+            os.environ['LRU_FILE'] = done[0].path('LRU_from_C4pct.nc')
+            draw_LRU_map()
+        # fCOS_from_C4pct_diagnostics()
@@ -0,0 +1,493 @@
+"""Calculate COS plant fluxes (fCOS) for many GPP products and LRU /
+COS:CO2 ratio scenarios in one batch.
+
+calc_fCOS_C4pct.F90 computes fCOS for one GPP product per run: it
+rewrites the LRU and COS/CO2 ratio files and then evaluates equation 1
+of Campbell et al (2008),
+
+    fCOS = GPP * LRU * [COS]/[CO2],
+
+one grid cell at a time.  This module computes the LRU field from the
+C4 vegetation percentage once per scenario, combines it with the
+scenario's COS/CO2 ratio into a single time-independent factor, and
+applies the factors of all scenarios to each chunk of GPP time steps
+with one broadcast.  Each (GPP product, scenario) fCOS file is written
+in a single streamed pass with ioapi_tools.IOAPIWriter; no Fortran
+build or intermediate LRU/ratio files are needed.
+
+The COS/CO2 ratio may also be a gridded, time-varying field (a
+RatioField, e.g. built from model COS and CO2 climatologies).  It is
+sampled only at the GPP chunk times being calculated, and the ratio
+records read are cached on the RatioField, so GPP products sharing
+time steps (and scenarios sharing the RatioField) reuse them.
+Likewise LRU may depend on light (light_lru.LightLRU): LRU(PAR) is
+averaged over the PAR records within each output time step, reading
+only those records, so no full-season PAR or LRU field is ever held.
+
+The output time axis follows calc_fCOS_C4pct.F90: t_start to t_end at
+the requested time step, with GPP taken from the record containing
+each output time.
+
+REFERENCES:
+Campbell, J. E., et al.: Photosynthetic Control of Atmospheric
+  Carbonyl Sulfide During the Growing Season, Science, 322,
+  1085-1088, doi:10.1126/science.1164015, 2008.
+Stimler, K., Berry, J. A., Montzka, S. A., and Yakir, D.: Association
+  between Carbonyl Sulfide Uptake and 18delta during Gas Exchange in
+  C3 and C4 Leaves, Plant Physiology, 157, 509-517,
+  doi:10.1104/pp.111.176578, 2011.
+"""
+
+import os
+import os.path
+import sys
+import re
+import datetime
+import numpy as np
+import netCDF4
+
+# shared helper modules (ioapi_tools, ...) live in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+import ioapi_tools
+import data_paths
+
+# Stimler et al (2011) leaf relative uptake values
+C3_LRU = 1.82
+C4_LRU = 1.16
+# average COS/CO2 ratio of the INTEX-NA observations (Blake et al
+# (2008)), ppt COS / ppm CO2
+COS_CO2_RATIO = 1.1
+# ppt COS / ppm CO2 -> mol COS / mol CO2
+ppt_per_ppm = 1e-6
+
+
+def lru_from_c4pct(c4pct, c3_lru=C3_LRU, c4_lru=C4_LRU):
+    """LRU as the C4 percentage-weighted average of the C3 and C4 LRU
+    values (as write_LRU_ioapi_from_C4_pct in calc_fCOS_C4pct.F90)
+
+    ARGS:
+    c4pct (array): C4 vegetation percentage, 0 - 100
+    c3_lru, c4_lru (float): C3 and C4 LRU values
+    """
+    c4frac = np.asarray(c4pct, dtype='f8') / 100.0
+    return (c4frac * c4_lru) + ((1.0 - c4frac) * c3_lru)
+
+
+class GriddedField(object):
+    """a gridded I/O API variable sampled lazily at requested times
+
+    Each requested time takes the record containing it (as
+    calc_fCOS_C4pct.F90 does with CURRSTEP); time-independent files
+    (TSTEP 0) apply at all times.  Only the records spanned by a
+    request are read.
+
+    ATTRIBUTES:
+    fname (string): I/O API file
+    varname (string): variable name
+    scale (float): factor applied to the values read
+    layer (int): zero-based layer to read
+    cache (bool): if True, keep every record read (keyed by record
+       index) for later requests.  Use for small files such as
+       climatologies, not for fields with as many records as GPP.
+    """
+
+    def __init__(self, fname, varname, scale=1.0, layer=0, cache=False):
+        self.fname = fname
+        self.varname = varname
+        self.scale = scale
+        self.layer = layer
+        self.cache = cache
+        self._times = False
+        self._records_read = {}
+
+    def file_times(self):
+        """record timestamps of the file (None if time-independent)"""
+        if self._times is False:
+            nc = netCDF4.Dataset(self.fname, 'r')
+            try:
+                if int(nc.TSTEP) == 0:
+                    self._times = None
+                else:
+                    self._times = ioapi_tools.get_tflag_datetimes(nc)
+            finally:
+                nc.close()
+        return self._times
+
+    def records(self, t_req):
+        """index of the record containing each of t_req (datetime64)"""
+        t_file = self.file_times()
+        if t_file is None:
+            return np.zeros(len(t_req), dtype=int)
+        return ioapi_tools.record_index(t_file, t_req)
+
+    def _read(self, rec):
+        """read records rec (sorted) in one slab"""
+        nc = netCDF4.Dataset(self.fname, 'r')
+        try:
+            nc.set_auto_mask(False)
+            return ioapi_tools.read_records(nc.variables[self.varname],
+                                            rec, layer=self.layer)
+        finally:
+            nc.close()
+
+    def intervals(self, t_req, dt, max_records=168):
+        """read the records overlapping each interval [t, t + dt) of
+        t_req (datetime64), one interval at a time
+
+        Only the records of each interval are read, in blocks of at
+        most max_records records so that long intervals of a short
+        time step file (e.g. a month of hourly records) are never held
+        at once.
+
+        ARGS:
+        t_req (array): interval start times (datetime64)
+        dt (numpy.timedelta64): interval length
+        max_records (int): maximum number of records read at once
+
+        RETURNS:
+        generator of (i, block) tuples: i is the index into t_req and
+        block the [n_records, row, col] records read
+        """
+        t_req = np.asarray(t_req)
+        r0 = self.records(t_req)
+        r1 = self.records(t_req + dt - np.timedelta64(1, 's'))
+        nc = netCDF4.Dataset(self.fname, 'r')
+        try:
+            nc.set_auto_mask(False)
+            var = nc.variables[self.varname]
+            for i in range(t_req.size):
+                for b0 in range(r0[i], r1[i] + 1, max_records):
+                    b1 = min(b0 + max_records, r1[i] + 1)
+                    block = np.asarray(var[b0:b1, self.layer, ...],
+                                       dtype='f8')
+                    yield i, block * self.scale
+        finally:
+            nc.close()
+
+    def sample(self, t_req):
+        """return the field at times t_req (datetime64), shape
+        [len(t_req), row, col]"""
+        rec = self.records(t_req)
+        if not self.cache:
+            return self._read(rec) * self.scale
+        missing = np.array(sorted(set(rec) - set(self._records_read)),
+                           dtype=int)
+        if missing.size:
+            self._records_read.update(zip(missing, self._read(missing)))
+        return np.array([self._records_read[r] for r in rec]) * self.scale
+
+
+class RatioField(object):
+    """gridded, time-varying COS/CO2 ratio read lazily from I/O API
+    files
+
+    The ratio is either read directly (varname in fname) or computed
+    as scale * [COS] / [CO2] from a COS file and a CO2 file.  The files
+    are read through GriddedField objects that cache the records read,
+    so the ratio files are read at most once however many GPP
+    products and scenarios use them.
+
+    ATTRIBUTES:
+    cos (GriddedField): the ratio (or [COS])
+    co2 (GriddedField): [CO2], or None
+    """
+
+    def __init__(self, fname, varname='COS_CO2_ratio', fname_co2=None,
+                 varname_co2='CO2', scale=1.0, layer=0):
+        """
+        ARGS:
+        fname (string): I/O API file containing the ratio (or [COS])
+        varname (string): variable name of the ratio (or [COS])
+        fname_co2 (string): I/O API file containing [CO2], or None
+        varname_co2 (string): variable name of [CO2]
+        scale (float): factor converting varname (or [COS]/[CO2]) to
+           ppt COS / ppm CO2
+        layer (int): zero-based layer to read
+        """
+        self.cos = GriddedField(fname, varname, scale=scale, layer=layer,
+                                cache=True)
+        self.co2 = None
+        if fname_co2 is not None:
+            self.co2 = GriddedField(fname_co2, varname_co2, layer=layer,
+                                    cache=True)
+
+    def sample(self, t_req):
+        """return the ratio (ppt COS / ppm CO2) at times t_req
+        (datetime64), shape [len(t_req), row, col]"""
+        ratio = self.cos.sample(t_req)
+        if self.co2 is not None:
+            ratio /= self.co2.sample(t_req)
+        return ratio
+
+    def description(self):
+        if self.co2 is None:
+            return 'COS/CO2 ratio from {}'.format(
+                os.path.basename(self.cos.fname))
+        return 'COS/CO2 ratio from {} / {}'.format(
+            os.path.basename(self.cos.fname),
+            os.path.basename(self.co2.fname))
+
+
+class FcosScenario(object):
+    """one LRU / COS:CO2 ratio variant of fCOS
+
+    ATTRIBUTES:
+    name (string): short name of the variant, used in output file names
+    c3_lru, c4_lru (float): C3 and C4 LRU values weighted by the C4
+       vegetation percentage
+    lru (float): if not None, a spatially constant LRU used instead of
+       the C4 percentage-weighted LRU
+    light_lru (light_lru.LightLRU): if not None, LRU is calculated
+       from PAR and the C4 vegetation fraction instead.  LRU(PAR) is
+       evaluated for every PAR record in each output time step and
+       averaged with PAR as weight (standing in for the GPP within
+       the step, which is not known), so monthly fCOS uses the
+       month's light rather than a single PAR record.
+    par (GriddedField): PAR (umol m-2 s-1); required with light_lru
+    ratio (float, array or RatioField): COS/CO2 ratio, ppt COS / ppm
+       CO2; a scalar, a [row, col] array or a time-varying RatioField
+    """
+
+    def __init__(self, name, c3_lru=C3_LRU, c4_lru=C4_LRU, lru=None,
+                 ratio=COS_CO2_RATIO, light_lru=None, par=None):
+        self.name = name
+        self.c3_lru = c3_lru
+        self.c4_lru = c4_lru
+        self.lru = lru
+        self.ratio = ratio
+        self.light_lru = light_lru
+        self.par = par
+        if light_lru is not None and par is None:
+            raise ValueError('light-dependent LRU requires a PAR field')
+
+    def lru_field(self, c4pct):
+        """return the [row, col] LRU field"""
+        if self.lru is not None:
+            return np.full(np.shape(c4pct), float(self.lru))
+        return lru_from_c4pct(c4pct, self.c3_lru, self.c4_lru)
+
+    def time_varying(self):
+        """True if the COS/CO2 ratio or the LRU vary in time"""
+        return isinstance(self.ratio, RatioField) or self.light_lru is not None
+
+    def factor(self, c4pct):
+        """return the time-independent [row, col] factor by which GPP is
+        multiplied: LRU * [COS]/[CO2] (mol/mol), without whichever of
+        LRU and the ratio vary in time"""
+        f = np.full(np.shape(c4pct), ppt_per_ppm)
+        if self.light_lru is None:
+            f *= self.lru_field(c4pct)
+        if not isinstance(self.ratio, RatioField):
+            f *= np.asarray(self.ratio, dtype='f8')
+        return f
+
+    def step_lru(self, t_req, dt, c4pct):
+        """return the light-dependent LRU of the output time steps
+        [t, t + dt) of t_req (datetime64), shape [len(t_req), row, col]
+
+        LRU(PAR) of each PAR record within a step is averaged with PAR
+        as weight.  Steps without light (PAR 0 throughout) take the
+        unweighted mean.  A step shorter than the PAR time step covers
+        a single record and takes LRU(PAR) of that record.
+        """
+        c4frac = np.asarray(c4pct) / 100.0
+        shape = (len(t_req), ) + np.shape(c4frac)
+        lru_par_sum = np.zeros(shape)
+        par_sum = np.zeros(shape)
+        lru_sum = np.zeros(shape)
+        n_rec = np.zeros(len(t_req))
+        for i, par in self.par.intervals(t_req, dt):
+            lru = self.light_lru.lru(par, c4frac)
+            n_rec[i] += par.shape[0]
+            lru_sum[i] += lru.sum(axis=0)
+            lru *= par
+            lru_par_sum[i] += lru.sum(axis=0)
+            par_sum[i] += par.sum(axis=0)
+        lru_sum /= n_rec[:, np.newaxis, np.newaxis]
+        lit = par_sum > 0
+        lru_sum[lit] = lru_par_sum[lit] / par_sum[lit]
+        return lru_sum
+
+    def varying_factor(self, t_req, dt, c4pct):
+        """return the time-varying part of the factor by which GPP is
+        multiplied (light-dependent LRU and/or a RatioField) for the
+        output time steps [t, t + dt) of t_req (datetime64), shape
+        [len(t_req), row, col]"""
+        f = None
+        if self.light_lru is not None:
+            f = self.step_lru(t_req, dt, c4pct)
+        if isinstance(self.ratio, RatioField):
+            if f is None:
+                f = self.ratio.sample(t_req)
+            else:
+                f *= self.ratio.sample(t_req)
+        return f
+
+    def description(self, gpp_model):
+        """FILEDESC string for the scenario's output file"""
+        if self.light_lru is not None:
+            lru_str = 'LRU(PAR) from C4 veg pct, PAR from {}'.format(
+                os.path.basename(self.par.fname))
+        elif self.lru is None:
+            lru_str = 'LRU from C4 veg pct (C3 {}, C4 {})'.format(
+                self.c3_lru, self.c4_lru)
+        else:
+            lru_str = 'LRU={}'.format(self.lru)
+        if isinstance(self.ratio, RatioField):
+            ratio_str = self.ratio.description()
+        elif np.ndim(self.ratio) == 0:
+            ratio_str = 'COS/CO2 ratio={}'.format(self.ratio)
+        else:
+            ratio_str = 'spatially varying COS/CO2 ratio'
+        return 'COS plant fluxes (fCOS) ({}): {}; {}; GPP: {}'.format(
+            self.name, lru_str, ratio_str, gpp_model)
+
+
+def output_times(t_start, t_end, tstep):
+    """return the output timestamps (datetime64[s]) from t_start to
+    t_end (datetime.datetime) at I/O API time step tstep (HHMMSS)"""
+    dt = np.timedelta64(ioapi_tools.tstep_to_seconds(tstep), 's')
+    return np.arange(np.datetime64(t_start, 's'),
+                     np.datetime64(t_end, 's') + np.timedelta64(1, 's'),
+                     dt)
+
+
+def calc_fcos_batch(fname_gpp, gpp_model, scenarios, fname_fmt, c4pct,
+                    grid, tstep, t_start=datetime.datetime(2008, 2, 29),
+                    t_end=datetime.datetime(2008, 12, 31, 23, 59, 59),
+                    chunk_tsteps=64, zlib=True):
+    """calculate fCOS for one GPP product and many scenarios
+
+    ARGS:
+    fname_gpp (string): I/O API file containing GPP (variable GPP)
+    gpp_model (string): name of the GPP product
+    scenarios (list): FcosScenario objects
+    fname_fmt (string): output file name template; formatted with
+       keywords model (gpp_model with spaces and dashes removed) and
+       scenario (the scenario name)
+    c4pct (array): [row, col] C4 vegetation percentage
+    grid (dict): grid parameters as returned by
+       ioapi_tools.parse_griddesc
+    tstep (int): output time step, HHMMSS
+    t_start, t_end (datetime.datetime): first and last output times
+    chunk_tsteps (int): number of time steps calculated at once
+    zlib (bool): if True (default) compress the output files
+
+    RETURNS:
+    list of the output file names, ordered as scenarios
+    """
+    # [scenario, 1, row, col]; broadcasts against [time, row, col]
+    factor = np.array([s.factor(c4pct) for s in scenarios])[:, np.newaxis]
+    varying = [(i, s) for i, s in enumerate(scenarios) if s.time_varying()]
+    t_out = output_times(t_start, t_end, tstep)
+    dt = np.timedelta64(ioapi_tools.tstep_to_seconds(tstep), 's')
+    sdate, stime = ioapi_tools.datetime_to_ioapi(t_start)
+    model_str = re.sub('[\ \-]', '', gpp_model)
+    fnames = [fname_fmt.format(model=model_str, scenario=s.name)
+              for s in scenarios]
+    var = [('cos', 'mol m-2 s-1', 'COS plant flux')]
+
+    nc_gpp = netCDF4.Dataset(fname_gpp, 'r')
+    nc_gpp.set_auto_mask(False)
+    writers = []
+    try:
+        t_gpp = ioapi_tools.get_tflag_datetimes(nc_gpp)
+        for s, fname in zip(scenarios, fnames):
+            writers.append(ioapi_tools.IOAPIWriter(
+                fname, grid, var, sdate=sdate, stime=stime, tstep=tstep,
+                fdesc=s.description(gpp_model), upnam='fcos_batch',
+                zlib=zlib))
+        for i0 in range(0, t_out.size, chunk_tsteps):
+            t_chunk = t_out[i0:i0 + chunk_tsteps]
+            rec = ioapi_tools.record_index(t_gpp, t_chunk)
+            gpp = ioapi_tools.read_records(nc_gpp.variables['GPP'], rec)
+            # equation 1, Campbell et al (2008); [scenario, time, row, col]
+            fcos = factor * gpp
+            # light-dependent LRU and time-varying ratios are sampled
+            # for this chunk only
+            for s_idx, s in varying:
+                fcos[s_idx] *= s.varying_factor(t_chunk, dt, c4pct)
+            for s_idx, wr in enumerate(writers):
+                wr.write_var('cos', fcos[s_idx, :, np.newaxis, ...], t0=i0)
+    finally:
+        for wr in writers:
+            wr.close()
+        nc_gpp.close()
+    return fnames
+
+
+def read_c4pct(fname_c4pct):
+    """read the [row, col] C4 vegetation percentage (variable C4pct)
+    from an I/O API file"""
+    nc = netCDF4.Dataset(fname_c4pct, 'r')
+    try:
+        nc.set_auto_mask(False)
+        return np.asarray(nc.variables['C4pct'][0, 0, ...], dtype='f8')
+    finally:
+        nc.close()
+
+
+def gpp_tstep(gpp_model):
+    """fCOS output time step (HHMMSS) for a GPP product: 3 hours for
+    CASA, 30.5 days (monthly) otherwise"""
+    if gpp_model.lower().find('casa') >= 0:
+        return 30000
+    return 7320000
+
+
+if __name__ == "__main__":
+
+    import argparse
+    from stem_pytools import ecampbell300_data_paths as edp
+
+    parser = argparse.ArgumentParser(description=(
+        'calculate fCOS for all GPP products defined in '
+        'stem_pytools.ecampbell300_data_paths and several LRU/COS:CO2 '
+        'ratio scenarios'))
+    parser.add_argument('--ratio_file', dest='ratio_file', default=None,
+                        help=('I/O API file containing a gridded '
+                              'COS/CO2 ratio (variable COS_CO2_ratio, '
+                              'ppt/ppm); adds a LRUfromC4pct_ratiofield '
+                              'scenario'))
+    parser.add_argument('--sw_file', dest='sw_file', default=None,
+                        help=('I/O API file containing downward '
+                              'shortwave radiation (variable SWDOWN, '
+                              'W m-2); adds a LRUlight scenario with '
+                              'LRU(PAR) fitted to the Stimler et al '
+                              '(2011) light experiments'))
+    args = parser.parse_args()
+
+    fname_griddesc = data_paths.get_path('ioapi_griddesc')
+    fname_C4pct = data_paths.get_path('c4pct')
+    grid = ioapi_tools.parse_griddesc(fname_griddesc, 'ARCNAGRID')
+    c4pct = read_c4pct(fname_C4pct)
+    scenarios = [FcosScenario('LRUfromC4pct'),
+                 FcosScenario('LRU1.61', lru=1.61),
+                 FcosScenario('LRUfromC4pct_ratio1.0', ratio=1.0),
+                 FcosScenario('LRUfromC4pct_ratio1.2', ratio=1.2)]
+    if args.ratio_file is not None:
+        scenarios.append(FcosScenario('LRUfromC4pct_ratiofield',
+                                      ratio=RatioField(args.ratio_file)))
+    if args.sw_file is not None:
+        import light_lru
+        fname_stimler = data_paths.get_path('stimler_data')
+        scenarios.append(FcosScenario(
+            'LRUlight',
+            light_lru=light_lru.LightLRU.from_stimler(fname_stimler),
+            par=GriddedField(args.sw_file, 'SWDOWN',
+                             scale=light_lru.PAR_PER_SW)))
+
+    runs = edp.get_C3C4runs()
+    for this_run in runs.values():
+        if not os.path.exists(this_run.gpp_path):
+            print('GPP file not found: {}'.format(this_run.gpp_path))
+            continue
+        print('GPP file: {}'.format(this_run.gpp_path))
+        fname_fmt = os.path.join(os.path.dirname(this_run.fcos_path),
+                                 'fCOS_{model}_2008_124x124_{scenario}.nc')
+        fnames = calc_fcos_batch(this_run.gpp_path, this_run.model,
+                                 scenarios, fname_fmt, c4pct, grid,
+                                 gpp_tstep(this_run.model))
+        for f in fnames:
+            print('   wrote {}'.format(f))
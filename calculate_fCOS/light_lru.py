@@ -0,0 +1,188 @@
+"""Light-dependent leaf relative uptake (LRU) for the fCOS calculation.
+
+get_C3C4_light_LRU_eq.R fits loess curves of LRU against PAR to the
+light-response experiments of Stimler et al (2011), separately for C3
+and C4 plants.  This module fits the same curves (loess with R's
+default span of 0.75 and degree 2) and tabulates them over the
+observed PAR range.  LightLRU then evaluates LRU for gridded PAR and C4
+vegetation fraction as a C4 fraction-weighted average of the C3 and C4
+curves -- the light-dependent counterpart of
+write_LRU_ioapi_from_C4_pct in calc_fCOS_C4pct.F90.  Evaluation is a
+table lookup on whatever block of time steps it is given, so
+fcos_batch applies it one GPP chunk at a time.
+
+REFERENCES:
+Stimler, K., Berry, J. A., Montzka, S. A., and Yakir, D.: Association
+  between Carbonyl Sulfide Uptake and 18delta during Gas Exchange in
+  C3 and C4 Leaves, Plant Physiology, 157, 509-517,
+  doi:10.1104/pp.111.176578, 2011.
+"""
+
+import os
+import os.path
+import sys
+import re
+import numpy as np
+import pandas as pd
+
+# shared helper modules (data_paths, ...) live in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+import data_paths
+
+# species of the Stimler et al (2011) light experiments that are C4
+C4_SPECIES = ('corn', 'sorghum', 'amaranthus')
+# shortwave (W m-2) -> PAR (umol m-2 s-1): PAR is about half of
+# incoming shortwave, at 4.57 umol J-1 (McCree, 1972)
+PAR_FRACTION = 0.5
+UMOL_PER_J = 4.57
+PAR_PER_SW = PAR_FRACTION * UMOL_PER_J
+
+
+def sw_to_par(sw):
+    """convert downward shortwave radiation (W m-2) to PAR
+    (umol m-2 s-1)"""
+    return np.asarray(sw) * PAR_PER_SW
+
+
+def read_stimler_light_data(fpath):
+    """read the light-response experiments from the Stimler et al
+    (2011) COS exchange data, as get_C3C4_light_LRU_eq.R does
+
+    ARGS:
+    fpath (string): full path to Stimler_COS_exchange_data.csv
+
+    RETURNS:
+    pandas.DataFrame with columns PAR, LRU, species, C3C4
+    """
+    all_data = pd.read_csv(fpath)
+    # column names as R's read.csv makes them
+    all_data.columns = [re.sub('[^0-9A-Za-z_.]', '.', c)
+                        for c in all_data.columns]
+    light_data = all_data.iloc[1:][['PAR_umol.m.2s.1', 'lru', 'plant']]
+    light_data.columns = ['PAR', 'LRU', 'species']
+    light_data = light_data[
+        light_data['species'].astype(str).str.contains('-light')].copy()
+    light_data['species'] = light_data['species'].str.replace('-light', '')
+    light_data['PAR'] = pd.to_numeric(light_data['PAR'], errors='coerce')
+    light_data['LRU'] = pd.to_numeric(light_data['LRU'], errors='coerce')
+    light_data['C3C4'] = np.where(
+        light_data['species'].isin(C4_SPECIES), 'C4', 'C3')
+    return light_data.dropna(subset=['PAR', 'LRU'])
+
+
+def loess(x, y, x_new, span=0.75, degree=2):
+    """local polynomial regression (Cleveland's loess, gaussian family)
+    evaluated directly at each of x_new
+
+    Each fit uses the span * len(x) nearest points with tricube
+    weights, as R's loess does for span < 1.  All points in x_new are
+    fitted at once as a stack of small weighted least squares problems.
+
+    ARGS:
+    x, y (array): observations
+    x_new (array): points at which to evaluate the fit
+    span (float): fraction of the observations used in each local fit
+    degree (int): degree of the local polynomials (1 or 2)
+
+    RETURNS:
+    array of the fitted values at x_new
+    """
+    x = np.asarray(x, dtype='f8')
+    y = np.asarray(y, dtype='f8')
+    x_new = np.asarray(x_new, dtype='f8')
+    q = int(np.floor(span * x.size))
+    dist = np.abs(x_new[:, np.newaxis] - x[np.newaxis, :])
+    # distance to the q-th nearest observation of each x_new
+    d_max = np.sort(dist, axis=1)[:, q - 1]
+    w = np.clip(1.0 - (dist / d_max[:, np.newaxis]) ** 3, 0.0, 1.0) ** 3
+    # [x_new, obs, degree + 1] local design matrices
+    X = (x[np.newaxis, :] - x_new[:, np.newaxis])[..., np.newaxis] ** \
+        np.arange(degree + 1)
+    # weighted normal equations, one per point of x_new
+    A = np.einsum('mn,mni,mnj->mij', w, X, X)
+    b = np.einsum('mn,mni,n->mi', w, X, y)
+    beta = np.linalg.solve(A, b[..., np.newaxis])
+    return beta[:, 0, 0]
+
+
+class LightLRU(object):
+    """tabulated C3 and C4 LRU(PAR) curves
+
+    ATTRIBUTES:
+    par (array): PAR values (umol m-2 s-1) of the table, increasing
+    lru_c3, lru_c4 (array): C3 and C4 LRU at par.  Outside the table
+       the end values are used.
+    """
+
+    def __init__(self, par, lru_c3, lru_c4):
+        self.par = np.asarray(par, dtype='f8')
+        self.lru_c3 = np.asarray(lru_c3, dtype='f8')
+        self.lru_c4 = np.asarray(lru_c4, dtype='f8')
+
+    @classmethod
+    def from_stimler(cls, fpath, par_step=1.0, span=0.75):
+        """fit loess curves to the Stimler et al (2011) light
+        experiments (see get_C3C4_light_LRU_eq.R)
+
+        ARGS:
+        fpath (string): full path to Stimler_COS_exchange_data.csv
+        par_step (float): PAR spacing of the table, umol m-2 s-1
+        span (float): loess span
+        """
+        light_data = read_stimler_light_data(fpath)
+        # R's predict.loess does not extrapolate, so the table covers
+        # the PAR range of the observations
+        par = np.arange(light_data['PAR'].min(),
+                        light_data['PAR'].max() + par_step, par_step)
+        curves = {}
+        for c3c4, df in light_data.groupby('C3C4'):
+            curves[c3c4] = loess(df['PAR'].values, df['LRU'].values, par,
+                                 span=span)
+        return cls(par, curves['C3'], curves['C4'])
+
+    def lru(self, par, c4frac):
+        """LRU for gridded PAR and C4 vegetation fraction
+
+        ARGS:
+        par (array): PAR, umol m-2 s-1; e.g. [time, row, col]
+        c4frac (array): C4 vegetation fraction (0 - 1), broadcastable
+           against par (e.g. [row, col])
+
+        RETURNS:
+        array of LRU, shaped as par broadcast against c4frac
+        """
+        par = np.asarray(par, dtype='f8')
+        lru_c3 = np.interp(par, self.par, self.lru_c3)
+        lru_c4 = np.interp(par, self.par, self.lru_c4)
+        # (c4frac * C4) + ((1 - c4frac) * C3), without another temporary
+        lru_c4 -= lru_c3
+        lru_c4 *= c4frac
+        lru_c4 += lru_c3
+        return lru_c4
+
+    def to_csv(self, fname):
+        """write the LRU(PAR) table to a csv file"""
+        pd.DataFrame({'PAR': self.par, 'LRU_C3': self.lru_c3,
+                      'LRU_C4': self.lru_c4}).to_csv(
+                          fname, index=False,
+                          columns=['PAR', 'LRU_C3', 'LRU_C4'])
+
+    @classmethod
+    def from_csv(cls, fname):
+        """read a table written by to_csv"""
+        df = pd.read_csv(fname)
+        return cls(df['PAR'].values, df['LRU_C3'].values,
+                   df['LRU_C4'].values)
+
+
+if __name__ == "__main__":
+
+    fpath = data_paths.get_path('stimler_data')
+    light_lru = LightLRU.from_stimler(fpath)
+    light_lru.to_csv('stimler_PAR_LRU_loess.csv')
+    for par in (0, 100, 250, 500, 1000, 1500):
+        print('PAR {:5d}: LRU C3 {:0.2f}  C4 {:0.2f}'.format(
+            par,
+            float(light_lru.lru(par, 0.0)),
+            float(light_lru.lru(par, 1.0))))
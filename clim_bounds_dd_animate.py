@@ -21,6 +21,8 @@ from stem_pytools.domain import STEM_Domain
 from stem_pytools import STEM_parsers as sp
 from stem_pytools.na_map import NAMapFigure
 
+import data_paths
+
 
 def map_init(cos):
     """
@@ -136,9 +138,7 @@ if __name__ == "__main__":
         sys.exit("ffmpeg not found. Exiting now.")
 
     hours_in_day = 24
-    data_dir = os.path.join('/project', 'projectdirs', 'm2319',
-                            'STEM_Runs',
-                            'STEM_NAmerica_Climatological_Bounds', 'output')
+    data_dir = data_paths.get_path('clim_bounds_run_dir')
     outfile = 'climatological_bounds_TEST.mp4'
 
     cos = sp.parse_STEM_var(nc_fname=os.path.join(
@@ -10,11 +10,12 @@ standard deviation from one or more STEM AQOUT files.
 """
 
 import os.path
-import sys
 from datetime import datetime
 from itertools import product
 from stem_pytools import aqout_postprocess as aq
 
+import instrument
+
 
 def process(aqc):
     """
@@ -25,26 +26,23 @@ def process(aqc):
     jul1 = datetime(2008, 7, 1)
     aug31 = datetime(2008, 8, 31, 23, 59, 59)
 
-    t0 = datetime.now()
-    aqc.parse(jul1, aug31, verbose=True)
-    sys.stdout.write('done parsing ({}s)\n'.format(
-        (datetime.now() - t0).seconds))
-    sys.stdout.flush()
-
-    aqc.sum()
-
-    t0 = datetime.now()
-    sys.stdout.write('calculating stats')
-    sys.stdout.flush()
-    aqc.calc_stats()
-    sys.stdout.write('done ({}s)\n'.format((datetime.now() - t0).seconds))
-    sys.stdout.flush()
+    with instrument.stage('parse', detail=aqc.key):
+        aqc.parse(jul1, aug31, verbose=True)
+    with instrument.stage('sum', detail=aqc.key):
+        aqc.sum()
+    with instrument.stage('calc_stats', detail=aqc.key):
+        aqc.calc_stats()
 
     outfile = 'AQOUTagg_{}.nc'.format(aqc.key)
-    aqc.stats_to_netcdf(outfile)
+    with instrument.stage('netcdf_write', detail=outfile):
+        aqc.stats_to_netcdf(outfile)
 
 if __name__ == "__main__":
 
+    # report each stage as it finishes and write the timings of all
+    # stages to AQOUTagg_timings.json
+    instrument.configure('AQOUTagg_timings.json', verbose=True)
+
     stem_out_root = os.path.join('/',
                                  'Users',
                                  'tim',
@@ -122,4 +120,5 @@ if __name__ == "__main__":
     # for this in (plant_soil_aqc + Fsoil_aqc + Fplant_aqc):
     #     process(this)
     for this in (Fsoil_aqc + Fplant_aqc):
-        process(this)
+        with instrument.stage('process', detail=this.key):
+            process(this)
@@ -0,0 +1,213 @@
+"""The input and output paths of the pipeline, resolved once per process.
+
+Paths used to be assembled wherever they were needed -- from $HOME,
+$PROJ, $SARIKA_INPUT and $SCRATCH, or by branching on
+socket.gethostname() -- and several of them at import time.  They are
+now named entries of one registry, built from (later sources override
+earlier ones):
+
+    1. DEFAULTS, the NERSC layout;
+    2. HOST_PATHS, for the hosts that keep their data elsewhere (e.g.
+       Tim's laptop);
+    3. a JSON configuration file: $COS_DATA_PATHS, or
+       ~/.cos_data_paths.json if it exists, of the form
+           {"paths": {"noaa_dir": "/scratch/local/NOAA_95244993", ...}}
+    4. environment overrides, COS_PATH_<NAME> (e.g.
+       COS_PATH_NOAA_DIR=/tmp/noaa).
+
+Entries are templates: $VAR or ${VAR} is replaced by an environment
+variable (ENV_DEFAULTS supplies values for unset ones) and {name} by
+another entry, so pointing stem_input_dir at a fast local copy of the
+STEM inputs moves topo and wrfheight with it.
+
+get_path(name) returns a resolved path.  The registry is built at the
+first call and shared by every module for the rest of the process;
+reset() discards it (e.g. after changing the environment).
+"""
+
+import os
+import os.path
+import re
+import json
+import socket
+from collections import OrderedDict
+
+CONFIG_ENV = 'COS_DATA_PATHS'
+CONFIG_DEFAULT = os.path.join('~', '.cos_data_paths.json')
+OVERRIDE_PREFIX = 'COS_PATH_'
+
+# values of environment variables that are not set
+ENV_DEFAULTS = {'PROJ': os.path.join('/', 'project', 'projectdirs',
+                                     'm2319')}
+
+DEFAULTS = OrderedDict([
+    # STEM inputs: grid description, topography, layer heights
+    ('stem_input_dir', '${SARIKA_INPUT}'),
+    ('griddesc', '${HOME}/Code/Regrid/GEOS-Chem_Regrid/GRIDDESC_GC'),
+    # I/O API GRIDDESC of the fCOS and soil flux calculations
+    ('ioapi_griddesc', '${HOME}/Data/STEM/input/GRIDDESC.txt'),
+    ('topo', '{stem_input_dir}/TOPO-124x124.nc'),
+    ('wrfheight', '{stem_input_dir}/wrfheight-124x124-22levs.nc'),
+    # the copy of the STEM inputs in the project directory, read by
+    # error_bar_framework
+    ('proj_stem_input_dir', '${PROJ}/Data/STEM_124x124_NA_inputs'),
+    # ISLSCP C4 vegetation percentage, for the fCOS calculation
+    ('c4pct', ('/home/thilton/projects/COS (ecampbell3)/C4_percentage/'
+               'ISLSCP_C4_1DEG_932_regridded/C4_pct_124x124.nc')),
+    # Stimler et al (2011) COS exchange data, for light-dependent LRU
+    ('stimler_data', '${HOME}/work/Data/Stimler_COS_exchange_data.csv'),
+    # Ramankutty et al (2008) cropland percentage, for the soil fluxes
+    ('cropland_pct', ('${HOME}/projects/COS (ecampbell3)/'
+                      'Fractional_US_Cropland/'
+                      'Ramankutty_etal_Cropland2000_pct_124x124_IOAPI.nc')),
+    # STEM run with climatological boundaries and no surface fluxes
+    ('clim_bounds_run_dir', ('${PROJ}/STEM_Runs/'
+                             'STEM_NAmerica_Climatological_Bounds/output')),
+    # NOAA airborne [COS] observations
+    ('noaa_dir', '${PROJ}/Data/NOAA_95244993'),
+    # pre-parsed AQOUT data
+    ('aqout_data', '${HOME}/Data/STEM/aq_out_data_BASC.cpickle'),
+    ('stem_all_runs', '${HOME}/STEM_all_runs.cpickle'),
+    # outputs
+    ('output_dir', '${SCRATCH}'),
+    ('plot_dir', '${HOME}/plots')])
+
+# entries that differ from DEFAULTS on particular hosts; a host
+# matches if its name contains the key
+HOST_PATHS = {
+    'Timothys-MacBook-Air.local': {
+        'noaa_dir': '${HOME}/work/Data/NOAA_95244993',
+        'aqout_data': '${HOME}/work/Data/STEM/aq_out_data.cpickle',
+        'stem_all_runs': '${HOME}/work/Data/STEM/aq_out_data.cpickle'}}
+
+_registry = None
+
+
+class DataPaths(object):
+    """a set of named path templates, resolved on first use
+
+    ATTRIBUTES:
+    templates (OrderedDict): name -> path template
+    sources (dict): name -> where the template came from ('default',
+       the host name, the configuration file name or the environment
+       variable)
+    """
+
+    def __init__(self, templates, sources=None, env=None):
+        """
+        ARGS:
+        templates (dict): name -> path template
+        sources (dict): name -> origin of the template
+        env (dict): environment to expand $VAR from; default
+           os.environ
+        """
+        self.templates = OrderedDict(templates)
+        self.sources = dict(sources or {})
+        self._env = dict(os.environ if env is None else env)
+        self._resolved = {}
+
+    def _expand(self, name, seen):
+        if name in self._resolved:
+            return self._resolved[name]
+        if name not in self.templates:
+            raise KeyError('unknown data path {!r}'.format(name))
+        if name in seen:
+            raise ValueError('data path {!r} refers to itself'.format(name))
+        s = re.sub(r'(?<!\$)\{(\w+)\}',
+                   lambda m: self._expand(m.group(1), seen + (name,)),
+                   self.templates[name])
+
+        def env_value(m):
+            var = m.group(1) or m.group(2)
+            value = self._env.get(var, ENV_DEFAULTS.get(var))
+            if value is None:
+                raise KeyError('data path {!r} needs ${} (from {})'.format(
+                    name, var, self.sources.get(name, 'default')))
+            return value
+        s = re.sub(r'\$\{(\w+)\}|\$(\w+)', env_value, s)
+        path = os.path.normpath(os.path.expanduser(s))
+        self._resolved[name] = path
+        return path
+
+    def get(self, name):
+        """return the full path of entry name"""
+        return self._expand(name, ())
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def as_dict(self):
+        """return all entries that can be resolved, name -> path"""
+        out = OrderedDict()
+        for name in self.templates:
+            try:
+                out[name] = self.get(name)
+            except KeyError:
+                pass
+        return out
+
+
+def read_config(fname):
+    """return the name -> template dict of a JSON configuration file"""
+    with open(fname) as f:
+        return json.load(f, object_pairs_hook=OrderedDict).get('paths', {})
+
+
+def build_registry(env=None, hostname=None):
+    """build a DataPaths from DEFAULTS, HOST_PATHS, the configuration
+    file and the COS_PATH_* environment overrides
+
+    ARGS:
+    env (dict): environment; default os.environ
+    hostname (string): host name; default socket.gethostname()
+    """
+    if env is None:
+        env = os.environ
+    if hostname is None:
+        hostname = socket.gethostname()
+    templates = OrderedDict(DEFAULTS)
+    sources = dict((k, 'default') for k in templates)
+
+    def update(new, source):
+        for k, v in new.items():
+            templates[k] = v
+            sources[k] = source
+    for host, paths in HOST_PATHS.items():
+        if host in hostname:
+            update(paths, host)
+    fname = env.get(CONFIG_ENV)
+    if fname is None and os.path.exists(os.path.expanduser(CONFIG_DEFAULT)):
+        fname = os.path.expanduser(CONFIG_DEFAULT)
+    if fname is not None:
+        update(read_config(fname), fname)
+    for var, value in env.items():
+        if var.startswith(OVERRIDE_PREFIX):
+            update({var[len(OVERRIDE_PREFIX):].lower(): value}, var)
+    return DataPaths(templates, sources, env)
+
+
+def get_registry():
+    """return the DataPaths of this process, building it on first
+    use"""
+    global _registry
+    if _registry is None:
+        _registry = build_registry()
+    return _registry
+
+
+def get_path(name):
+    """return the full path of data path name (see DEFAULTS)"""
+    return get_registry().get(name)
+
+
+def reset():
+    """discard the registry of this process; the next get_path builds
+    it again from the current environment"""
+    global _registry
+    _registry = None
+
+
+if __name__ == "__main__":
+    reg = get_registry()
+    for name, path in reg.as_dict().items():
+        print('{:<20} {}  ({})'.format(name, path, reg.sources[name]))
@@ -6,40 +6,36 @@ import os.path
 import numpy as np
 
 from stem_pytools import NERSC_data_paths as ndp
-from aqout_postprocess_spatial_paper import AqoutContainerSpatialPaper
+from aqout_postprocess_spatial_paper import (AqoutContainerSpatialPaper,
+                                             add_site_vals_ci,
+                                             write_drawdown_stats_netcdf)
 from stem_pytools import noaa_ocs
 from stem_pytools.calc_drawdown import calc_STEM_COS_drawdown
 import itertools
 
+import data_paths
+import instrument
+
 
 def pull_site_xy(site_requested, noaa_dir=None):
     """return STEM grid x and y indices for sitecode"""
 
     if noaa_dir is None:
-        noaa_dir = os.path.join('/', 'project',
-                                'projectdirs',
-                                'm2319',
-                                'Data',
-                                'NOAA_95244993')
+        noaa_dir = data_paths.get_path('noaa_dir')
     sites = noaa_ocs.get_sites_summary(noaa_dir, stemxy=True)
     sites.index = sites.site_code
     return (sites.loc[site_requested, 'x_stem'],
             sites.loc[site_requested, 'y_stem'])
 
 
-stem_input_dir = os.path.join('/', 'project',
-                              'projectdirs',
-                              'm2319',
-                              'Data',
-                              'STEM_124x124_NA_inputs')
-topo_file = os.path.join(stem_input_dir,
-                         'TOPO-124x124.nc')
+stem_input_dir = data_paths.get_path('proj_stem_input_dir')
+topo_file = os.path.join(stem_input_dir, 'TOPO-124x124.nc')
 wrf_file = os.path.join(stem_input_dir,
                         'wrfheight-124x124-2008-2009-22levs.nc')
 x_site, y_site = pull_site_xy('WBI')
 
-
-t0 = datetime.now()
+# per-stage timings of every model combination
+instrument.configure('error_bar_framework_timings.json', verbose=True)
 
 runs = ndp.get_Spatial_Paper_runs()
 Fplant = ['SiB_calc', 'SiB_mech', 'casa_gfed_161',
@@ -65,30 +61,33 @@ aqcs = aqcs_all
 
 for k in aqcs.keys():
     print "processing {}".format(k)
-    aqcs[k].parse(t0=datetime(2008, 7, 8),
-                  t1=datetime(2008, 8, 31, 0, 0, 0),
-                  verbose=True)
-    mean_dd = []
-    for i, aqdata in enumerate(aqcs[k].data):
-        dd = calc_STEM_COS_drawdown(aqdata)
-        this_mean_dd = dd[:, :, x_site, y_site].mean(axis=0).squeeze()
-        mean_dd.append(np.float(this_mean_dd.data))
-        print aqcs[k].aqout_paths[i], this_mean_dd
-        # site_columns = [arr[:, :, x_site, y_site].mean(axis=0).squeeze()
-    #                 for arr in aqcs[k].data]
-    print '-----'
-    aqcs[k].components = pd.DataFrame(dict(zip(aqcs[k].key.split('-'),
-                                               mean_dd)),
-                                      index=[0])
-
-    aqcs[k].sum()
-    # aqcs[k].calc_stats()
-
-    aqcs[k].calc_JA_midday_drawdown()
-    aqcs[k].calc_JA_midday_drawdown_stderr()
-    aqcs[k].extract_noaa_sites(
-        '/project/projectdirs/m2319/Data/NOAA_95244993/')
-
+    with instrument.stage('model', detail=k):
+        aqcs[k].parse(t0=datetime(2008, 7, 8),
+                      t1=datetime(2008, 8, 31, 0, 0, 0),
+                      verbose=True)
+        mean_dd = []
+        for i, aqdata in enumerate(aqcs[k].data):
+            dd = calc_STEM_COS_drawdown(aqdata)
+            this_mean_dd = dd[:, :, x_site, y_site].mean(axis=0).squeeze()
+            mean_dd.append(np.float(this_mean_dd.data))
+            print aqcs[k].aqout_paths[i], this_mean_dd
+            # site_columns = [arr[:, :, x_site, y_site].mean(axis=0).squeeze()
+        #                 for arr in aqcs[k].data]
+        print '-----'
+        aqcs[k].components = pd.DataFrame(dict(zip(aqcs[k].key.split('-'),
+                                                   mean_dd)),
+                                          index=[0])
+
+        aqcs[k].sum()
+        # aqcs[k].calc_stats()
+
+        aqcs[k].calc_JA_midday_drawdown()
+        # bootstrap standard errors and intervals for the netCDF export
+        aqcs[k].calc_JA_midday_drawdown_stderr(n_boot=1000)
+        aqcs[k].extract_noaa_sites(data_paths.get_path('noaa_dir'))
+
+add_site_vals_ci(aqcs.values())
 all = pd.concat([this_model.site_vals for this_model in aqcs.values()])
 all.to_csv('./model_components_14Apr.csv')
-print 'time: ',  datetime.now() - t0
+write_drawdown_stats_netcdf(aqcs.values(), './drawdown_stats_14Apr.nc')
+instrument.get_recorder().print_records()
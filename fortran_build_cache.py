@@ -0,0 +1,275 @@
+"""Build the I/O API Fortran programs once and run them concurrently.
+
+The Fortran drivers (calculate_fCOS/calc_fCOS_C4pct_run_driver.py,
+Meld_fSoils/RunDriver_meld_whelan_kettle_fsoils.py) used to call make
+on every run.  FortranBuild instead keys the executable on
+
+    - the contents of the Fortran sources and the makefile,
+    - the compiler named in the makefile (FC) and its version banner,
+    - the I/O API build environment: the libraries the makefile links
+      (-L/-l, size and modification time) and the environment
+      variables in IOAPI_ENV_VARS,
+
+and keeps a copy of the executable for each key in a cache directory.
+make only runs when no executable exists for the current key.
+
+The programs read and write files through I/O API logical names
+(environment variables) that the drivers set to fixed relative paths
+(e.g. RATIO_FILE=./COS_CO2_ratio_const_1.1.nc), so two invocations in
+the same directory overwrite each other's files.  run_all runs each
+FortranRun in its own working directory, several at a time, and
+keeps each run's stdout/stderr in a log file in that directory.
+"""
+
+import os
+import os.path
+import re
+import glob
+import shutil
+import hashlib
+import subprocess
+from multiprocessing.pool import ThreadPool
+
+# file name patterns of the sources hashed by default
+SOURCE_PATTERNS = ('*.F90', '*.f90', '*.F', '*.f', '*.EXT', '*.inc')
+# environment variables that affect how I/O API programs compile and
+# link
+IOAPI_ENV_VARS = ('BIN', 'IOAPI', 'IOAPI_DIR', 'NETCDF', 'NETCDF_DIR',
+                  'LD_LIBRARY_PATH', 'FFLAGS', 'LDFLAGS')
+
+
+def _expand_make_vars(s):
+    """replace make-style $(VAR) references with environment values"""
+    return re.sub(r'\$\((\w+)\)',
+                  lambda m: os.environ.get(m.group(1), ''), s)
+
+
+def parse_makefile(makefile):
+    """return the compiler (FC) and the libraries linked (as a list of
+    existing library paths) by a makefile
+
+    ARGS:
+    makefile (string): full path of the makefile
+
+    RETURNS:
+    (fc, libs): fc is the FC variable of the makefile (None if not
+       set); libs the paths of the lib<name>.a / lib<name>.so files
+       named by the -L and -l flags of the makefile that exist
+    """
+    fc = None
+    lib_dirs = []
+    lib_names = []
+    with open(makefile) as f:
+        for line in f:
+            m = re.match(r'\s*FC\s*=\s*(\S+)', line)
+            if m:
+                fc = m.group(1)
+            for tok in _expand_make_vars(line).split():
+                if tok.startswith('-L'):
+                    lib_dirs.append(tok[2:])
+                elif tok.startswith('-l'):
+                    lib_names.append(tok[2:])
+    libs = []
+    for name in lib_names:
+        for d in lib_dirs:
+            for ext in ('.a', '.so'):
+                path = os.path.join(d, 'lib' + name + ext)
+                if os.path.exists(path):
+                    libs.append(path)
+    return fc, libs
+
+
+def compiler_version(fc):
+    """return the version banner of compiler fc ('' if fc cannot be
+    run).  pgf90 reports its version with -V, gfortran with
+    --version."""
+    for flag in ('-V', '--version'):
+        try:
+            p = subprocess.Popen([fc, flag], stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT)
+            out = p.communicate()[0]
+        except OSError:
+            return ''
+        if p.returncode == 0:
+            return out.strip()
+    return ''
+
+
+class FortranBuild(object):
+    """a makefile-built Fortran executable, cached by build key
+
+    ATTRIBUTES:
+    src_dir (string): directory containing the sources and makefile
+    makefile (string): makefile name, relative to src_dir
+    executable (string): name of the executable the makefile creates
+    sources (list): full paths of the files whose contents are hashed
+    cache_dir (string): directory holding one subdirectory (named by
+       build key) per cached executable
+    """
+
+    def __init__(self, src_dir, makefile, executable, sources=None,
+                 cache_dir=None):
+        """
+        ARGS:
+        src_dir (string): directory containing the sources and makefile
+        makefile (string): makefile name, relative to src_dir
+        executable (string): name of the executable the makefile
+           creates in src_dir
+        sources (list): source file paths to hash.  Default is every
+           file in src_dir matching SOURCE_PATTERNS.
+        cache_dir (string): cache directory.  Default is
+           <src_dir>/.build_cache.
+        """
+        self.src_dir = os.path.abspath(src_dir)
+        self.makefile = makefile
+        self.executable = executable
+        if sources is None:
+            sources = []
+            for pattern in SOURCE_PATTERNS:
+                sources += glob.glob(os.path.join(self.src_dir, pattern))
+        self.sources = sorted(os.path.abspath(s) for s in sources)
+        if cache_dir is None:
+            cache_dir = os.path.join(self.src_dir, '.build_cache')
+        self.cache_dir = cache_dir
+        self._key = None
+
+    def key(self):
+        """return the build key (hex SHA-1 digest)"""
+        if self._key is None:
+            makefile = os.path.join(self.src_dir, self.makefile)
+            fc, libs = parse_makefile(makefile)
+            h = hashlib.sha1()
+            for fname in self.sources + [makefile]:
+                h.update(os.path.basename(fname).encode('utf-8'))
+                with open(fname, 'rb') as f:
+                    h.update(f.read())
+            h.update(str(fc).encode('utf-8'))
+            if fc is not None:
+                h.update(compiler_version(fc))
+            for lib in libs:
+                st = os.stat(lib)
+                h.update('{} {} {}'.format(lib, st.st_size,
+                                           int(st.st_mtime)).encode('utf-8'))
+            for var in IOAPI_ENV_VARS:
+                h.update('{}={}'.format(var, os.environ.get(var, ''))
+                         .encode('utf-8'))
+            self._key = h.hexdigest()
+        return self._key
+
+    def executable_path(self):
+        """full path of the cached executable for the current key"""
+        return os.path.join(self.cache_dir, self.key(), self.executable)
+
+    def is_cached(self):
+        return os.path.exists(self.executable_path())
+
+    def build(self, force=False):
+        """return the path of the executable, running make only if no
+        executable is cached for the current build key
+
+        ARGS:
+        force (bool): if True, rebuild even if an executable is cached
+
+        RETURNS:
+        full path of the cached executable
+        """
+        exe = self.executable_path()
+        if self.is_cached() and not force:
+            print('using cached {} (build {})'.format(self.executable,
+                                                      self.key()[:10]))
+            return exe
+        build_dir = os.path.dirname(exe)
+        if not os.path.isdir(build_dir):
+            os.makedirs(build_dir)
+        fname_log = os.path.join(build_dir, 'build.log')
+        print('building {}; log in {}'.format(self.executable, fname_log))
+        # -B: the key changed, so remake every target even if make's
+        # timestamps say it is up to date
+        with open(fname_log, 'w') as log:
+            status = subprocess.call(['make', '-B', '-f', self.makefile],
+                                     cwd=self.src_dir, stdout=log,
+                                     stderr=subprocess.STDOUT)
+        built = os.path.join(self.src_dir, self.executable)
+        if status != 0 or not os.path.exists(built):
+            raise RuntimeError('building {} failed; see {}'.format(
+                self.executable, fname_log))
+        shutil.copy2(built, exe)
+        return exe
+
+
+class FortranRun(object):
+    """one invocation of a Fortran program in its own working directory
+
+    ATTRIBUTES:
+    name (string): name of the run; also the name of its working
+       directory
+    args (list): command line arguments
+    env (dict): environment variables (I/O API logical names) added to
+       the environment of the run.  Relative paths are relative to the
+       run's working directory.
+    workdir (string): working directory (set by run_all)
+    log (string): full path of the run's stdout/stderr log
+    returncode (int): exit status of the program (None until run)
+    """
+
+    def __init__(self, name, args=(), env=None):
+        self.name = name
+        self.args = [str(a) for a in args]
+        self.env = dict(env or {})
+        self.workdir = None
+        self.log = None
+        self.returncode = None
+
+    def path(self, fname):
+        """full path of a file in the run's working directory"""
+        return os.path.join(self.workdir, fname)
+
+    def ok(self):
+        return self.returncode == 0
+
+
+def _run_one(args):
+    exe, run = args
+    env = dict(os.environ)
+    env.update(run.env)
+    # send the I/O API library log to the run's own file as well
+    env.setdefault('LOGFILE', run.path('ioapi.log'))
+    with open(run.log, 'w') as log:
+        run.returncode = subprocess.call([exe] + run.args, cwd=run.workdir,
+                                         env=env, stdout=log,
+                                         stderr=subprocess.STDOUT)
+    return run
+
+
+def run_all(exe, runs, workdir_root, n_procs=1):
+    """run a Fortran program once per FortranRun, each in its own
+    working directory <workdir_root>/<run name>
+
+    ARGS:
+    exe (string): full path of the executable (e.g. from
+       FortranBuild.build)
+    runs (list): FortranRun objects; names must be unique
+    workdir_root (string): directory in which to create the working
+       directories
+    n_procs (int): number of runs to execute at once
+
+    RETURNS:
+    runs, with workdir, log and returncode populated
+    """
+    exe = os.path.abspath(exe)
+    for run in runs:
+        run.workdir = os.path.abspath(os.path.join(workdir_root, run.name))
+        if not os.path.isdir(run.workdir):
+            os.makedirs(run.workdir)
+        run.log = run.path('{}.log'.format(run.name))
+    # threads suffice: each one only waits on its subprocess
+    pool = ThreadPool(max(1, min(n_procs, len(runs))))
+    try:
+        pool.map(_run_one, [(exe, run) for run in runs])
+    finally:
+        pool.close()
+        pool.join()
+    for run in runs:
+        status = 'ok' if run.ok() else 'FAILED ({})'.format(run.returncode)
+        print('{}: {}; log: {}'.format(run.name, status, run.log))
+    return runs
@@ -1,8 +1,5 @@
-import os
-import numpy as np
-from datetime import datetime
-
-from stem_pytools import noaa_ocs
+import noaa_obs_tools
+import data_paths
 
 
 class Consts(object):
@@ -13,60 +10,46 @@ class Consts(object):
 
     fname_griddesc (string): full path to the Models-3 I/O API
         GRIDDESC file describing the STEM domain grid.  Default is
-        $HOME/Code/Regrid/GEOS-Chem_Regrid/GRIDDESC_GC
+        data path griddesc (see data_paths)
     noaa_dir (str): full path to the directory containing NOAA
-        observation files.  Default is $PROJ/Data/NOAA_95244993
-    topo_fname (string): full path to the Models-3 I/O API topography
-        file.  Default is $SARIKA_INPUT/TOPO-124x124.nc
-    wrf_height_fname (string): full path to the Models-3 I/O API WRF height
-        file.  Default is $SARIKA_INPUT/wrfheight-124x124-22levs.nc
+        observation files.  Default is data path noaa_dir
 
     ATTRIBUTES:
 
     fname_griddesc (string): full path to the Models-3 I/O API
         GRIDDESC file describing the STEM domain grid.
     noaa_dir (str): full path to the directory containing NOAA
-        observation files.  Default is $PROJ/Data/NOAA_95244993
+        observation files.
     topo_fname (string): full path to the Models-3 I/O API topography
-        file.  Default is $SARIKA_INPUT/TOPO-124x124.nc
-    wrf_height_fname (string): full path to the Models-3 I/O API WRF height
-        file.  Default is $SARIKA_INPUT/wrfheight-124x124-22levs.nc
+        file (data path topo)
+    wrfheight_fname (string): full path to the Models-3 I/O API WRF
+        height file (data path wrfheight)
     ppt_2_molecules_m3 (real) = conversion factor for converting
         parts per trillion by volume (ppt) to molecules per m^3
     ppt_2_ppbv = conversion factor for converting parts per trillion
         by volume (ppt) to parts per billion by volume (ppbv)
     """
 
-    def __init__(self,
-                 fname_griddesc=os.path.join(os.environ['HOME'],
-                                             'Code', 'Regrid',
-                                             'GEOS-Chem_Regrid',
-                                             'GRIDDESC_GC'),
-                 noaa_dir=os.path.join(
-                     os.getenv('PROJ'), 'Data', 'NOAA_95244993')):
+    def __init__(self, fname_griddesc=None, noaa_dir=None):
+        if fname_griddesc is None:
+            fname_griddesc = data_paths.get_path('griddesc')
+        if noaa_dir is None:
+            noaa_dir = data_paths.get_path('noaa_dir')
         self.fname_griddesc = fname_griddesc
         self.noaa_dir = noaa_dir
-        self.topo_fname = os.path.join(os.getenv('SARIKA_INPUT'),
-                                       'TOPO-124x124.nc')
-        self.wrfheight_fname = os.path.join(os.getenv('SARIKA_INPUT'),
-                                            'wrfheight-124x124-22levs.nc')
+        self.topo_fname = data_paths.get_path('topo')
+        self.wrfheight_fname = data_paths.get_path('wrfheight')
         self.ppt_2_molecules_m3 = 1e-12
         self.ppt_2_ppbv = 1e-3
 
 
-def todate(x):
-    # from
-    # http://stackoverflow.com/questions/29753060/how-to-convert-numpy-datetime64-into-datetime
-    return datetime.fromtimestamp(x.astype('O')/1e9).date()
-
-
-def count_unique_dates(gb):
+def count_unique_dates(obs):
+    """print the number of unique July/August flight days at each site
+    """
+    stats = noaa_obs_tools.site_stats(obs)
     print 'site_code, unique Jul/Aug dates (all)'
-    for this_group in gb:
-        x = list(this_group)[1].datet.values
-        unique_dates = np.unique(map(todate, x))
-
-        print this_group[0], unique_dates.size
+    for site, n in zip(stats.sample_site_code, stats.n_flights_in_months):
+        print site, n
 
 
 def count_flask_samples(df, sites=None):
@@ -87,25 +70,19 @@ def count_flask_samples(df, sites=None):
 def count_mean_samples_per_flight(obs):
     """count the mean number of samples per flight
     """
-    gr = obs.groupby(('sample_site_code', 'sample_year',
-                      'sample_month', 'sample_day'))
+    stats = noaa_obs_tools.site_stats(obs)
+    n_flights = stats.n_flights.sum()
     print 'mean, min, max samples per flight: {}, {}, {}'.format(
-        gr.size().mean(),
-        gr.size().min(),
-        gr.size().max())
-    return gr
+        stats.n_samples.sum() / float(n_flights),
+        stats.samples_per_flight_min.min(),
+        stats.samples_per_flight_max.max())
+    return stats
 
 if __name__ == "__main__":
 
-    sites = noaa_ocs.get_all_NOAA_airborne_data(Consts().noaa_dir)
-    sites.obs.reset_index(inplace=True, drop=True)
-    jul_aug = sites.obs.query('sample_month in [7, 8]')
-    gb = jul_aug.groupby(by=('sample_site_code',))
-    obs_count = gb.size
-    count_unique_dates(gb)
-    gb_dates = count_mean_samples_per_flight(sites.obs)
-    # obs_count = jul_aug.groupby(by=('sample_site_code',)).agg(
-    #     {'sample_site_code': np.size,
-    #      'datet': lambda x: todate(x).date()})
-
+    sites = noaa_obs_tools.load_NOAA_airborne_data(Consts().noaa_dir)
+    stats = noaa_obs_tools.site_stats(sites.obs)
+    print stats.to_string(index=False)
+    count_unique_dates(sites.obs)
+    count_mean_samples_per_flight(sites.obs)
     count_flask_samples(sites.obs)
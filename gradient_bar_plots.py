@@ -9,13 +9,41 @@ import seaborn as sns
 import numpy as np
 
 import spatial_analysis_utilities as sau
-from stem_pytools import noaa_ocs
+import noaa_obs_tools
 from stem_pytools import domain
 from stem_pytools import aqout_postprocess as aq
 from stem_pytools import calc_drawdown
 # from timutils.mpl_fig_joiner import FigJoiner
 import map_grid
 import draw_c3c4LRU_map
+import bootstrap_ci
+import model_labels
+import data_paths
+from stem_run_stack import StemRunStack, RunCatalog, Run, Source
+
+
+def composite_runs():
+    """define the composite STEM runs used in the spatial paper
+
+    RETURNS:
+    list of (key, stem_run_stack.RunExpr) pairs
+    """
+    casa = Run('casa_gfed_161')
+    print(('multiplying Anthro [COS] by 1000 '
+           'as per email from Andrew'))
+    return [('Anthro_Kettle', Source('Anthro_Kettle') * 1e3),
+            ('Anthro_Andrew', Source('Anthro_Andrew') * 1e3),
+            # CASA-GFED plus soil fluxes, anthro fluxes
+            ('CASA-GFED3, Kettle Anthropogenic', casa + Run('Anthro_Kettle')),
+            ('CASA-GFED3, Zumkehr Anthropogenic',
+             casa + Run('Anthro_Andrew')),
+            ('CASA-GFED3, Kettle Fsoil', casa + Run('Fsoil_Kettle')),
+            ('CASA-GFED3, Hybrid Fsoil', casa + Run('Fsoil_Hybrid5Feb'))]
+
+
+def JulAug_drawdown(cos):
+    """reduce daily STEM [COS] to a July-August mean drawdown map"""
+    return map_grid.daily_to_JulAug(calc_drawdown.calc_STEM_COS_drawdown(cos))
 
 
 def get_STEM_cos_conc(cpickle_fname=None, const_bounds_cos=4.5e-10):
@@ -33,48 +61,44 @@ def get_STEM_cos_conc(cpickle_fname=None, const_bounds_cos=4.5e-10):
         boundaries [COS]
     """
     cos_conc_daily = aq.load_aqout_data(cpickle_fname)
-    keys_to_remove = ['casa_gfed_pctm_bnd', 'casa_gfed_KV']
-    for k in keys_to_remove:
-        if k in cos_conc_daily['cos_mean']:
-            del cos_conc_daily['cos_mean'][k]
-            del cos_conc_daily['cos_std'][k]
-            del cos_conc_daily['t'][k]
-
-    print(('multiplying Anthro [COS] by 1000 '
-           'as per email from Andrew'))
-    cos_conc_daily['cos_mean']['Anthro_Kettle'] *= 1e3
-    cos_conc_daily['cos_mean']['Anthro_Andrew'] *= 1e3
-
-    cos_conc_daily['cos_mean']['CASA-GFED3, Kettle Anthropogenic'] = cos_conc_daily['cos_mean']['casa_gfed_161'] + cos_conc_daily['cos_mean']['Anthro_Kettle']
-    cos_conc_daily['cos_mean']['CASA-GFED3, Zumkehr Anthropogenic'] = cos_conc_daily['cos_mean']['casa_gfed_161'] + cos_conc_daily['cos_mean']['Anthro_Andrew']
-
-    # calculate CASA-GFED plus soil fluxes, anthro fluxes
-    cos_conc_daily['cos_mean']['CASA-GFED3, Kettle Anthropogenic'] = (cos_conc_daily['cos_mean']['casa_gfed_161'] +
-                                                    cos_conc_daily['cos_mean']['Anthro_Kettle'])
-    cos_conc_daily['cos_mean']['CASA-GFED3, Zumkehr Anthropogenic'] = (cos_conc_daily['cos_mean']['casa_gfed_161'] +
-                                                     cos_conc_daily['cos_mean']['Anthro_Andrew'])
-    cos_conc_daily['cos_mean']['CASA-GFED3, Kettle Fsoil'] = (cos_conc_daily['cos_mean']['casa_gfed_161'] +
-                                            cos_conc_daily['cos_mean']['Fsoil_Kettle'])
-    cos_conc_daily['cos_mean']['CASA-GFED3, Hybrid Fsoil'] = (cos_conc_daily['cos_mean']['casa_gfed_161'] +
-                                            cos_conc_daily['cos_mean']['Fsoil_Hybrid5Feb'])
-
-    cos_conc_daily['cos_mean'] = calculate_GCbounds_cos(
-        cos_conc_daily['cos_mean'], const_bounds_cos)
 
+    # stack all runs in one memmap; composite runs and the ', clim'
+    # variants are evaluated one at a time as they are reduced
+    runs = calculate_GCbounds_cos(cos_conc_daily['cos_mean'],
+                                  const_bounds_cos,
+                                  exclude=['casa_gfed_pctm_bnd',
+                                           'casa_gfed_KV'])
     # don't need standard devation for this analysis
-    cos_conc = cos_conc_daily['cos_mean']
-    # aggregate daily means to a single July-August mean
-    cos_conc.update((k, calc_drawdown.calc_STEM_COS_drawdown(v)) for
-                    k, v in cos_conc.items())
-    cos_conc.update((k, map_grid.daily_to_JulAug(v))
-                    for k, v in cos_conc.items())
+    del cos_conc_daily
+    with runs:
+        catalog = RunCatalog(runs, derived=composite_runs())
+        # aggregate daily means to a single July-August mean
+        cos_conc = catalog.reduce_all(JulAug_drawdown)
 
     return(cos_conc)
 
 
-def assemble_bar_plot_data(
-    cpickle_fname=os.path.join(os.getenv('HOME'),
-                               'STEM_all_runs.cpickle')):
+def assemble_bar_plot_data(cpickle_fname=None, site_vals=None,
+                           ci_kwargs=None):
+    """return observed and modeled July-August drawdowns at the NOAA
+    sites, one row per site, with bootstrap confidence intervals
+
+    ARGS:
+    cpickle_fname (string): cpickle file of STEM [COS] (see
+       get_STEM_cos_conc); default data path stem_all_runs
+    site_vals (pandas.DataFrame): drawdowns of all model combinations
+       at the sites (e.g. the CSV written by error_bar_framework.py).
+       If given, the ensemble intervals of each Fplant model across
+       its combinations are added (see model_components_ci).
+    ci_kwargs (dict): passed to bootstrap_ci.bootstrap_mean_ci
+
+    RETURNS:
+    pandas.DataFrame indexed by site code with a drawdown column per
+       product (ocs_dd for the observations) and, where available,
+       <column>_ci_lo and <column>_ci_hi
+    """
+    if cpickle_fname is None:
+        cpickle_fname = data_paths.get_path('stem_all_runs')
     noaa_dir = sau.get_noaa_COS_data_path()
     noaa_ocs_dd, ocs_daily = sau.get_JA_site_mean_drawdown(noaa_dir)
 
@@ -96,10 +120,18 @@ def assemble_bar_plot_data(
         noaa_ocs_dd[k] = stem_ocs_dd[k][noaa_ocs_dd['stem_x'],
                                         noaa_ocs_dd['stem_y']]
 
+    # confidence intervals of the observed and modeled drawdowns
+    ci_kwargs = ci_kwargs or {}
+    ci = get_obs_ci(ocs_daily, **ci_kwargs)
+    if site_vals is not None:
+        ci = pd.concat([ci, model_components_ci(site_vals, **ci_kwargs)])
+    noaa_ocs_dd = noaa_ocs_dd.join(site_ci_columns(ci))
+
     return(noaa_ocs_dd)
 
 
-def calculate_GCbounds_cos(stem_ocs_dd, const_bounds=4.5e-10, verbose=False):
+def calculate_GCbounds_cos(stem_ocs_dd, const_bounds=4.5e-10, verbose=False,
+                           exclude=()):
     """Calculate drawdown enhancement or reduction because of dynamic
      boundaries relative to static boundary conditions.  Subtract out
      the 450 ppt static boundary condition from the dynamic
@@ -108,6 +140,11 @@ def calculate_GCbounds_cos(stem_ocs_dd, const_bounds=4.5e-10, verbose=False):
      coupled with no surface COS flux must result in [COS] = 450 ppt
      at all places, times.
 
+     The runs are stacked into a single [model, t, z, x, y] memmap.
+     The dynamic boundaries variant of each run (key "<run>, clim")
+     is not stored; it is computed from the stack when accessed (see
+     stem_run_stack.StemRunStack).
+
     ARGS:
     ocs_conc (dict): dict containing `array-lke
         <http://docs.scipy.org/doc/numpy/user/basics.creation.html#converting-python-array-like-objects-to-numpy-arrays>`_
@@ -116,21 +153,22 @@ def calculate_GCbounds_cos(stem_ocs_dd, const_bounds=4.5e-10, verbose=False):
         (molecules m-3)
     verbose ({False}|True): if True, display message to stdout for
         each stem_ocs_dd field adjusted
+    exclude (sequence): keys of stem_ocs_dd to leave out
+
+    RETURNS:
+    stem_run_stack.StemRunStack containing the runs in stem_ocs_dd
+        and their ", clim" variants.  The stack is backed by a
+        temporary file; close it (or use it in a with block) when
+        done.
     """
-    do_not_adjust = ['sample_latitude', 'sample_longitude', 'analysis_value',
-                     'ocs_dd', 'stem_x', 'stem_y', 'climatological_bnd']
-
-    bounds_runs = {}
-    for k in stem_ocs_dd.keys():
-        if k not in do_not_adjust:
-            key_GC = '{}{}'.format(k, ', clim')
-            data_GC = (stem_ocs_dd[k][0:-1] - const_bounds +
-                       stem_ocs_dd['climatological_bnd'])
-            if verbose:
-                print 'adding {} to dict'.format(key_GC)
-            bounds_runs.update({key_GC: data_GC})
-    stem_ocs_dd.update(bounds_runs)
-    return(stem_ocs_dd)
+    runs = StemRunStack(stem_ocs_dd,
+                        clim_key='climatological_bnd',
+                        const_bounds=const_bounds,
+                        exclude=exclude)
+    if verbose:
+        for key_GC in runs.clim_keys():
+            print 'adding {} to dict'.format(key_GC)
+    return(runs)
 
 
 def normalize_drawdown(ocs_dd,
@@ -144,21 +182,125 @@ def normalize_drawdown(ocs_dd,
     Within each drawdown "product", normalize to the NHA value.  NHA
     is chosen because it is the maximum observed drawdown in the NOAA
     observations.
+
+    All columns in vars are divided by the norm_site row in one
+    broadcast; the other columns are returned unchanged.
     """
+    vals = ocs_dd[vars].values
+    norm = ocs_dd.loc[norm_site, vars].values.astype(float)
     df = ocs_dd.copy()
-    # norm_factor = df['NOAA obs'].values.copy()
-    # warnings.warn(('normalization factor is set to NOAA_obs; the'
-    #                'factor must be *copied* so that when the normalization '
-    #                'site is itself normalized subsequent normalizations '
-    #                'still work.'))
-    for this_var in vars:
-        print('Normalizing {}'.format(this_var))
-        df[this_var] = df[this_var] / ocs_dd[this_var][norm_site]
-        # df[this_var] = df[this_var] / norm_factor
-
+    df[vars] = vals / norm
     return(df)
 
 
+def drawdown_long(ocs_dd, value_vars, norm_site=None,
+                  id_col='sample_site_code'):
+    """reshape site drawdowns to the long format used by draw_box_plot,
+    optionally normalizing to one site.
+
+    Equivalent to normalize_drawdown followed by pd.melt, but builds
+    the long columns directly from the [site, variable] value matrix.
+    Confidence intervals (columns <variable>_ci_lo and
+    <variable>_ci_hi, see site_ci_columns) are carried along, and
+    normalized, as columns ci_lo and ci_hi; NaN where a variable has
+    none.
+
+    ARGS:
+    ocs_dd (pandas.DataFrame): drawdowns indexed by site code, one
+       column per drawdown product
+    value_vars (list): columns to include
+    norm_site (string): if not None, divide each column by its value
+       at this site
+    id_col (string): name of the site column in the output
+
+    RETURNS:
+    pandas.DataFrame with columns id_col, variable, drawdown, ci_lo
+       and ci_hi
+    """
+    vals = ocs_dd[value_vars].values.astype(float)
+    n_sites, n_vars = vals.shape
+    ci = {}
+    for stat in ('ci_lo', 'ci_hi'):
+        ci[stat] = np.full((n_sites, n_vars), np.nan)
+        for j, v in enumerate(value_vars):
+            col = '{}_{}'.format(v, stat)
+            if col in ocs_dd.columns:
+                ci[stat][:, j] = ocs_dd[col].values
+    if norm_site is not None:
+        norm = ocs_dd.loc[norm_site, value_vars].values.astype(float)
+        vals = vals / norm
+        for stat in ci:
+            ci[stat] = ci[stat] / norm
+    return pd.DataFrame({id_col: np.tile(ocs_dd.index.values, n_vars),
+                         'variable': np.repeat(value_vars, n_sites),
+                         'drawdown': vals.ravel(order='F'),
+                         'ci_lo': ci['ci_lo'].ravel(order='F'),
+                         'ci_hi': ci['ci_hi'].ravel(order='F')},
+                        columns=[id_col, 'variable', 'drawdown',
+                                 'ci_lo', 'ci_hi'])
+
+
+def get_obs_ci(ocs_daily, **kwargs):
+    """bootstrap confidence intervals for the observed July-August
+    mean drawdown at each NOAA site
+
+    ARGS:
+    ocs_daily (pandas.DataFrame): daily site drawdowns, as returned
+       by spatial_analysis_utilities.get_JA_site_mean_drawdown
+    **kwargs: passed to bootstrap_ci.bootstrap_mean_ci
+
+    RETURNS:
+    pandas.DataFrame with columns Fplant ('ocs_dd', the observed
+       drawdown column of assemble_bar_plot_data), site, dd, ci_lo,
+       ci_hi and n
+    """
+    ci = bootstrap_ci.grouped_mean_ci(ocs_daily.reset_index(),
+                                      'sample_site_code', 'ocs_dd',
+                                      **kwargs)
+    ci.index.name = 'site'
+    ci = ci.reset_index()
+    ci.insert(0, 'Fplant', 'ocs_dd')
+    return(ci)
+
+
+def model_components_ci(site_vals, **kwargs):
+    """bootstrap confidence intervals for the mean drawdown of each
+    Fplant model at each site, across all Fsoil, Fanthro and boundary
+    combinations run with that Fplant.
+
+    This is an ensemble interval: it belongs to the mean over the
+    combinations (column dd), not to any single run, so it need not
+    bracket the drawdown of the run plotted for that Fplant.
+
+    ARGS:
+    site_vals (pandas.DataFrame): concatenated site_vals of
+       AqoutContainerSpatialPaper objects whose keys are
+       "Fplant-Fsoil-Fanthro[-Fbounds]" (e.g. as written by
+       error_bar_framework.py)
+    **kwargs: passed to bootstrap_ci.bootstrap_mean_ci
+
+    RETURNS:
+    pandas.DataFrame with columns Fplant, site, dd, ci_lo, ci_hi and n
+    """
+    df = site_vals.copy()
+    df['Fplant'] = df['model'].str.split('-').str[0]
+    ci = bootstrap_ci.grouped_mean_ci(df, ['site_code', 'Fplant'], 'dd',
+                                      **kwargs)
+    ci = ci.reset_index().rename(columns={'site_code': 'site'})
+    return(ci[['Fplant', 'site', 'dd', 'ci_lo', 'ci_hi', 'n']])
+
+
+def site_ci_columns(ci):
+    """reshape confidence intervals from get_obs_ci or
+    model_components_ci (one row per Fplant x site) to one row per
+    site with columns <Fplant>_ci_lo and <Fplant>_ci_hi"""
+    wide = ci.pivot(index='site', columns='Fplant',
+                    values=['ci_lo', 'ci_hi'])
+    wide.columns = ['{}_{}'.format(fplant, stat)
+                    for stat, fplant in wide.columns]
+    return(wide)
+
+
 def get_line_styles(df):
     """assign linestyles for gradient plots.  For now, use dashed
     lines for climatological boundaries and solid lines for everything
@@ -173,20 +315,44 @@ def get_line_styles(df):
 
 
 def draw_box_plot(df, sites_list):
+    """draw the drawdown of every variable at sites_list, with error
+    bars where df has confidence intervals (columns ci_lo, ci_hi; see
+    drawdown_long)
+
+    The error bars of the observations are the interval of the site
+    mean.  Those of the models are ensemble intervals across the
+    Fsoil, Fanthro and boundary combinations of each Fplant (see
+    model_components_ci), so they need not bracket the single-run
+    point; the figure says so below the axes.
+    """
     sns.set_style('ticks')
     sns.set_context('paper')
 
+    df_sites = df[df.sample_site_code.isin(sites_list)]
+    palette = sns.color_palette("cubehelix", len(df.variable.unique()))
     g = sns.factorplot(x="sample_site_code",
                        y="drawdown",
                        hue='variable',
-                       data=df[df.sample_site_code.isin(sites_list)],
+                       data=df_sites,
                        kind="point",
-                       palette=sns.color_palette(
-                           "cubehelix",
-                           len(df.variable.unique())),
+                       palette=palette,
                        x_order=sites_list,
                        aspect=1.25,
                        linestyles=get_line_styles(df))
+    if 'ci_lo' in df_sites.columns:
+        for color, var in zip(palette, df.variable.unique()):
+            this_var = df_sites[df_sites.variable == var].set_index(
+                'sample_site_code').reindex(sites_list)
+            g.ax.vlines(np.arange(len(sites_list)),
+                        this_var.ci_lo.values, this_var.ci_hi.values,
+                        colors=[color])
+        if df_sites.ci_lo.notnull().any():
+            g.fig.text(0.01, 0.01,
+                       ('error bars: bootstrap confidence intervals; '
+                        'observations: July-August site mean;\n'
+                        'models: ensemble mean over all Fsoil, Fanthro '
+                        'and boundary combinations of each Fplant'),
+                       fontsize='x-small', va='bottom')
     # make the left and top axes only extend across the part of the
     # plot where the data are.  That is, make the axis look like "| _"
     # and not "L"
@@ -204,37 +370,19 @@ def rename_columns(df):
     seaborn facetgrid object to access and change the legend labels
     and then redrawing the plot.
 
+    The labels come from the model_labels registry (shared with the R
+    plotting scripts); column names are matched exactly.  Confidence
+    interval columns (<column>_ci_lo, <column>_ci_hi) follow their
+    column.
     """
-    columns_dict = {'ocs_dd': 'NOAA obs',
-                    'casa_gfed_161': 'CASA-GFED3, LRU=1.61',
-                    'MPI_C4pctLRU': 'MPI, LRU=C3/C4',
-                    'canibis_161': 'Can-IBIS, LRU=1.61',
-                    'casa_gfed_187': 'CASA-GFED3, LRU=1.87',
-                    'kettle_C4pctLRU': 'Kettle, LRU=C3/C4',
-                    'kettle_161': 'Kettle, LRU=1.61',
-                    'casa_m15_161': 'CASA-m15, LRU=1.61',
-                    'MPI_161': 'MPI, LRU=1.61',
-                    'casa_gfed_C4pctLRU': 'CASA-GFED3, LRU=C3/C4',
-                    'casa_gfed_135': 'CASA-GFED3, LRU=1.35',
-                    'canibis_C4pctLRU': 'Can-IBIS, LRU=C3/C4',
-                    'casa_m15_C4pctLRU': 'CASA-m15, LRU=C3/C4',
-                    'Fsoil_Kettle': 'Kettle Fsoil',
-                    'Fsoil_Hybrid5Feb': 'Hybrid Fsoil',
-                    'GEOSChem_bounds': 'GEOS-Chem boundaries',
-                    'climatological_bnd': 'climatological boundaries',
-                    'SiB_mech': 'SiB, mechanistic canopy',
-                    'SiB_calc': 'SiB, prescribed canopy',
-                    'Anthro_Kettle': 'Anthropogenic, Kettle',
-                    'Anthro_Andrew': 'Anthropogenic, Zumkehr'}
-    df_out = df.copy()
-    for this_col in df_out.columns.values:
-        if this_col in columns_dict.keys():
-            df_out.rename(columns=lambda x: x.replace(this_col,
-                                                      columns_dict[this_col]),
-                          inplace=True)
-            print "replaced {} with {}".format(this_col,
-                                               columns_dict[this_col])
-    return(df_out)
+    columns_dict = model_labels.label_mapping(df.columns.values)
+    for k, v in list(columns_dict.items()):
+        for stat in ('_ci_lo', '_ci_hi'):
+            if k + stat in df.columns:
+                columns_dict[k + stat] = v + stat
+    for this_col, this_label in columns_dict.items():
+        print "replaced {} with {}".format(this_col, this_label)
+    return(df.rename(columns=columns_dict))
 
 
 def draw_gradient_map(gradient_sites_dict):
@@ -242,7 +390,7 @@ def draw_gradient_map(gradient_sites_dict):
     map
     """
     lru_map = draw_c3c4LRU_map.draw_map()
-    site_coords = noaa_ocs.get_all_NOAA_airborne_data(
+    site_coords = noaa_obs_tools.load_NOAA_airborne_data(
         sau.get_noaa_COS_data_path())
     site_coords = site_coords.get_sites_lats_lons()
 
@@ -272,19 +420,15 @@ def draw_gradient_map(gradient_sites_dict):
     return(lru_map)
 
 
-def plot_all_gradients(ocs_dd, plot_vars, fname_suffix):
+def plot_all_gradients(ocs_dd, plot_vars, fname_suffix, norm_site=None):
 
-    ocs_dd_long = pd.melt(ocs_dd.reset_index(),
-                          id_vars=['sample_site_code'],
-                          value_vars=plot_vars,
-                          value_name='drawdown')
+    ocs_dd_long = drawdown_long(ocs_dd, plot_vars, norm_site=norm_site)
 
     figs = []
     g = draw_box_plot(ocs_dd_long, gradients['east_coast'])
     g.ax.set_title('East Coast N -- S (climatological column mean bounds)')
     plt.gcf().savefig(
-        os.path.join(os.getenv('HOME'),
-                     'plots',
+        os.path.join(data_paths.get_path('plot_dir'),
                      'ECoast_model_components_{}_NHAnorm.svg'.format(fname_suffix)))
 
     return g
@@ -301,8 +445,7 @@ def plot_all_gradients(ocs_dd, plot_vars, fname_suffix):
     # # save figs to single svg file
     # fj = FigJoiner(
     #     figs,
-    #     os.path.join(os.getenv('HOME'),
-    #                  'plots',
+    #     os.path.join(data_paths.get_path('plot_dir'),
     #                  'model_components_{}_NHAnorm.svg'.format(fname_suffix)))
     # fj.join()
     # fj.close_figs()
@@ -315,29 +458,15 @@ if __name__ == "__main__":
                      'mid_continent': ['ETL', 'DND', 'LEF', 'WBI',
                                        'BNE', 'SGP', 'TGC']}
 
-        ocs_dd = assemble_bar_plot_data()
+        # drawdowns of all model combinations at the sites, written by
+        # error_bar_framework.py; used for the model error bars
+        fname_site_vals = './model_components_14Apr.csv'
+        site_vals = None
+        if os.path.exists(fname_site_vals):
+            site_vals = pd.read_csv(fname_site_vals)
+        ocs_dd = assemble_bar_plot_data(site_vals=site_vals)
 
         ocs_dd_renamed = rename_columns(ocs_dd)
-        dd_vars = ['NOAA obs', 'GEOS-Chem boundaries',
-                   'climatological boundaries', 'CASA-GFED3, LRU=1.61',
-                   'MPI, LRU=C3/C4', 'Can-IBIS, LRU=1.61',
-                   'CASA-GFED3, LRU=1.87', 'Kettle, LRU=C3/C4',
-                   'Kettle, LRU=1.61',
-                   'SiB, mechanistic canopy', 'SiB, prescribed canopy',
-                   'Hybrid Fsoil',
-                   'CASA-m15, LRU=1.61', 'Kettle Fsoil', 'MPI, LRU=1.61',
-                   'CASA-GFED3, LRU=C3/C4', 'CASA-GFED3, LRU=1.35',
-                   'Can-IBIS, LRU=C3/C4', 'CASA-m15, LRU=C3/C4',
-                   'CASA-GFED3, Kettle Anthropogenic',
-                   'CASA-GFED3, Zumkehr Anthropogenic',
-                   'CASA-GFED3, Kettle Fsoil',
-                   'CASA-GFED3, Hybrid Fsoil']
-        dd_vars_bounds = [''.join([k, ', clim']) for k in dd_vars[2:]
-                          if k is not 'climatological boundaries']
-        dd_vars = dd_vars + dd_vars_bounds
-
-        ocs_dd_norm = normalize_drawdown(ocs_dd_renamed, vars=dd_vars)
-
         vars = ['NOAA obs',
                 'SiB, prescribed canopy',
                 'SiB, mechanistic canopy',
@@ -352,7 +481,8 @@ if __name__ == "__main__":
                 'CASA-GFED3, LRU=1.61, clim',
                 'SiB, mechanistic canopy, clim',
                 'Can-IBIS, LRU=1.61, clim']
-        g = plot_all_gradients(ocs_dd_norm, vars, '02Feb')
+        g = plot_all_gradients(ocs_dd_renamed, vars, '02Feb',
+                               norm_site='NHA')
 
         # # show east coast sites
         # ocs_dd_renamed.ix[['NHA', 'SCA', 'CMA']][['analysis_value', 'NOAA obs']]
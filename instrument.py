@@ -0,0 +1,402 @@
+"""Per-stage timing, I/O and memory instrumentation for the pipeline.
+
+The pipeline's hot paths -- parsing AQOUT files, summing them, the
+drawdown statistics and their standard errors, site extraction,
+netCDF and I/O API writes and map drawing -- are wrapped in stages:
+
+    with instrument.stage('parse', detail=aqc.key):
+        aqc.parse(...)
+
+or, for a whole function or method,
+
+    @instrument.timed('midday_drawdown')
+    def calc_JA_midday_drawdown(self):
+        ...
+
+Each stage that runs while instrumentation is enabled becomes one
+record (see FIELDS): wall and CPU time, megabytes read (all reads, and
+those that reached the disk), peak resident memory, and whether the
+stage finished or raised.  Stages nest; a record's parent is the path
+of the stages enclosing it (e.g. 'process/parse'), and a stage's peak
+memory includes that of its children.
+
+Instrumentation is off unless enabled, and a disabled stage costs one
+function call.  It is enabled by setting $COS_INSTRUMENT to the name
+of the file the records are written to at exit (.csv for CSV, JSON
+otherwise), or by calling configure().  $COS_INSTRUMENT_PROFILE set to
+'cprofile' or 'sampling' (the sampling profiler pyinstrument, if
+installed) also profiles every top-level stage, writing the profiles
+next to the records.
+
+Peak memory is per stage on Linux (the kernel's high water mark is
+reset at the start of each stage through /proc/self/clear_refs);
+elsewhere it is the peak of the process so far.  Bytes read come from
+/proc/self/io and are not available on other systems.
+"""
+
+import os
+import os.path
+import sys
+import csv
+import json
+import time
+import atexit
+import pstats
+import resource
+import cProfile
+import functools
+from collections import OrderedDict
+
+INSTRUMENT_ENV = 'COS_INSTRUMENT'
+PROFILE_ENV = 'COS_INSTRUMENT_PROFILE'
+PROFILERS = ('cprofile', 'sampling')
+FIELDS = ('stage', 'parent', 'detail', 'status', 'start_s', 'wall_s',
+          'cpu_s', 'peak_rss_mb', 'read_mb', 'disk_read_mb', 'note')
+MB = 1024.0 * 1024.0
+
+_recorder = None
+_atexit_registered = False
+
+
+def read_proc_io():
+    """return the I/O counters of this process from /proc/self/io as a
+    dict (empty where /proc/self/io does not exist)"""
+    try:
+        with open('/proc/self/io') as f:
+            return dict((k.strip(), int(v)) for k, v in
+                        (line.split(':') for line in f))
+    except (IOError, OSError):
+        return {}
+
+
+def reset_peak_rss():
+    """reset the kernel's peak resident memory (VmHWM) of this process
+    to its current resident memory.  Returns False where this is not
+    supported (non-Linux, or Linux before 4.0)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def peak_rss_mb():
+    """return the peak resident memory of this process, MB"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except (IOError, OSError):
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on OS X, kilobytes elsewhere
+    return maxrss / (MB if sys.platform == 'darwin' else 1024.0)
+
+
+def cpu_time():
+    """return the CPU time of this process, seconds"""
+    if sys.version_info[0] < 3:
+        return time.clock()
+    return time.process_time()
+
+
+def empty_record(name):
+    """return a record for stage name with all measurements None"""
+    r = OrderedDict((k, None) for k in FIELDS)
+    r['stage'] = name
+    return r
+
+
+class _NullStage(object):
+    """the stage of a disabled Recorder: measures nothing"""
+
+    record = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Stage(object):
+    """context manager measuring one stage; created by Recorder.stage
+
+    An exception raised in the stage is recorded (status 'failed' and
+    the error message in note) and then propagates.
+
+    ATTRIBUTES:
+    record (OrderedDict): the measurements, with keys FIELDS
+    """
+
+    def __init__(self, recorder, name, detail=None):
+        self.recorder = recorder
+        self.record = empty_record(name)
+        self.record['detail'] = detail
+        self._peak = 0.0
+        self._profiler = None
+
+    def __enter__(self):
+        rec = self.recorder
+        r = self.record
+        if rec._stack:
+            parent = rec._stack[-1]
+            r['parent'] = '/'.join(s.record['stage'] for s in rec._stack)
+            # the reset below discards the parent's peak so far
+            parent._peak = max(parent._peak, peak_rss_mb())
+        reset_peak_rss()
+        rec.records.append(r)
+        rec._stack.append(self)
+        self._io0 = read_proc_io()
+        if rec.profile is not None and len(rec._stack) == 1:
+            self._profiler = _start_profiler(rec.profile)
+        self._cpu0 = cpu_time()
+        self._wall0 = time.time()
+        r['start_s'] = round(self._wall0 - rec.t_start, 3)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        wall = time.time() - self._wall0
+        cpu = cpu_time() - self._cpu0
+        rec = self.recorder
+        if self._profiler is not None:
+            _stop_profiler(rec.profile, self._profiler,
+                           rec.profile_fname(self.record))
+        io1 = read_proc_io()
+        rec._stack.pop()
+        r = self.record
+        r['wall_s'] = round(wall, 3)
+        r['cpu_s'] = round(cpu, 3)
+        self._peak = max(self._peak, peak_rss_mb())
+        r['peak_rss_mb'] = round(self._peak, 1)
+        if rec._stack:
+            parent = rec._stack[-1]
+            parent._peak = max(parent._peak, self._peak)
+        if io1 and self._io0:
+            r['read_mb'] = round(
+                (io1['rchar'] - self._io0['rchar']) / MB, 1)
+            r['disk_read_mb'] = round(
+                (io1['read_bytes'] - self._io0['read_bytes']) / MB, 1)
+        if exc_type is None:
+            r['status'] = 'ok'
+        else:
+            r['status'] = 'failed'
+            r['note'] = '{}: {}'.format(exc_type.__name__, exc_value)
+        if rec.verbose:
+            print('{}{} {} ({:0.1f} s)'.format(
+                '  ' * len(rec._stack), r['stage'],
+                'done' if r['status'] == 'ok' else 'failed', wall))
+            sys.stdout.flush()
+        return False
+
+
+def _start_profiler(kind):
+    if kind == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif kind == 'sampling':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError('the sampling profiler needs pyinstrument')
+        profiler = Profiler()
+        profiler.start()
+    else:
+        raise ValueError('profile must be one of {}'.format(PROFILERS))
+    return profiler
+
+
+def _stop_profiler(kind, profiler, fname_base):
+    """stop profiler and write its profile: <fname_base>.prof (binary,
+    for pstats or snakeviz; cProfile only) and <fname_base>_profile.txt
+    (the 30 functions with the highest cumulative time, or the
+    sampling profiler's call tree)"""
+    if kind == 'cprofile':
+        profiler.disable()
+        profiler.dump_stats(fname_base + '.prof')
+        with open(fname_base + '_profile.txt', 'w') as f:
+            pstats.Stats(fname_base + '.prof', stream=f).sort_stats(
+                'cumulative').print_stats(30)
+    else:
+        profiler.stop()
+        with open(fname_base + '_profile.txt', 'w') as f:
+            f.write(profiler.output_text())
+
+
+class Recorder(object):
+    """collects the records of the stages run in this process
+
+    ATTRIBUTES:
+    enabled (bool): if False, stages measure and record nothing
+    fname (string): file the records are written to at exit (None:
+       not written)
+    profile (string): None, or 'cprofile' or 'sampling' to profile
+       every top-level stage
+    profile_dir (string): directory for the profiles
+    verbose (bool): if True, print a line as each stage finishes
+    records (list): one OrderedDict per stage run, in the order the
+       stages started
+    t_start (float): time the recorder was created, seconds since the
+       epoch; start_s of the records is relative to it
+    """
+
+    def __init__(self, enabled=True, fname=None, profile=None,
+                 profile_dir=None, verbose=False):
+        if profile is not None and profile not in PROFILERS:
+            raise ValueError('profile must be one of {}'.format(PROFILERS))
+        self.enabled = enabled
+        self.fname = fname
+        self.profile = profile
+        if profile_dir is None:
+            profile_dir = (os.path.dirname(os.path.abspath(fname))
+                           if fname is not None else '.')
+        self.profile_dir = profile_dir
+        self.verbose = verbose
+        self.records = []
+        self.t_start = time.time()
+        self._stack = []
+
+    def stage(self, name, detail=None):
+        """return a context manager measuring stage name
+
+        ARGS:
+        name (string): name of the stage (e.g. 'parse')
+        detail (string): what the stage works on (e.g. the STEM run
+           key or the file name)
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return Stage(self, name, detail)
+
+    def timed(self, name=None, detail=None):
+        """decorator measuring every call of a function as a stage of
+        this recorder; see the module-level timed"""
+        return _timed(lambda: self, name, detail)
+
+    def profile_fname(self, record):
+        """return the profile file name (without extension) of a
+        top-level stage record"""
+        n = sum(1 for r in self.records if r['parent'] is None)
+        return os.path.join(self.profile_dir, '{:03d}_{}'.format(
+            n, record['stage']))
+
+    def write(self, fname=None, metadata=None):
+        """write the records to fname (default self.fname): CSV if
+        fname ends in .csv, JSON (with metadata) otherwise"""
+        write_records(self.records, fname or self.fname, metadata)
+
+    def print_records(self):
+        print_records(self.records)
+
+
+def _timed(get_recorder, name, detail):
+    def decorator(func):
+        stage_name = func.__name__ if name is None else name
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rec = get_recorder()
+            if not rec.enabled:
+                return func(*args, **kwargs)
+            with rec.stage(stage_name, None if detail is None else
+                           detail(*args, **kwargs)):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def write_records(records, fname, metadata=None):
+    """write stage records to fname: one row per stage if fname ends in
+    .csv, otherwise JSON of the form {"metadata": ..., "stages": [...]}
+    """
+    if fname.endswith('.csv'):
+        with open(fname, 'w') as f:
+            w = csv.DictWriter(f, fieldnames=FIELDS)
+            w.writeheader()
+            w.writerows(records)
+    else:
+        with open(fname, 'w') as f:
+            json.dump(OrderedDict([('metadata', metadata or {}),
+                                   ('stages', records)]), f, indent=2)
+
+
+def print_records(records):
+    """print a table of stage records; nested stages are indented"""
+    cols = ('status', 'wall_s', 'cpu_s', 'peak_rss_mb', 'read_mb',
+            'disk_read_mb')
+    fmt = '{:<30}{:>8}{:>10}{:>10}{:>12}{:>10}{:>10}  {}'
+    print(fmt.format('stage', 'status', 'wall (s)', 'cpu (s)',
+                     'peak (MB)', 'read (MB)', 'disk (MB)', 'detail'))
+    for r in records:
+        depth = 0 if r['parent'] is None else r['parent'].count('/') + 1
+        print(fmt.format('  ' * depth + r['stage'],
+                         *([str(r[k]) if r[k] is not None else '-'
+                            for k in cols] + [r['detail'] or ''])))
+
+
+def configure(fname=None, profile=None, profile_dir=None, verbose=False,
+              enabled=True):
+    """replace the recorder of this process
+
+    ARGS:
+    fname (string): file the records are written to at exit; default
+       $COS_INSTRUMENT.  None: not written.
+    profile (string): 'cprofile' or 'sampling' to profile every
+       top-level stage; default $COS_INSTRUMENT_PROFILE
+    profile_dir (string): directory for the profiles; default the
+       directory of fname
+    verbose (bool): if True, print a line as each stage finishes
+    enabled (bool): if False, stages measure and record nothing
+
+    RETURNS:
+    the new Recorder
+    """
+    global _recorder, _atexit_registered
+    if fname is None:
+        fname = os.getenv(INSTRUMENT_ENV)
+    if profile is None:
+        profile = os.getenv(PROFILE_ENV) or None
+    _recorder = Recorder(enabled=enabled, fname=fname, profile=profile,
+                         profile_dir=profile_dir, verbose=verbose)
+    if not _atexit_registered:
+        atexit.register(_write_at_exit)
+        _atexit_registered = True
+    return _recorder
+
+
+def get_recorder():
+    """return the Recorder of this process, creating it on first use;
+    enabled only if $COS_INSTRUMENT is set"""
+    if _recorder is None:
+        configure(enabled=os.getenv(INSTRUMENT_ENV) is not None)
+    return _recorder
+
+
+def _write_at_exit():
+    rec = _recorder
+    if rec is not None and rec.fname is not None and rec.records:
+        rec.write()
+
+
+def stage(name, detail=None):
+    """return a context manager measuring stage name with the recorder
+    of this process (see Recorder.stage)"""
+    return get_recorder().stage(name, detail)
+
+
+def timed(name=None, detail=None):
+    """decorator measuring every call of a function as a stage of the
+    recorder of this process
+
+    ARGS:
+    name (string): name of the stage; default the function's name
+    detail (callable): called with the function's arguments, returns
+       the detail of the record (e.g. lambda self, *args, **kwargs:
+       self.key)
+    """
+    return _timed(get_recorder, name, detail)
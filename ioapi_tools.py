@@ -0,0 +1,378 @@
+"""Tools to read and write Models-3 I/O API netCDF files directly with
+netCDF4, without going through the I/O API Fortran library or
+creating a "dummy" file to be filled in afterwards.
+
+The file layout (dimensions, TFLAG variable, global attributes)
+follows the I/O API netCDF conventions, so the files written here are
+readable by STEM and by the I/O API library.
+"""
+
+import getpass
+from datetime import datetime, timedelta
+
+import numpy as np
+import netCDF4
+
+import instrument
+
+# file types, from PARMS3.EXT
+GRDDED3 = 1
+BNDARY3 = 2
+# vertical grid types, from PARMS3.EXT
+VGSGPN3 = 2  # non-hydrostatic sigma-P
+
+IOAPI_VERSION = '$Id: @(#) ioapi library version 3.1 $'
+
+
+def parse_griddesc(fname_griddesc, gdnam):
+    """read the parameters of one grid from a Models-3 I/O API
+    GRIDDESC file.
+
+    ARGS:
+    fname_griddesc (string): full path to the GRIDDESC file
+    gdnam (string): name of the grid to read (e.g. 'ARCNAGRID')
+
+    RETURNS:
+    dict with keys GDNAM, GDTYP, P_ALP, P_BET, P_GAM, XCENT, YCENT,
+       XORIG, YORIG, XCELL, YCELL, NCOLS, NROWS, NTHIK
+    """
+    with open(fname_griddesc) as f:
+        lines = [line.split('!')[0].strip() for line in f]
+    lines = [line for line in lines if line]
+
+    # GRIDDESC holds two segments (coordinate systems, then grids),
+    # each a list of name / parameters line pairs terminated by a
+    # blank name ("' '").
+    segments = [[], []]
+    this_segment = 0
+    i = 0
+    while i < len(lines) and this_segment < 2:
+        name = lines[i].strip("'\" ")
+        if name == '':
+            if i > 0:
+                this_segment += 1
+            i += 1
+            continue
+        segments[this_segment].append((name, lines[i + 1].split()))
+        i += 2
+    coord_systems = dict(segments[0])
+    grids = dict(segments[1])
+    if gdnam not in grids:
+        raise KeyError('grid {} not found in {}'.format(gdnam,
+                                                        fname_griddesc))
+    grid_params = grids[gdnam]
+    coord_name = grid_params[0].strip("'\"")
+    coord_params = coord_systems[coord_name]
+    return({'GDNAM': gdnam,
+            'GDTYP': int(coord_params[0]),
+            'P_ALP': float(coord_params[1]),
+            'P_BET': float(coord_params[2]),
+            'P_GAM': float(coord_params[3]),
+            'XCENT': float(coord_params[4]),
+            'YCENT': float(coord_params[5]),
+            'XORIG': float(grid_params[1]),
+            'YORIG': float(grid_params[2]),
+            'XCELL': float(grid_params[3]),
+            'YCELL': float(grid_params[4]),
+            'NCOLS': int(grid_params[5]),
+            'NROWS': int(grid_params[6]),
+            'NTHIK': int(grid_params[7])})
+
+
+def datetime_to_ioapi(t):
+    """convert a datetime.datetime to I/O API (YYYYDDD, HHMMSS) integers"""
+    return (t.year * 1000 + t.timetuple().tm_yday,
+            t.hour * 10000 + t.minute * 100 + t.second)
+
+
+def ioapi_to_datetime(yyyyddd, hhmmss):
+    """convert I/O API (YYYYDDD, HHMMSS) integers to a datetime.datetime"""
+    yyyyddd = int(yyyyddd)
+    hhmmss = int(hhmmss)
+    return (datetime(yyyyddd // 1000, 1, 1) +
+            timedelta(days=(yyyyddd % 1000) - 1,
+                      hours=hhmmss // 10000,
+                      minutes=(hhmmss // 100) % 100,
+                      seconds=hhmmss % 100))
+
+
+def tstep_to_seconds(tstep):
+    """convert an I/O API time step (HHMMSS, hours may exceed 24) to
+    seconds"""
+    tstep = abs(int(tstep))
+    return ((tstep // 10000) * 3600 +
+            ((tstep // 100) % 100) * 60 +
+            tstep % 100)
+
+
+def get_tflag_datetimes(nc):
+    """return the timestamps of an open I/O API netCDF4.Dataset
+
+    ARGS:
+    nc (netCDF4.Dataset): an open I/O API file
+
+    RETURNS:
+    numpy array of datetime64[s] values, one per record in the file
+    """
+    tflag = nc.variables['TFLAG'][:, 0, :]
+    return np.array([ioapi_to_datetime(d, t) for d, t in tflag],
+                    dtype='datetime64[s]')
+
+
+def record_index(t_file, t_req):
+    """return the index of the record of a file containing each
+    requested time (as the I/O API routine CURRSTEP does).  Times
+    before the first record map to the first record.
+
+    ARGS:
+    t_file (array): record timestamps of the file (datetime64), as
+       returned by get_tflag_datetimes
+    t_req (array): requested times (datetime64)
+    """
+    idx = np.searchsorted(t_file, t_req, side='right') - 1
+    return np.maximum(idx, 0)
+
+
+def read_records(var, rec, layer=0):
+    """read one layer of the (sorted) records rec of an I/O API
+    variable with a single read of the spanned slab
+
+    ARGS:
+    var (netCDF4.Variable): [TSTEP, LAY, ROW, COL] variable
+    rec (array): record indices, e.g. from record_index
+    layer (int): zero-based layer index
+
+    RETURNS:
+    float64 array of shape [len(rec), ROW, COL]
+    """
+    r0 = rec.min()
+    slab = np.asarray(var[r0:rec.max() + 1, layer, ...], dtype='f8')
+    return slab[rec - r0]
+
+
+def _pad(s, n):
+    """pad or truncate a string to exactly n characters, as I/O API
+    expects for names, units and descriptions"""
+    return '{:<{n}}'.format(s, n=n)[:n]
+
+
+class IOAPIWriter(object):
+    """write a Models-3 I/O API file in a single pass.
+
+    All variables are declared when the object is created, so the
+    header is complete before any data are written and no "dummy"
+    file has to be reopened and overwritten.  Data may be written one
+    timestep at a time (write_timestep) or all at once (write_var).
+    Used as a context manager, the writes are measured as an
+    'ioapi_write' instrumentation stage.
+    """
+
+    def __init__(self,
+                 fname,
+                 grid,
+                 variables,
+                 ftype=GRDDED3,
+                 nlays=1,
+                 sdate=0,
+                 stime=0,
+                 tstep=0,
+                 fdesc='',
+                 vglvs=None,
+                 vgtop=1.0,
+                 upnam='ioapi_tools',
+                 zlib=True,
+                 complevel=4,
+                 chunk_tsteps=1,
+                 fmt='NETCDF4_CLASSIC'):
+        """create the file and write its header.
+
+        ARGS:
+        fname (string): full path of the file to create.  An existing
+           file of that name is overwritten.
+        grid (dict): grid parameters as returned by parse_griddesc
+        variables (list): list of (name, units, description) tuples,
+           one per variable to be written
+        ftype (int): GRDDED3 for gridded files, BNDARY3 for lateral
+           boundary files
+        nlays (int): number of vertical layers
+        sdate, stime, tstep (int): I/O API start date (YYYYDDD),
+           start time (HHMMSS) and time step (HHMMSS).  tstep=0
+           (default) makes the file time-independent.
+        fdesc (string): file description (FILEDESC attribute)
+        vglvs (array-like): nlays + 1 vertical level boundaries.
+           Default is evenly spaced sigma levels from 1.0 to 0.0.
+        vgtop (float): model top
+        upnam (string): name of the writing program (UPNAM attribute)
+        zlib (bool): if True (default) compress the variables
+        complevel (int): zlib compression level, 1-9
+        chunk_tsteps (int): number of timesteps per netCDF chunk
+        fmt (string): netCDF file format.  Compression requires
+           NETCDF4 or NETCDF4_CLASSIC; use zlib=False and
+           fmt='NETCDF3_CLASSIC' for I/O API builds without netCDF4
+           support.
+        """
+        self.fname = fname
+        self.grid = grid
+        self.ftype = ftype
+        self.nlays = nlays
+        self.sdate = int(sdate)
+        self.stime = int(stime)
+        self.tstep = int(tstep)
+        self.var_names = [v[0] for v in variables]
+        if ftype == BNDARY3:
+            nthik = grid['NTHIK']
+            self.hshape = (2 * nthik * (grid['NCOLS'] + grid['NROWS'] +
+                                        2 * nthik),)
+            hdims = ('PERIM',)
+        else:
+            self.hshape = (grid['NROWS'], grid['NCOLS'])
+            hdims = ('ROW', 'COL')
+        if vglvs is None:
+            vglvs = np.linspace(1.0, 0.0, nlays + 1)
+
+        if fmt.startswith('NETCDF3'):
+            zlib = False
+        self.nc = netCDF4.Dataset(fname, 'w', format=fmt)
+        self.nc.createDimension('TSTEP', None)
+        self.nc.createDimension('DATE-TIME', 2)
+        self.nc.createDimension('LAY', nlays)
+        self.nc.createDimension('VAR', len(variables))
+        for d, n in zip(hdims, self.hshape):
+            self.nc.createDimension(d, n)
+
+        tflag = self.nc.createVariable('TFLAG', 'i4',
+                                       ('TSTEP', 'VAR', 'DATE-TIME'))
+        tflag.units = '<YYYYDDD,HHMMSS>'
+        tflag.long_name = _pad('TFLAG', 16)
+        tflag.var_desc = _pad('Timestep-valid flags:  (1) YYYYDDD or '
+                              '(2) HHMMSS', 80)
+
+        chunks = (chunk_tsteps, nlays) + self.hshape
+        for name, units, desc in variables:
+            if fmt.startswith('NETCDF3'):
+                v = self.nc.createVariable(name, 'f4',
+                                           ('TSTEP', 'LAY') + hdims)
+            else:
+                v = self.nc.createVariable(name, 'f4',
+                                           ('TSTEP', 'LAY') + hdims,
+                                           zlib=zlib,
+                                           complevel=complevel,
+                                           shuffle=zlib,
+                                           chunksizes=chunks)
+            v.long_name = _pad(name, 16)
+            v.units = _pad(units, 16)
+            v.var_desc = _pad(desc, 80)
+
+        now_date, now_time = datetime_to_ioapi(datetime.now())
+        attrs = [('IOAPI_VERSION', IOAPI_VERSION),
+                 ('EXEC_ID', _pad('????????????????', 80)),
+                 ('FTYPE', np.int32(ftype)),
+                 ('CDATE', np.int32(now_date)),
+                 ('CTIME', np.int32(now_time)),
+                 ('WDATE', np.int32(now_date)),
+                 ('WTIME', np.int32(now_time)),
+                 ('SDATE', np.int32(self.sdate)),
+                 ('STIME', np.int32(self.stime)),
+                 ('TSTEP', np.int32(self.tstep)),
+                 ('NTHIK', np.int32(grid['NTHIK'])),
+                 ('NCOLS', np.int32(grid['NCOLS'])),
+                 ('NROWS', np.int32(grid['NROWS'])),
+                 ('NLAYS', np.int32(nlays)),
+                 ('NVARS', np.int32(len(variables))),
+                 ('GDTYP', np.int32(grid['GDTYP'])),
+                 ('P_ALP', np.float64(grid['P_ALP'])),
+                 ('P_BET', np.float64(grid['P_BET'])),
+                 ('P_GAM', np.float64(grid['P_GAM'])),
+                 ('XCENT', np.float64(grid['XCENT'])),
+                 ('YCENT', np.float64(grid['YCENT'])),
+                 ('XORIG', np.float64(grid['XORIG'])),
+                 ('YORIG', np.float64(grid['YORIG'])),
+                 ('XCELL', np.float64(grid['XCELL'])),
+                 ('YCELL', np.float64(grid['YCELL'])),
+                 ('VGTYP', np.int32(VGSGPN3)),
+                 ('VGTOP', np.float32(vgtop)),
+                 ('VGLVS', np.asarray(vglvs, dtype='f4')),
+                 ('GDNAM', _pad(grid['GDNAM'], 16)),
+                 ('UPNAM', _pad(upnam, 16)),
+                 ('VAR-LIST', ''.join([_pad(var_name, 16)
+                                       for var_name in self.var_names])),
+                 ('FILEDESC', _pad(fdesc, 80 * 60)),
+                 ('HISTORY', 'created {} by {}'.format(
+                     datetime.now().isoformat(), getpass.getuser()))]
+        for k, v in attrs:
+            self.nc.setncattr(k, v)
+
+    def tflag(self, t_idx):
+        """return the I/O API (YYYYDDD, HHMMSS) timestamp of record
+        t_idx"""
+        if self.tstep == 0:
+            return (self.sdate, self.stime)
+        t = (ioapi_to_datetime(self.sdate, self.stime) +
+             timedelta(seconds=t_idx * tstep_to_seconds(self.tstep)))
+        return datetime_to_ioapi(t)
+
+    def _write_tflag(self, t0, nt):
+        stamps = np.array([self.tflag(t) for t in range(t0, t0 + nt)],
+                          dtype='i4')
+        self.nc.variables['TFLAG'][t0:t0 + nt, ...] = np.repeat(
+            stamps[:, np.newaxis, :], len(self.var_names), axis=1)
+
+    def write_timestep(self, t_idx, data):
+        """write one record for every variable
+
+        ARGS:
+        t_idx (int): zero-based record index
+        data (dict): variable name -> array of shape [nlays, hshape],
+           or any shape broadcastable to it
+        """
+        for name in self.var_names:
+            self.nc.variables[name][t_idx, ...] = np.broadcast_to(
+                data[name], (self.nlays,) + self.hshape)
+        self._write_tflag(t_idx, 1)
+
+    def write_var(self, name, data, t0=0):
+        """write a block of records for one variable
+
+        ARGS:
+        name (string): variable name
+        data (array-like): array of shape [nt, nlays, hshape]
+        t0 (int): zero-based index of the first record in data
+        """
+        nt = data.shape[0]
+        self.nc.variables[name][t0:t0 + nt, ...] = data
+        self._write_tflag(t0, nt)
+
+    def close(self):
+        self.nc.close()
+
+    def __enter__(self):
+        self._stage = instrument.stage('ioapi_write', detail=self.fname)
+        self._stage.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        try:
+            self.close()
+        finally:
+            self._stage.__exit__(*args)
+
+
+def write_ioapi(fname, grid, data, units, desc, **kwargs):
+    """write a complete I/O API file from in-memory arrays in one call.
+
+    ARGS:
+    fname (string): full path of the file to create
+    grid (dict): grid parameters as returned by parse_griddesc
+    data (dict): variable name -> array of shape [nt, nlays, hshape]
+    units (dict): variable name -> units string
+    desc (dict): variable name -> description string
+    **kwargs: passed on to IOAPIWriter (ftype, sdate, stime, tstep,
+       fdesc, zlib, ...)
+    """
+    names = sorted(data.keys())
+    nlays = data[names[0]].shape[1]
+    with IOAPIWriter(fname, grid,
+                     [(k, units[k], desc[k]) for k in names],
+                     nlays=nlays, **kwargs) as w:
+        for k in names:
+            w.write_var(k, data[k])
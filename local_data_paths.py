@@ -0,0 +1,162 @@
+"""Local stand-in for stem_pytools.NERSC_data_paths.
+
+NERSC_data_paths.get_runs() and its relatives return a dict of STEM run
+key -> run object giving the paths of that run's AQOUT, GPP and fCOS
+files on NERSC.  The functions here return the same structure, read
+from a run registry: a JSON file listing the runs, so the pipeline can
+run against files anywhere -- synthetic inputs written by
+synthetic_data.write_fixture, or local copies of the real data.
+
+The registry looks like
+
+    {"runs": {"casa_gfed_161": {"model": "CASA-GFED3",
+                                "aqout_path": "runs/casa_gfed_161/...",
+                                "gpp_path": ...,
+                                "gppraw_path": ...,
+                                "fcos_path": ...,
+                                "groups": ["spatial_paper", "C3C4"]},
+              ...}}
+
+Relative paths are relative to the directory of the registry file.
+The groups of a run say which of the NERSC_data_paths run lists
+(get_Spatial_Paper_runs, get_C3C4runs, get_BASC_runs) it belongs to.
+
+The registry file is given explicitly or by $STEM_RUNS_REGISTRY.  Each
+file is parsed once per process.
+"""
+
+import os
+import os.path
+import json
+from collections import OrderedDict
+
+REGISTRY_ENV = 'STEM_RUNS_REGISTRY'
+REGISTRY_NAME = 'stem_runs.json'
+PATH_ATTRS = ('aqout_path', 'gpp_path', 'gppraw_path', 'fcos_path')
+
+_registry_cache = {}
+
+
+class STEMRun(object):
+    """paths of the files of one STEM run; same attributes as the run
+    objects of stem_pytools.NERSC_data_paths
+
+    ATTRIBUTES:
+    model (string): name of the flux model of the run
+    aqout_path, gpp_path, gppraw_path, fcos_path (string): full paths
+       of the run's files; None if the run has no such file
+    groups (list): names of the run lists the run belongs to
+    """
+
+    def __init__(self, model, aqout_path=None, gpp_path=None,
+                 gppraw_path=None, fcos_path=None, groups=()):
+        self.model = model
+        self.aqout_path = aqout_path
+        self.gpp_path = gpp_path
+        self.gppraw_path = gppraw_path
+        self.fcos_path = fcos_path
+        self.groups = list(groups)
+
+    def to_dict(self, root=None):
+        """return the run as a registry entry; paths under root are
+        written relative to root"""
+        d = OrderedDict([('model', self.model)])
+        for attr in PATH_ATTRS:
+            path = getattr(self, attr)
+            if path is not None and root is not None:
+                rel = os.path.relpath(path, root)
+                if not rel.startswith(os.pardir):
+                    path = rel
+            d[attr] = path
+        d['groups'] = self.groups
+        return d
+
+    @classmethod
+    def from_dict(cls, d, root):
+        """create a STEMRun from a registry entry; relative paths are
+        taken relative to root"""
+        paths = {}
+        for attr in PATH_ATTRS:
+            path = d.get(attr)
+            if path is not None:
+                path = os.path.join(root, os.path.expandvars(path))
+            paths[attr] = path
+        return cls(d['model'], groups=d.get('groups', ()), **paths)
+
+    def __repr__(self):
+        return 'STEMRun({!r})'.format(self.model)
+
+
+def registry_path(fname=None):
+    """return the full path of the run registry: fname, or
+    $STEM_RUNS_REGISTRY if fname is None"""
+    if fname is None:
+        fname = os.getenv(REGISTRY_ENV)
+        if fname is None:
+            raise KeyError('no run registry given and ${} is not '
+                           'set'.format(REGISTRY_ENV))
+    return os.path.abspath(fname)
+
+
+def write_registry(fname, runs):
+    """write a run registry
+
+    ARGS:
+    fname (string): full path of the JSON file to write
+    runs (dict): run key -> STEMRun
+    """
+    root = os.path.dirname(os.path.abspath(fname))
+    with open(fname, 'w') as f:
+        json.dump({'runs': OrderedDict((k, v.to_dict(root))
+                                       for k, v in runs.items())},
+                  f, indent=2)
+    _registry_cache.pop(os.path.abspath(fname), None)
+
+
+def read_registry(fname=None):
+    """return all runs of a registry as an OrderedDict of run key ->
+    STEMRun.  The file is parsed once per process; rewriting it
+    (write_registry, or a new modification time) invalidates the
+    cached copy."""
+    fname = registry_path(fname)
+    mtime = os.path.getmtime(fname)
+    cached = _registry_cache.get(fname)
+    if cached is None or cached[0] != mtime:
+        with open(fname) as f:
+            entries = json.load(f, object_pairs_hook=OrderedDict)['runs']
+        root = os.path.dirname(fname)
+        runs = OrderedDict((k, STEMRun.from_dict(v, root))
+                           for k, v in entries.items())
+        cached = (mtime, runs)
+        _registry_cache[fname] = cached
+    # callers may modify the dict; the runs themselves are shared
+    return OrderedDict(cached[1])
+
+
+def get_runs(fname=None):
+    """return all runs of the registry (NERSC_data_paths.get_runs)"""
+    return read_registry(fname)
+
+
+def get_group(group, fname=None):
+    """return the runs of the registry that belong to group"""
+    return OrderedDict((k, v) for k, v in read_registry(fname).items()
+                       if group in v.groups)
+
+
+def get_Spatial_Paper_runs(fname=None):
+    """return the runs of the spatial paper
+    (NERSC_data_paths.get_Spatial_Paper_runs)"""
+    return get_group('spatial_paper', fname)
+
+
+def get_C3C4runs(fname=None):
+    """return the runs with C4 percentage-based LRU
+    (NERSC_data_paths.get_C3C4runs)"""
+    return get_group('C3C4', fname)
+
+
+def get_BASC_runs(fname=None):
+    """return the runs of the BASC presentation
+    (NERSC_data_paths.get_BASC_runs)"""
+    return get_group('BASC', fname)
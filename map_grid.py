@@ -7,7 +7,6 @@ import os.path
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 from datetime import datetime
-import socket
 import numpy as np
 import warnings
 from mpl_toolkits.basemap import maskoceans
@@ -20,6 +19,10 @@ from stem_pytools.na_map import NAMapFigure
 from stem_pytools import calc_drawdown
 from timutils import colormap_nlevs
 
+import time_integrator
+import data_paths
+import instrument
+
 
 def colorbar_from_cmap_norm(cmap, norm, cax, format, vals):
     """
@@ -58,7 +61,8 @@ def get_JulAug_total_flux(which_flux='GPP', models=None):
     model runs specified by models input parameter.  Units are
     petagrams C m-2 for GPP; picomoles m-2 for fCOS.
     """
-    Jul1 = datetime(2008, 7, 1)
+    JulAug = time_integrator.JULAUG_2008
+    Jul1 = JulAug.t0
     Aug31 = datetime(2008, 8, 31, 23, 59, 59)
 
     runs = ndp.get_runs()
@@ -79,24 +83,6 @@ def get_JulAug_total_flux(which_flux='GPP', models=None):
         t0 = Jul1
         t1 = Aug31
 
-        if 'canibis' in k:
-            # Can-IBIS timestep is monthly; calculate seconds per month
-            s_per_tstep = 60 * 60 * 24 * (365 / 12)
-        elif 'SiB' in k:
-            # SiB timestep is hourly; calculate seconds per hour
-            s_per_tstep = 60 * 60
-        elif 'casa' in k:
-            # CASA-GFED3 timestep is hourly; calculate seconds per 3 hours
-            s_per_tstep = 3 * 60 * 60
-        elif k == 'Fsoil_Kettle':
-            # kettle soil fluxes are daily
-            s_per_tstep = 60 * 60 * 24
-        elif k == 'Fsoil_Hybrid5Feb':
-            # Whelan soil fluxes are 6-hourly
-            s_per_tstep = 60 * 60 * 6
-        else:
-            raise ValueError('don''t have timestep for {}'.format(k))
-
         if which_flux is 'GPP':
             gross_flux_varname = sp.get_CO2grossflux_varname(runs[k].gpp_path)
             print 'reading ', runs[k].gpp_path
@@ -108,12 +94,14 @@ def get_JulAug_total_flux(which_flux='GPP', models=None):
             print 'mean GPP before units convert {} min: {}, max {}'.format(
                 k, gpp_mean.min(), gpp_mean.max())
 
+            flux_fname = runs[k].gpp_path
             if 'SiB' in k:
                 # SiB units are mol m-2 s-1; convert mol to umol now
-                flux['data'] = flux['data'] * umol_per_mol
+                flux_scale = umol_per_mol
             else:
                 # convert GPP from Kg C m-2 s-1 to umol m-2 s-1
-                flux['data'] = flux['data'] * C_umol_per_kg
+                flux_scale = C_umol_per_kg
+            flux['data'] = flux['data'] * flux_scale
             gpp_mean = flux['data'].mean(axis=0).squeeze()
             print 'mean GPP after units convert {} min: {}, max {}'.format(
                 k, gpp_mean.min(), gpp_mean.max())
@@ -127,27 +115,36 @@ def get_JulAug_total_flux(which_flux='GPP', models=None):
                                      t1=t1)
             # convert fCOS from mol m-2 s-1 to pmol m-2 s-1
             pmol_per_mol = 1e12
-            flux['data'] = flux['data'] * pmol_per_mol
+            flux_fname = runs[k].fcos_path
+            flux_scale = pmol_per_mol
+            flux['data'] = flux['data'] * flux_scale
             print('model: {}; mean fCOS: {}\n'.format(k,
                                                       np.mean(flux['data'])))
 
         flux_mean[k] = flux['data'].squeeze().mean(axis=0)
         # flux_mean[k] = ma.masked_less(flux_mean[k], -1e20)
-        # calculate total flux in Pg C month-1
+        # calculate total flux in Pg C month-1.  Each record is
+        # weighted by its length from the file timestamps, so monthly,
+        # daily and sub-daily products need no per-model time step.
+        # The file is read from the record containing 1 July: monthly
+        # fCOS records start on the 30th, so the first July record
+        # starts in June.
         m2_per_cell = 6e4 * 6e4  # STEM cells are 60 km per side
-        months_in_analysis = 2
+        flux_itgd = (time_integrator.integrate_ioapi(
+            flux_fname, gross_flux_varname, [JulAug]).per_month()[
+                JulAug.name] * flux_scale)
 
-        flux_total[k] = (flux['data'].squeeze().sum(axis=0) *
-                         s_per_tstep *
+        flux_total[k] = (flux_itgd *
                          m2_per_cell *
                          (1.0 / C_umol_per_kg) *
-                         Pg_per_kg *
-                         (1.0 / months_in_analysis))
+                         Pg_per_kg)
 
         if flux_mean[k].sum() < 0:
             flux_mean[k] = flux_mean[k] * -1.0
     return (flux_mean, flux_total)
 
+
+@instrument.timed('map_draw', detail=lambda t_str, *args, **kwargs: t_str)
 def draw_map(t_str,
              ax,
              data,
@@ -166,8 +163,7 @@ def draw_map(t_str,
                       mapwidth=5.8e6,
                       mapheight=5.2e6)
 
-    lon, lat, topo = sp.parse_STEM_coordinates(
-        os.path.join(os.getenv('SARIKA_INPUT'), 'TOPO-124x124.nc'))
+    lon, lat, topo = sp.parse_STEM_coordinates(data_paths.get_path('topo'))
 
     if maskoceans_switch:
         data = maskoceans(lon, lat, data, inlands=False, resolution='f')
@@ -431,12 +427,7 @@ def write_NA_totals(gpp, fCOS):
 def map_grid_main(models=None, models_str=None, aqout_data=None):
 
     if aqout_data is None:
-        if 'Timothys-MacBook-Air.local' in socket.gethostname():
-            aqout_data = (os.path.join(os.getenv('HOME'), 'work', 'Data',
-                                       'STEM', 'aq_out_data.cpickle'))
-        else:
-            aqout_data = os.path.join(os.getenv('HOME'),
-                                      'STEM_all_runs.cpickle')
+        aqout_data = data_paths.get_path('stem_all_runs')
 
     cos_dd, gpp_mean, fCOS, gpp_total, fCOS_total = assemble_data(
         aqout_data, models=models)
@@ -456,5 +447,5 @@ if __name__ == "__main__":
         models_str=['SiB - mechanistic', 'SiB',
                     'Can-IBIS', 'Can-IBIS',
                     'CASA-GFED3', 'CASA-GFED3'])
-    fig.savefig(os.path.join(os.getenv('SCRATCH'),
+    fig.savefig(os.path.join(data_paths.get_path('output_dir'),
                              'GPP_Fplant_maps_fig.pdf'))
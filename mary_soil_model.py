@@ -12,19 +12,73 @@ from timutils import midpt_norm, scinot_format
 from stem_pytools import STEM_parsers as sp
 from stem_pytools import na_map
 
+import ioapi_tools
+import time_integrator
+import data_paths
+from soil_flux_constants import WHELAN_FSOIL_COEFS, WHELAN_TSOIL_MIN
 
-def draw_crop_pct(fname_crop_pct, map_obj, mask = None):
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+
+def as_nan_array(x):
+    """return x as a float array with masked values replaced by NaN
+    (no copy if x is already an unmasked float array)"""
+    if ma.isMaskedArray(x):
+        return ma.filled(x.astype(float), np.nan)
+    return np.asarray(x, dtype=float)
+
+
+class LandMask(object):
+    """STEM grid coordinates and land/ocean mask, computed once and
+    shared by all the soil flux comparison maps.
+
+    Invalid values are carried as NaN in plain float arrays rather
+    than as masked arrays; the ocean mask is a precomputed boolean
+    array.
+
+    ATTRIBUTES:
+    lon, lat: STEM grid cell longitudes and latitudes
+    ocean: boolean array, True for ocean cells
+    """
+
+    def __init__(self, fname_topo=None):
+        if fname_topo is None:
+            fname_topo = data_paths.get_path('topo')
+        self.lon, self.lat, topo = sp.parse_STEM_coordinates(fname_topo)
+        self.ocean = ma.getmaskarray(
+            maskoceans(self.lon, self.lat, np.zeros(self.lon.shape)))
+
+    def apply(self, x):
+        """return x as a float array with NaN over the ocean and
+        wherever x is masked or invalid"""
+        return np.where(self.ocean, np.nan, as_nan_array(x))
+
+
+_land_mask = None
+
+
+def get_land_mask():
+    """return the shared LandMask, creating it on first use"""
+    global _land_mask
+    if _land_mask is None:
+        _land_mask = LandMask()
+    return _land_mask
+
+
+def draw_crop_pct(fname_crop_pct, map_obj, mask=None, land=None):
     nc = netCDF4.Dataset(fname_crop_pct)
-    pct = nc.variables['crop_pct'][...].squeeze()
+    pct = as_nan_array(nc.variables['crop_pct'][...]).squeeze()
     nc.close()
 
     if mask is not None:
-        pct = ma.masked_where(mask, pct)
+        pct[mask] = np.nan
 
     # pct = sp.parse_STEM_var(fname_crop_pct, varname='crop_pct')
-    lon, lat, topo = sp.parse_STEM_coordinates(
-        os.path.join(os.environ['SARIKA_INPUT'], 'TOPO-124x124.nc'))
-    cm = map_obj.map.pcolormesh(lon, lat, pct,
+    land = land or get_land_mask()
+    cm = map_obj.map.pcolormesh(land.lon, land.lat, pct,
                                 cmap=plt.get_cmap('Blues'),
                                 vmin=0.0,
                                 vmax=1.0,
@@ -33,30 +87,29 @@ def draw_crop_pct(fname_crop_pct, map_obj, mask = None):
     cb.solids.set_edgecolor("face")
 
 
-def get_hybrid_fsoil(fname_hybrid_fsoil):
-    fsoil_JA = sp.parse_STEM_var(fname_hybrid_fsoil,
-                                 t0=datetime(2008, 7, 1),
-                                 t1=datetime(2008, 8, 31,
-                                             23, 59, 59),
-                                 varname='fsoil')
-    s_per_tstamp = 6 * 60 * 60  # six hours expressed as seconds
+def get_hybrid_fsoil(fname_hybrid_fsoil,
+                     window=time_integrator.JULAUG_2008):
+    """integrate hybrid soil COS flux [pmol m-2 s-1] over a time window
+
+    OUTPUTS:
+       fsoil_itgd: soil COS flux [mol m-2 mon-1]
+    """
     mol_per_pmol = 1e-12
-    n_months = 2
-    fsoil_itgd = np.sum(fsoil_JA['data'] * mol_per_pmol * s_per_tstamp,
-                        axis=0) / n_months
-    return(fsoil_itgd.squeeze())
+    itgr = time_integrator.integrate_ioapi(fname_hybrid_fsoil, 'fsoil',
+                                           [window])
+    return(itgr.per_month()[window.name] * mol_per_pmol)
 
 
 def get_WRF_Tsoil_VWC(fname_wrf):
-    """obtain WRF soil T and soil moisture.  soil T is masked below 10 C
-    because Mary's soil flux model fitting data went no lower..
+    """obtain WRF soil T and soil moisture.  soil T is set to NaN below
+    10 C because Mary's soil flux model fitting data went no lower..
     """
 
     vwc = sp.parse_STEM_var(nc_fname=fname_wrf, varname='SMOIS')
     Tsoil = sp.parse_STEM_var(nc_fname=fname_wrf, varname='TSOIL')
 
-    ten_C = 273.15 + 10  # 10 C expressed in Kelvins
-    Tsoil['data'] = ma.masked_less(Tsoil['data'], ten_C)
+    Tsoil['data'] = as_nan_array(Tsoil['data'])
+    Tsoil['data'][Tsoil['data'] < WHELAN_TSOIL_MIN] = np.nan
 
     return(vwc, Tsoil)
 
@@ -73,54 +126,161 @@ def calc_fsoil(vwc, Tsoil):
        fsoil: soil COS flux [pmol/m2/sec]
     """
 
-    fsoil = (vwc * -28.77873448 + (Tsoil * 0.88867741) - 252.76497309)
+    fsoil = (vwc * WHELAN_FSOIL_COEFS['vwc'] +
+             (Tsoil * WHELAN_FSOIL_COEFS['Tsoil']) +
+             WHELAN_FSOIL_COEFS['intercept'])
 
     return(fsoil)
 
 
-def integrate_mary_fsoil(fsoil, s_per_tstamp):
+def integrate_mary_fsoil(fsoil, s_per_tstamp, t0=datetime(2008, 7, 1),
+                         window=time_integrator.JULAUG_2008):
+    """
+    convert COS flux from pmol m-2 s-1 to mol m-2 mon-1 over a time
+    window
+
+    INPUTS
+       fsoil: [time, ...] soil COS flux [pmol m-2 s-1]; NaN (or
+          masked) values are excluded
+       s_per_tstamp: seconds per time step
+       t0: time of the first time step
+       window: time_integrator.TimeWindow to integrate over
+    """
+    mol_per_pmol = 1e-12
+    times = (np.datetime64(t0, 's') +
+             np.arange(fsoil.shape[0]) * np.timedelta64(int(s_per_tstamp),
+                                                        's'))
+    itgr = time_integrator.integrate(fsoil, times, [window],
+                                     tstep_seconds=s_per_tstamp)
+    fsoil_itgd = itgr.per_month()[window.name] * mol_per_pmol
+    return(fsoil_itgd.squeeze())
+
+
+def _fsoil_chunk(vwc, Tsoil, coefs, Tmin):
+    """evaluate Mary's soil flux model for one chunk of WRF data,
+    overwriting vwc with fsoil (pmol/m2/sec; 0.0 where Tsoil < Tmin).
+    Returns (fsoil, boolean array of valid values)."""
+    valid = Tsoil >= Tmin
+    if numexpr is not None:
+        numexpr.evaluate('where(valid, vwc * a + Tsoil * b + c, 0.0)',
+                         local_dict={'valid': valid, 'vwc': vwc,
+                                     'Tsoil': Tsoil,
+                                     'a': coefs['vwc'],
+                                     'b': coefs['Tsoil'],
+                                     'c': coefs['intercept']},
+                         out=vwc, casting='same_kind')
+    else:
+        vwc *= coefs['vwc']
+        vwc += coefs['intercept']
+        Tsoil *= coefs['Tsoil']
+        vwc += Tsoil
+        vwc[~valid] = 0.0
+    return(vwc, valid)
+
+
+def stream_mary_fsoil_windows(fname_wrf, windows, s_per_tstamp=None,
+                              chunk_tsteps=24,
+                              coefs=WHELAN_FSOIL_COEFS,
+                              Tmin=WHELAN_TSOIL_MIN):
+    """integrate Mary Whelan's soil flux model over many time windows
+    with one pass over the WRF soil temperature and moisture.
+
+    INPUTS
+       fname_wrf: full path to the Models-3 I/O API file containing
+          WRF SMOIS [fraction] and TSOIL [K]
+       windows: list of time_integrator.TimeWindow objects
+       s_per_tstamp: seconds per file time step; default is the file's
+          TSTEP
+       chunk_tsteps: number of time steps read at once
+       coefs: soil flux model coefficients; see WHELAN_FSOIL_COEFS
+       Tmin: soil temperatures [K] below this are excluded from the
+          integrals
+
+    OUTPUTS:
+       itgr: time_integrator.TimeIntegrator of fsoil [pmol m-2 s-1]
+          with all time steps added
     """
-    convert COS flux from pmol m-2 s-1 to mol m-2
+    nc = netCDF4.Dataset(fname_wrf, 'r')
+    try:
+        nc.set_auto_mask(False)
+        if s_per_tstamp is None:
+            s_per_tstamp = ioapi_tools.tstep_to_seconds(nc.TSTEP)
+        itgr = time_integrator.TimeIntegrator(
+            ioapi_tools.get_tflag_datetimes(nc), windows,
+            tstep_seconds=s_per_tstamp)
+        v_vwc = nc.variables['SMOIS']
+        v_T = nc.variables['TSOIL']
+        nt = v_vwc.shape[0]
+        for t0 in range(0, nt, chunk_tsteps):
+            t1 = min(t0 + chunk_tsteps, nt)
+            vwc = np.asarray(v_vwc[t0:t1], dtype=float)
+            Tsoil = np.asarray(v_T[t0:t1], dtype=float)
+            fsoil, valid = _fsoil_chunk(vwc, Tsoil, coefs, Tmin)
+            itgr.add(fsoil, valid=valid)
+    finally:
+        nc.close()
+    return(itgr)
+
+
+def stream_mary_fsoil_integral(fname_wrf, s_per_tstamp,
+                               chunk_tsteps=24,
+                               coefs=WHELAN_FSOIL_COEFS,
+                               Tmin=WHELAN_TSOIL_MIN,
+                               window=time_integrator.JULAUG_2008):
+    """calculate the monthly mean integrated July-August soil COS flux
+    from Mary Whelan's soil flux model, reading the WRF soil
+    temperature and moisture in time chunks.
+
+    Gives the same result as get_WRF_Tsoil_VWC, calc_fsoil and
+    integrate_mary_fsoil, but only one chunk of SMOIS, TSOIL and
+    fsoil is in memory at a time.  The model is evaluated in place
+    (fused with numexpr if it is installed) and the time integral is
+    accumulated chunk by chunk.
+
+    INPUTS
+       fname_wrf: full path to the Models-3 I/O API file containing
+          WRF SMOIS [fraction] and TSOIL [K]
+       s_per_tstamp: seconds per file time step
+       chunk_tsteps: number of time steps read at once
+       coefs: soil flux model coefficients; see WHELAN_FSOIL_COEFS
+       Tmin: soil temperatures [K] below this are excluded from the
+          integral
+       window: time_integrator.TimeWindow to integrate over
+
+    OUTPUTS:
+       fsoil_itgd: soil COS flux [mol m-2 mon-1]; NaN where
+          Tsoil < Tmin at every time step
     """
     mol_per_pmol = 1e-12
-    n_months = 2  # July and Aug
-
-    fsoil_itgd = np.sum(fsoil * mol_per_pmol * s_per_tstamp,
-                        axis=0)
-    fsoil_itgd = (fsoil_itgd / n_months).squeeze()
-    return(fsoil_itgd)
-
-
-def get_kettle_soil(fname_kettle_fcos):
-    s_per_tstamp = 60 * 60 * 24  # one day expressed as seconds
-    n_months = 2  # July and Aug
-    fsoil_k = sp.parse_STEM_var(fname_kettle_fcos,
-                                t0=datetime(2008, 7, 1),
-                                t1=datetime(2008, 8, 31, 23, 59, 59),
-                                varname='cos')
-
-    fsoil_k['data'] = ma.masked_invalid(fsoil_k['data'])
-    # convert mol m-2 s-1 to mol m-2 mon-1
-    fsoil_k_itgd = np.sum(fsoil_k['data'] * s_per_tstamp, axis=0)
-    fsoil_k_itgd = (fsoil_k_itgd / n_months).squeeze()
-    return(fsoil_k_itgd)
-
-
-def calc_ratio(fsoil_mary, fsoil_kettle):
-    lon, lat, topo = sp.parse_STEM_coordinates(
-        os.path.join(os.environ['SARIKA_INPUT'], 'TOPO-124x124.nc'))
-    fsoil_mary = maskoceans(lon, lat, fsoil_mary)
-    fsoil_kettle = maskoceans(lon, lat, fsoil_kettle)
-    ratio = ma.masked_invalid(fsoil_kettle) / ma.masked_invalid(fsoil_mary)
+    itgr = stream_mary_fsoil_windows(fname_wrf, [window], s_per_tstamp,
+                                     chunk_tsteps, coefs, Tmin)
+    fsoil_itgd = itgr.per_month()[window.name] * mol_per_pmol
+    return(fsoil_itgd.squeeze())
+
+
+def get_kettle_soil(fname_kettle_fcos, window=time_integrator.JULAUG_2008):
+    """integrate Kettle soil COS flux over a time window; converts mol
+    m-2 s-1 to mol m-2 mon-1"""
+    itgr = time_integrator.integrate_ioapi(fname_kettle_fcos, 'cos',
+                                           [window])
+    return(itgr.per_month()[window.name])
+
+
+def calc_ratio(fsoil_mary, fsoil_kettle, land=None):
+    """return fsoil_kettle / fsoil_mary over land; NaN over the ocean
+    and wherever either flux is invalid or the ratio is infinite"""
+    land = land or get_land_mask()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = land.apply(fsoil_kettle) / as_nan_array(fsoil_mary)
+    ratio[~np.isfinite(ratio)] = np.nan
     return(ratio)
 
 
-def draw_ratio(map, ratio):
-    lon, lat, topo = sp.parse_STEM_coordinates(
-        os.path.join(os.environ['SARIKA_INPUT'], 'TOPO-124x124.nc'))
-    ratio = maskoceans(lon, lat, ratio)
+def draw_ratio(map, ratio, land=None):
+    land = land or get_land_mask()
+    ratio = land.apply(ratio)
     ratio_norm = midpt_norm.MidpointNormalize(midpoint=1.0)
-    cm = map.map.pcolor(lon, lat, ratio,
+    cm = map.map.pcolor(land.lon, land.lat, ratio,
                         vmin=-7,  # np.percentile(ratio, 1),
                         vmax=9,  # np.percentile(ratio, 99),
                         cmap=plt.get_cmap('PuOr'),
@@ -131,16 +291,15 @@ def draw_ratio(map, ratio):
     cb.solids.set_edgecolor("face")
 
 
-def draw_fsoil(map, fsoil, vmin, vmax):
+def draw_fsoil(map, fsoil, vmin, vmax, land=None):
     pmol_per_mol = 1e12
-    fsoil = fsoil * pmol_per_mol
+    land = land or get_land_mask()
+    fsoil = land.apply(fsoil)
+    fsoil *= pmol_per_mol
     vmin = vmin * pmol_per_mol
     vmax = vmax * pmol_per_mol
-    lon, lat, topo = sp.parse_STEM_coordinates(
-        os.path.join(os.environ['SARIKA_INPUT'], 'TOPO-124x124.nc'))
-    fsoil = maskoceans(lon, lat, fsoil)
     norm = midpt_norm.MidpointNormalize(midpoint=0.0)
-    cm = map.map.pcolor(lon, lat, fsoil,
+    cm = map.map.pcolor(land.lon, land.lat, fsoil,
                         vmin=vmin,  # np.nanmin(fsoil),
                         vmax=vmax,  # np.nanmax(fsoil),
                         norm=norm,
@@ -154,6 +313,12 @@ def draw_fsoil(map, fsoil, vmin, vmax):
 
 
 def draw_fsoil_maps(fsoil_mary, fsoil_kettle, fsoil_hybrid):
+    """draw the soil flux comparison maps.  The fluxes are float
+    arrays with NaN where invalid (masked arrays are accepted too)."""
+    land = get_land_mask()
+    fsoil_mary = as_nan_array(fsoil_mary)
+    fsoil_kettle = as_nan_array(fsoil_kettle)
+    fsoil_hybrid = as_nan_array(fsoil_hybrid)
 
     # NAMapFigure arguments to zoom map on the Eastern USA
     E_USA = {'lon_0': -88.6275,
@@ -188,46 +353,41 @@ def draw_fsoil_maps(fsoil_mary, fsoil_kettle, fsoil_hybrid):
                                 **kwargs)
 
     draw_crop_pct(os.path.join(
-        os.environ['SARIKA_INPUT'],
+        data_paths.get_path('stem_input_dir'),
         'Cropland_pct',
         'Ramankutty_etal_Cropland2000_pct_124x124_IOAPI.nc'),
                   map_c,
-                  mask=np.logical_or(fsoil_kettle.mask, fsoil_mary.mask))
+                  mask=np.isnan(fsoil_kettle) | np.isnan(fsoil_mary),
+                  land=land)
 
-    vmin = np.nanmin(np.ma.vstack((fsoil_kettle,
-                                   fsoil_hybrid)).flatten())
-    vmax = np.nanmax(np.ma.vstack((fsoil_kettle,
-                                   fsoil_hybrid)).flatten())
-    draw_fsoil(map_m, fsoil_mary, vmin, vmax)
-    draw_fsoil(map_k, fsoil_kettle, vmin, vmax)
-    draw_fsoil(map_h, fsoil_hybrid, vmin, vmax)
+    vmin = min(np.nanmin(fsoil_kettle), np.nanmin(fsoil_hybrid))
+    vmax = max(np.nanmax(fsoil_kettle), np.nanmax(fsoil_hybrid))
+    draw_fsoil(map_m, fsoil_mary, vmin, vmax, land=land)
+    draw_fsoil(map_k, fsoil_kettle, vmin, vmax, land=land)
+    draw_fsoil(map_h, fsoil_hybrid, vmin, vmax, land=land)
 
     # draw_fsoil(map_m, fsoil_mary, np.nanmin(fsoil_kettle), 6e-5)
     # draw_fsoil(map_k, fsoil_kettle, np.nanmin(fsoil_kettle), 6e-5)
-    ratio1 = calc_ratio(fsoil_mary, fsoil_kettle)
-    ratio2 = calc_ratio(fsoil_hybrid, fsoil_kettle)
-    draw_ratio(map_r2, ratio2)
+    ratio1 = calc_ratio(fsoil_mary, fsoil_kettle, land=land)
+    ratio2 = calc_ratio(fsoil_hybrid, fsoil_kettle, land=land)
+    draw_ratio(map_r2, ratio2, land=land)
     return(fig, map_m, map_k, map_h, map_c, map_r2, ratio1, ratio2)
 
 if __name__ == "__main__":
     s_per_6hrs = 6 * 60 * 60  # six hours expressed in seconds
 
-    fname_wrf = os.path.join(os.environ['SARIKA_INPUT'],
+    fname_wrf = os.path.join(data_paths.get_path('stem_input_dir'),
                              'soil_T_moisture_JulAug.nc')
-    vwc, Tsoil = get_WRF_Tsoil_VWC(fname_wrf)
-    fsoil = calc_fsoil(vwc['data'], Tsoil['data'])
-    fsoil_itgd = integrate_mary_fsoil(fsoil, s_per_6hrs)
+    fsoil_itgd = stream_mary_fsoil_integral(fname_wrf, s_per_6hrs)
 
     fsoil_k_itgd = get_kettle_soil(os.path.join(
-        os.environ['SARIKA_INPUT'],
+        data_paths.get_path('stem_input_dir'),
         'surfem-124x124-kettle-soil-cos_2008_2009.nc'))
 
     fsoil_hybrid_itgd = get_hybrid_fsoil(os.path.join(
-        os.environ['SARIKA_INPUT'],
+        data_paths.get_path('stem_input_dir'),
         'whelan_kettle_hybrid_fsoil_124x124.nc'))
-    fsoil_hybrid_itgd = ma.masked_where(np.logical_or(fsoil_k_itgd.mask,
-                                                      fsoil_itgd.mask),
-                                        fsoil_hybrid_itgd)
+    fsoil_hybrid_itgd[np.isnan(fsoil_k_itgd) | np.isnan(fsoil_itgd)] = np.nan
     plt.close('all')
     fig, map_m, map_k, map_h, map_r1, map_r2, ratio1, ratio2 = draw_fsoil_maps(
         fsoil_itgd,
@@ -0,0 +1,71 @@
+"""Human-readable labels for STEM model runs and NOAA observations.
+
+The labels live in model_labels.csv (columns key, label, short_label)
+so that the Python plotting scripts and the R scripts
+(gradient_plot_error_bars.R) use the same strings.  label is used for
+data frame columns and plot legends; short_label, where given, is the
+more compact label used in the gradient error bar plots.
+
+Climatological boundaries variants ("<key>, clim") are labeled
+"<label>, clim".
+"""
+
+import os
+import os.path
+import csv
+from collections import OrderedDict
+
+LABELS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'model_labels.csv')
+CLIM_SUFFIX = ', clim'
+
+_labels_cache = {}
+
+
+def load_labels(fname=LABELS_FILE):
+    """read a label registry file.  Each file is read only once.
+
+    ARGS:
+    fname (string): full path to the label registry CSV file
+
+    RETURNS:
+    OrderedDict mapping key -> (label, short_label).  short_label
+       falls back to label where it is not given.
+    """
+    if fname not in _labels_cache:
+        labels = OrderedDict()
+        with open(fname) as f:
+            for row in csv.DictReader(f):
+                labels[row['key']] = (row['label'],
+                                      row['short_label'] or row['label'])
+        _labels_cache[fname] = labels
+    return _labels_cache[fname]
+
+
+def label(key, short=False, fname=LABELS_FILE):
+    """return the human-readable label for key, or key itself if it has
+    no label
+
+    ARGS:
+    key (string): run key (e.g. 'casa_gfed_161' or
+       'casa_gfed_161, clim')
+    short (bool): if True return the short label
+    fname (string): full path to the label registry CSV file
+    """
+    labels = load_labels(fname)
+    if key in labels:
+        return labels[key][int(short)]
+    if key.endswith(CLIM_SUFFIX) and key[:-len(CLIM_SUFFIX)] in labels:
+        return label(key[:-len(CLIM_SUFFIX)], short, fname) + CLIM_SUFFIX
+    return key
+
+
+def label_mapping(keys, short=False, fname=LABELS_FILE):
+    """return an exact-match key -> label dict for the keys that have a
+    label, e.g. for pandas.DataFrame.rename(columns=...)"""
+    mapping = {}
+    for k in keys:
+        this_label = label(k, short, fname)
+        if this_label != k:
+            mapping[k] = this_label
+    return mapping
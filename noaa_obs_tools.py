@@ -0,0 +1,423 @@
+"""Fast loading of NOAA airborne [COS] observations.
+
+stem_pytools.noaa_ocs.get_all_NOAA_airborne_data re-tokenizes every
+NOAA text event file each time it is called.  load_NOAA_airborne_data
+keeps a columnar copy of the parsed observations table on disk (one
+.npy file per column: numeric columns as-is, string columns as
+categorical codes, timestamps as datetime64) and rebuilds it
+automatically whenever the files in the NOAA data directory change.
+
+Row filters (months, bounding box, valid coordinates) are evaluated on
+the cached filter columns before the full table is assembled, so
+callers only ever materialize -- and geolocate -- the rows they keep.
+"""
+
+import os
+import os.path
+import json
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from stem_pytools import noaa_ocs
+
+CACHE_VERSION = 1
+# NOAA files use -999 for missing values
+NOAA_MISSING_THRESHOLD = -998
+
+
+def default_cache_dir(noaa_dir):
+    """return the default cache directory for a NOAA data directory:
+    $HOME/.cache/noaa_ocs/<hash of noaa_dir>"""
+    key = hashlib.md5(os.path.abspath(noaa_dir).encode('utf-8')).hexdigest()
+    return os.path.join(os.path.expanduser('~'), '.cache', 'noaa_ocs', key)
+
+
+def source_signature(noaa_dir):
+    """return a list of [name, size, mtime] for each file in noaa_dir.
+    The cache is rebuilt whenever this changes."""
+    sig = []
+    for fname in sorted(os.listdir(noaa_dir)):
+        full = os.path.join(noaa_dir, fname)
+        if os.path.isfile(full):
+            st = os.stat(full)
+            sig.append([fname, st.st_size, st.st_mtime])
+    return sig
+
+
+def write_obs_cache(obs, cache_dir, signature):
+    """write an observations data frame to a columnar cache
+
+    ARGS:
+    obs (pandas.DataFrame): the observations table
+    cache_dir (string): directory to write the cache to
+    signature (list): source directory signature (see
+       source_signature) to store with the cache
+    """
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    columns = []
+    for i, name in enumerate(obs.columns):
+        col = obs[name]
+        fname = 'col{:03d}.npy'.format(i)
+        entry = {'name': name, 'file': fname}
+        if np.issubdtype(col.dtype, np.datetime64):
+            entry['kind'] = 'datetime'
+            np.save(os.path.join(cache_dir, fname),
+                    col.values.astype('datetime64[ns]').view('i8'))
+        elif (col.dtype == object) or hasattr(col, 'cat'):
+            cat = pd.Categorical(col.astype(str))
+            entry['kind'] = 'categorical'
+            entry['categories'] = [str(c) for c in cat.categories]
+            np.save(os.path.join(cache_dir, fname),
+                    np.asarray(cat.codes, dtype='i4'))
+        else:
+            entry['kind'] = 'numeric'
+            np.save(os.path.join(cache_dir, fname), col.values)
+        columns.append(entry)
+    manifest = {'version': CACHE_VERSION,
+                'signature': signature,
+                'columns': columns}
+    # write the manifest last (and atomically) so that an interrupted
+    # write never leaves a cache that looks valid
+    tmp = os.path.join(cache_dir, 'manifest.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.rename(tmp, os.path.join(cache_dir, 'manifest.json'))
+
+
+def read_obs_cache(cache_dir, signature=None, columns=None, row_mask=None):
+    """read an observations table from a columnar cache
+
+    ARGS:
+    cache_dir (string): directory containing the cache
+    signature (list): if not None, the cache is only used if it was
+       built from a source directory with this signature
+    columns (list): names of the columns to read.  Default is all
+       columns.
+    row_mask (numpy.ndarray): boolean array; if not None only rows
+       where row_mask is True are returned.  Categories that no
+       longer occur after masking are dropped.
+
+    RETURNS:
+    pandas.DataFrame, or None if there is no valid cache
+    """
+    fname_manifest = os.path.join(cache_dir, 'manifest.json')
+    if not os.path.exists(fname_manifest):
+        return None
+    with open(fname_manifest) as f:
+        manifest = json.load(f)
+    if manifest['version'] != CACHE_VERSION:
+        return None
+    if (signature is not None) and (manifest['signature'] != signature):
+        return None
+    data = OrderedDict()
+    for entry in manifest['columns']:
+        if (columns is not None) and (entry['name'] not in columns):
+            continue
+        vals = np.load(os.path.join(cache_dir, entry['file']))
+        if row_mask is not None:
+            vals = vals[row_mask]
+        if entry['kind'] == 'datetime':
+            vals = vals.view('datetime64[ns]')
+        elif entry['kind'] == 'categorical':
+            vals = pd.Categorical.from_codes(vals, entry['categories'])
+            if row_mask is not None:
+                vals = vals.remove_unused_categories()
+        data[entry['name']] = vals
+    return pd.DataFrame(data)
+
+
+def obs_filter_mask(obs, months=None, bbox=None, valid_coords=False):
+    """evaluate row filters on an observations table
+
+    ARGS:
+    obs (pandas.DataFrame or dict): columns sample_month,
+       sample_longitude and sample_latitude (only those needed by the
+       requested filters must be present)
+    months (list): if not None, keep only observations from these
+       months (1 to 12)
+    bbox (tuple): (lon_min, lat_min, lon_max, lat_max); if not None,
+       keep only observations strictly inside the box.  Any element
+       may be None for an open side.
+    valid_coords (bool): if True, drop observations with a missing
+       (-999) longitude, as spatial_analysis_utilities always has.
+       Latitude is not checked, so the observation counts are those
+       of the longitude-only filter.
+
+    RETURNS:
+    boolean numpy.ndarray, True for rows to keep
+    """
+    n = len(obs[list(obs.keys())[0]])
+    keep = np.ones(n, dtype=bool)
+    if valid_coords:
+        keep &= np.asarray(obs['sample_longitude']) > NOAA_MISSING_THRESHOLD
+    if months is not None:
+        keep &= np.in1d(np.asarray(obs['sample_month']), months)
+    if bbox is not None:
+        lon_min, lat_min, lon_max, lat_max = bbox
+        for col, lim, gt in (('sample_longitude', lon_min, True),
+                             ('sample_latitude', lat_min, True),
+                             ('sample_longitude', lon_max, False),
+                             ('sample_latitude', lat_max, False)):
+            if lim is not None:
+                vals = np.asarray(obs[col])
+                keep &= (vals > lim) if gt else (vals < lim)
+    return keep
+
+
+def load_obs_table(noaa_dir, cache_dir=None, rebuild=False, columns=None,
+                   months=None, bbox=None, valid_coords=False):
+    """return the parsed NOAA airborne observations table, from the
+    columnar cache if it is up to date.
+
+    The row filters are evaluated on the filter columns alone, before
+    the remaining columns are read.
+
+    ARGS:
+    noaa_dir (string): full path to the directory containing NOAA
+       observation files
+    cache_dir (string): cache directory.  Default is
+       default_cache_dir(noaa_dir)
+    rebuild (bool): if True, re-parse the NOAA files even if the
+       cache is up to date
+    columns (list): names of the columns to return.  Default is all
+       columns.
+    months, bbox, valid_coords: row filters; see obs_filter_mask
+
+    RETURNS:
+    pandas.DataFrame with site codes (and other string columns) as
+       categoricals and timestamps as datetime64
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir(noaa_dir)
+    signature = source_signature(noaa_dir)
+    filter_cols = read_obs_cache(
+        cache_dir, signature,
+        ['sample_month', 'sample_longitude', 'sample_latitude'])
+    if rebuild or (filter_cols is None):
+        print('parsing NOAA observation files in {}'.format(noaa_dir))
+        data = noaa_ocs.get_all_NOAA_airborne_data(noaa_dir)
+        write_obs_cache(data.obs.reset_index(drop=True),
+                        cache_dir, signature)
+        filter_cols = read_obs_cache(
+            cache_dir, None,
+            ['sample_month', 'sample_longitude', 'sample_latitude'])
+
+    row_mask = None
+    if (months is not None) or (bbox is not None) or valid_coords:
+        row_mask = obs_filter_mask(filter_cols, months, bbox, valid_coords)
+    return read_obs_cache(cache_dir, None, columns, row_mask)
+
+
+def load_NOAA_airborne_data(noaa_dir, cache_dir=None, rebuild=False,
+                            months=None, bbox=None, valid_coords=False):
+    """cached replacement for noaa_ocs.get_all_NOAA_airborne_data
+
+    ARGS:
+    noaa_dir (string): full path to the directory containing NOAA
+       observation files
+    cache_dir (string): cache directory.  Default is
+       default_cache_dir(noaa_dir)
+    rebuild (bool): if True, re-parse the NOAA files even if the
+       cache is up to date
+    months, bbox, valid_coords: row filters; see obs_filter_mask
+
+    RETURNS:
+    noaa_ocs.NOAA_OCS object
+    """
+    return noaa_ocs.NOAA_OCS(obs=load_obs_table(noaa_dir, cache_dir, rebuild,
+                                                months=months,
+                                                bbox=bbox,
+                                                valid_coords=valid_coords))
+
+
+def _group_codes(col):
+    """return (integer codes, labels) for a grouping column"""
+    if hasattr(col, 'cat'):
+        return np.asarray(col.cat.codes), np.asarray(col.cat.categories)
+    codes, labels = pd.factorize(col)
+    return codes, np.asarray(labels)
+
+
+def _split_group_id(gid, labels):
+    """invert the combined group id built in daily_vert_drawdown:
+    return one array of group labels per group column"""
+    out = []
+    for lab in reversed(labels):
+        out.insert(0, lab[gid % len(lab)])
+        gid = gid // len(lab)
+    return out
+
+
+def daily_vert_drawdown(obs,
+                        lo_bin=(0, 2000),
+                        hi_bin=(4000, 30000),
+                        group_cols=('sample_site_code',),
+                        mean_cols=('sample_latitude',
+                                   'sample_longitude',
+                                   'analysis_value')):
+    """calculate daily vertical [COS] drawdown and its period mean.
+
+    Daily drawdown is the mean [COS] of the observations in the high
+    altitude bin minus the mean [COS] of the observations in the low
+    altitude bin, for each group (e.g. site) and day.  The
+    observations are sorted once by (group, date, altitude); all
+    means are then segmented reductions over the sorted arrays, so no
+    pandas groupby is needed.
+
+    ARGS:
+    obs (pandas.DataFrame): observations; must contain the group_cols,
+       datet, sample_altitude and analysis_value columns
+    lo_bin ((float, float)): (bottom, top] of the low altitude bin (m)
+    hi_bin ((float, float)): (bottom, top] of the high altitude bin (m)
+    group_cols (sequence): columns identifying a group.  Add e.g. a
+       species or year column to process several at once.
+    mean_cols (sequence): columns whose period mean is reported along
+       with the mean drawdown
+
+    RETURNS:
+    daily (pandas.DataFrame): indexed by group_cols and date, column
+       ocs_dd (NaN for days missing either altitude bin)
+    period (pandas.DataFrame): indexed by group_cols; the mean of
+       each of mean_cols over all observations, ocs_dd (mean of the
+       daily drawdowns) and n_days (number of days with a drawdown)
+    """
+    group_cols = list(group_cols)
+    codes, labels = zip(*[_group_codes(obs[c]) for c in group_cols])
+    # combine the group columns into a single group id
+    gid = np.zeros(len(obs), dtype='i8')
+    for c, lab in zip(codes, labels):
+        gid = gid * len(lab) + c
+    day = obs['datet'].values.astype('datetime64[D]').view('i8')
+    alt = obs['sample_altitude'].values
+    val = obs['analysis_value'].values.astype(float)
+
+    order = np.lexsort((alt, day, gid))
+    gid = gid[order]
+    day = day[order]
+    alt = alt[order]
+    val = val[order]
+
+    # segment starts: first observation of each (group, day)
+    new_seg = np.ones(gid.size, dtype=bool)
+    new_seg[1:] = (gid[1:] != gid[:-1]) | (day[1:] != day[:-1])
+    starts = np.flatnonzero(new_seg)
+
+    is_lo = (alt > lo_bin[0]) & (alt <= lo_bin[1])
+    is_hi = (alt > hi_bin[0]) & (alt <= hi_bin[1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lo_mean = (np.add.reduceat(np.where(is_lo, val, 0.0), starts) /
+                   np.add.reduceat(is_lo.astype(int), starts))
+        hi_mean = (np.add.reduceat(np.where(is_hi, val, 0.0), starts) /
+                   np.add.reduceat(is_hi.astype(int), starts))
+    dd = hi_mean - lo_mean
+
+    seg_labels = _split_group_id(gid[starts], labels)
+    seg_day = day[starts].astype('datetime64[D]').astype('datetime64[ns]')
+    daily = pd.DataFrame(
+        {'ocs_dd': dd},
+        index=pd.MultiIndex.from_arrays(seg_labels + [seg_day],
+                                        names=group_cols + ['date']))
+
+    # period means: segmented reductions over groups
+    group_starts = np.flatnonzero(np.r_[True, gid[1:] != gid[:-1]])
+    seg_group = np.searchsorted(group_starts, starts, side='right') - 1
+    n_groups = group_starts.size
+    period = OrderedDict()
+    n_obs = np.diff(np.r_[group_starts, gid.size])
+    for c in mean_cols:
+        vals = obs[c].values[order].astype(float)
+        period[c] = np.add.reduceat(vals, group_starts) / n_obs
+    has_dd = np.isfinite(dd)
+    n_days = np.bincount(seg_group[has_dd], minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        period['ocs_dd'] = (np.bincount(seg_group[has_dd],
+                                        weights=dd[has_dd],
+                                        minlength=n_groups) / n_days)
+    period['n_days'] = n_days
+    grp_labels = _split_group_id(gid[group_starts], labels)
+    if len(group_cols) == 1:
+        index = pd.Index(grp_labels[0], name=group_cols[0])
+    else:
+        index = pd.MultiIndex.from_arrays(grp_labels, names=group_cols)
+    period = pd.DataFrame(period, index=index)
+    return daily, period
+
+
+def site_stats(obs, months=(7, 8), group_cols=('sample_site_code',)):
+    """summarize sampling at each NOAA site.
+
+    A flight is all of a site's samples from one (UTC) calendar day.
+    Sample dates come from flooring datet to datetime64[D]; the
+    observations are sorted once by (site, date) and every statistic
+    is a segmented reduction over the sorted arrays.
+
+    ARGS:
+    obs (pandas.DataFrame): observations; must contain the group_cols,
+       datet and sample_altitude columns
+    months (sequence): months (1-12) counted in n_samples_in_months
+       and n_flights_in_months.  Default is July and August.
+    group_cols (sequence): columns identifying a site.  Add e.g.
+       sample_year to report each site-year separately.
+
+    RETURNS:
+    pandas.DataFrame with one row per site and columns group_cols,
+       n_samples, n_flights, samples_per_flight_mean,
+       samples_per_flight_min, samples_per_flight_max,
+       n_samples_in_months, n_flights_in_months, altitude_min and
+       altitude_max
+    """
+    group_cols = list(group_cols)
+    codes, labels = zip(*[_group_codes(obs[c]) for c in group_cols])
+    gid = np.zeros(len(obs), dtype='i8')
+    for c, lab in zip(codes, labels):
+        gid = gid * len(lab) + c
+    day = obs['datet'].values.astype('datetime64[D]')
+    month = day.astype('datetime64[M]').view('i8') % 12 + 1
+    in_months = np.in1d(month, months)
+    alt = obs['sample_altitude'].values.astype(float)
+
+    day = day.view('i8')
+    order = np.lexsort((day, gid))
+    gid = gid[order]
+    day = day[order]
+    in_months = in_months[order]
+    alt = alt[order]
+
+    site_start = np.r_[True, gid[1:] != gid[:-1]]
+    flight_start = site_start | np.r_[True, day[1:] != day[:-1]]
+    site_starts = np.flatnonzero(site_start)
+    flight_starts = np.flatnonzero(flight_start)
+
+    # flight-level counts, then reduce flights onto their site
+    flight_n = np.diff(np.r_[flight_starts, gid.size])
+    flight_in_months = in_months[flight_starts]
+    flight_site = np.cumsum(site_start)[flight_starts] - 1
+    site_first_flight = np.searchsorted(flight_site,
+                                        np.arange(site_starts.size))
+    n_flights = np.bincount(flight_site)
+
+    stats = OrderedDict()
+    for c, lab in zip(group_cols, _split_group_id(gid[site_starts],
+                                                  labels)):
+        stats[c] = lab
+    stats['n_samples'] = np.diff(np.r_[site_starts, gid.size])
+    stats['n_flights'] = n_flights
+    stats['samples_per_flight_mean'] = stats['n_samples'] / n_flights.astype(
+        float)
+    stats['samples_per_flight_min'] = np.minimum.reduceat(flight_n,
+                                                          site_first_flight)
+    stats['samples_per_flight_max'] = np.maximum.reduceat(flight_n,
+                                                          site_first_flight)
+    stats['n_samples_in_months'] = np.add.reduceat(in_months.astype(int),
+                                                   site_starts)
+    stats['n_flights_in_months'] = np.bincount(
+        flight_site, weights=flight_in_months,
+        minlength=site_starts.size).astype(int)
+    with np.errstate(invalid='ignore'):
+        stats['altitude_min'] = np.fmin.reduceat(alt, site_starts)
+        stats['altitude_max'] = np.fmax.reduceat(alt, site_starts)
+    return pd.DataFrame(stats)
@@ -12,13 +12,12 @@ from stem_pytools import STEM_parsers as sp
 from stem_pytools.noaa_ocs import get_STEMZ_height
 from timutils import midpt_norm
 import brewer2mpl
+import data_paths
 
-bd_fname = os.path.join(os.getenv('SARIKA_INPUT'),
+bd_fname = os.path.join(data_paths.get_path('stem_input_dir'),
                         'bdv-124x124-cos-pctm_2008_2009.nc')
-topo_fname = os.path.join(os.getenv('SARIKA_INPUT'),
-                          'TOPO-124x124.nc')
-wrf_fname = os.path.join(os.getenv('SARIKA_INPUT'),
-                         'wrfheight-124x124-22levs.nc')
+topo_fname = data_paths.get_path('topo')
+wrf_fname = data_paths.get_path('wrfheight')
 
 bd = sp.parse_STEM_var(bd_fname,
                        varname='CO2_TRACER1',
@@ -23,6 +23,7 @@ import numpy as np
 from timutils import colormap_nlevs
 from stem_pytools.na_map import NAMapFigure
 from stem_pytools import domain
+import data_paths
 
 if __name__ == "__main__":
 
@@ -41,8 +42,7 @@ if __name__ == "__main__":
                                                extend='neither')
 
     d = domain.STEM_Domain()
-    d.get_STEMZ_height(wrfheight_fname=os.path.join(os.getenv('SARIKA_INPUT'),
-                                                    'wrfheight-124x124-22levs.nc'))
+    d.get_STEMZ_height(wrfheight_fname=data_paths.get_path('wrfheight'))
     agl_perim = np.array([domain.get_2d_perimeter(d.agl[z, ...]).mean()
                           for z in range(22)])
 
@@ -61,7 +61,6 @@ if __name__ == "__main__":
     ax_cb.solids.set_rasterized(True)
 
     fig.tight_layout()
-    fig.savefig(os.path.join(os.getenv('HOME'),
-                             'plots',
+    fig.savefig(os.path.join(data_paths.get_path('plot_dir'),
                              'climatological_bounds.pdf'))
     plt.close(fig)
@@ -4,8 +4,10 @@ from datetime import datetime
 
 from stem_pytools import NERSC_data_paths as ndp
 from aqout_postprocess_spatial_paper import AqoutContainerSpatialPaper
+import data_paths
+import instrument
 
-t0 = datetime.now()
+instrument.configure('sib_check_DD_timings.json', verbose=True)
 
 runs = ndp.get_Spatial_Paper_runs()
 sib_runs = ['SiB_calc', 'SiB_mech']
@@ -25,7 +27,6 @@ for k, this_aqc in aqcs.items():
     # this_aqc.calc_stats()
     this_aqc.calc_JA_midday_drawdown()
     this_aqc.calc_JA_midday_drawdown_stderr()
-    this_aqc.extract_noaa_sites(
-        '/project/projectdirs/m2319/Data/NOAA_95244993/')
+    this_aqc.extract_noaa_sites(data_paths.get_path('noaa_dir'))
 
-print datetime.now() - t0
+instrument.get_recorder().print_records()
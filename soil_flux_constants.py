@@ -0,0 +1,13 @@
+"""Constants of the soil COS flux (Fsoil) models, shared by
+mary_soil_model.py and Meld_fSoils/meld_scenarios.py.
+"""
+
+# coefficients of Mary Whelan's soil COS flux model (email of 5 Feb
+# 2015): fsoil = vwc * coefs['vwc'] + Tsoil * coefs['Tsoil'] +
+# coefs['intercept'], with fsoil in pmol/m2/sec, vwc as a fraction and
+# Tsoil in K
+WHELAN_FSOIL_COEFS = {'vwc': -28.77873448,
+                      'Tsoil': 0.88867741,
+                      'intercept': -252.76497309}
+# Mary's fitting data contained no soil temperatures below 10 C
+WHELAN_TSOIL_MIN = 273.15 + 10
@@ -8,7 +8,6 @@ matplotlib.rc('font', **font)
 
 import os
 import os.path
-import socket
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -22,20 +21,23 @@ from stem_pytools import NERSC_data_paths as ndp
 # for plotting observations on a map of N America
 from stem_pytools import na_map
 from map_grid import map_grid_main
+import noaa_obs_tools
+import data_paths
 from stem_pytools import aqout_postprocess as aqpp
 from stem_pytools import domain
 
 
-def pickle_stem_runs(fname_cpickle=os.path.join(
-        os.getenv('SCRATCH'),
-        'STEM_all_runs.cpickle')):
+def pickle_stem_runs(fname_cpickle=None):
     """
     create a cpickle file containing Jul-Aug daily [COS] mean,
     standard deviation, and time stamps.
 
     :param fname_cpickle: full path of the cpickle file to be created.
-        Default is $SCRATCH/STEM_runs.cpickle
+        Default is <output_dir>/STEM_all_runs.cpickle (see data_paths)
     """
+    if fname_cpickle is None:
+        fname_cpickle = os.path.join(data_paths.get_path('output_dir'),
+                                     'STEM_all_runs.cpickle')
     aqpp.assemble_data(ndp.get_Spatial_Paper_runs(),
                        fname_cpickle)
     print("wrote {}".format(fname_cpickle))
@@ -43,33 +45,19 @@ def pickle_stem_runs(fname_cpickle=os.path.join(
 
 def get_aqout_data_path():
     """return the full path to the directory containing (pre-parsed)
-    aqout data files on either ecampbell300 or Tim's laptop
+    aqout data files (data path aqout_data; see data_paths)
 
     """
-    if 'Timothys-MacBook-Air.local' in socket.gethostname():
-        aqout_data = (os.path.join(os.getenv('HOME'), 'work', 'Data',
-                                   'STEM', 'aq_out_data.cpickle'))
-    else:
-        aqout_data = os.path.join(os.getenv('HOME'), 'Data', 'STEM',
-                                  'aq_out_data_BASC.cpickle')
-    return(aqout_data)
+    return(data_paths.get_path('aqout_data'))
 
 
 def get_noaa_COS_data_path():
     """
     return the full path to the directory containing the NOAA OCS data
-    files on either ecampbell300 or Tim's laptop
+    files (data path noaa_dir; see data_paths)
 
     """
-    if 'Timothys-MacBook-Air.local' in socket.gethostname():
-        noaa_dir = os.path.join(os.getenv('HOME'), 'work',
-                                'Data', 'NOAA_95244993')
-    else:
-        noaa_dir = os.path.join('/', 'project', 'projectdirs',
-                                'm2319',
-                                'Data',
-                                'NOAA_95244993')
-    return(noaa_dir)
+    return(data_paths.get_path('noaa_dir'))
 
 
 def get_site_mean_cos(data):
@@ -97,12 +85,15 @@ def get_site_mean_cos(data):
 def preprocess_NOAA_airborne_data_for_JA_spatial_analysis(noaa_dir):
     """
     (1) parses all NOAA COS observation files from noaa_dir
-    (2) assigns each observation to a STEM x, y, and z cell
-    (3) removes all observations with a [COS] value of -999
-    (4) removes all observations that are not in July or August
-    (5) removes all observations west of 140 deg W longitude (this
+    (2) removes all observations with a longitude or latitude of -999
+    (3) removes all observations that are not in July or August
+    (4) removes all observations west of 140 deg W longitude (this
         roughly correspondes to the western boundary of the 124x124
         STEM domain)
+    (5) assigns each remaining observation to a STEM x, y, and z cell
+
+    Steps (2) to (4) are applied by the NOAA loader before the table
+    is assembled, so only the observations kept are geolocated.
 
     INPUTS
     noaa_dir: full path to a directory containing NOAA COS observation files
@@ -114,27 +105,22 @@ def preprocess_NOAA_airborne_data_for_JA_spatial_analysis(noaa_dir):
     stem_pytools.noaa_ocs
     """
 
-    data = noaa_ocs.get_all_NOAA_airborne_data(noaa_dir)
-
-    stem_input_dir = os.getenv('SARIKA_INPUT')
-    topo_file = os.path.join(stem_input_dir, 'TOPO-124x124.nc')
-    wrf_height_file = os.path.join(stem_input_dir,
-                                   'wrfheight-124x124-22levs.nc')
+    # keep observations from July and August only.  Remove
+    # observations in Alaska - this is outside of the STEM domain.  I
+    # can do this crudely by cutting it off at 140 deg W longitude.
+    data = noaa_obs_tools.load_NOAA_airborne_data(
+        noaa_dir,
+        months=[7, 8],
+        bbox=(-140, None, None, None),
+        valid_coords=True)
+
+    topo_file = data_paths.get_path('topo')
+    wrf_height_file = data_paths.get_path('wrfheight')
     stem_lon, stem_lat, topo = STEM_parsers.parse_STEM_coordinates(topo_file)
     data.get_stem_xy(stem_lon, stem_lat)
     data.get_stem_z(topo_fname=topo_file,
                     wrfheight_fname=wrf_height_file)
 
-    # some observations list longitude of -999: remove those
-    keep_idx = data.obs['sample_longitude'].values > -998
-    # keep observations from July and August only
-    keep_idx = keep_idx & np.in1d(data.obs['sample_month'].values, [7, 8])
-    # remove observations in Alaska - this is outside of the STEM
-    # domain.  I can do this crudely by cutting it off at 140 deg W
-    # longitude.
-    keep_idx = keep_idx & (data.obs.sample_longitude > -140)
-    data.obs = data.obs.loc[keep_idx]
-
     return(data)
 
 
@@ -147,17 +133,7 @@ def get_JA_site_mean_drawdown(noaa_dir):
     print 'filtering for Jul & Aug, etc.'
     ja_data = preprocess_NOAA_airborne_data_for_JA_spatial_analysis(noaa_dir)
     print 'calculating drawdown'
-    ja_daily_dd = ja_data.calculate_OCS_daily_vert_drawdown()
-
-    agg_vars = ['sample_latitude', 'sample_longitude',
-                'sample_site_code', 'analysis_value']
-    ja_mean_ocs = ja_data.obs[agg_vars].groupby(
-        ['sample_site_code']).aggregate(np.mean)
-
-    ja_mean_dd = ja_daily_dd.reset_index().groupby(
-        ['sample_site_code']).aggregate(np.mean)
-
-    ja_mean = ja_mean_ocs.join(ja_mean_dd)
+    ja_daily_dd, ja_mean = noaa_obs_tools.daily_vert_drawdown(ja_data.obs)
     return(ja_mean, ja_daily_dd)
 
 
@@ -248,8 +224,7 @@ if __name__ == "__main__":
         # c4runs = ndp.get_C3C4runs()
         basc_runs = ndp.get_BASC_runs()
         fig, map_objs, cos_cmap, cos_norm = map_grid_main(
-            aqout_data=os.path.join(os.getenv('HOME'), 'Data', 'STEM',
-                                    'aq_out_data_BASC.cpickle'),
+            aqout_data=get_aqout_data_path(),
             models=[k for k in basc_runs.keys()],
             models_str=[v.model for v in basc_runs.values()])
             # models = ['canibis_161', 'casa_gfed_135'],
@@ -271,16 +246,17 @@ if __name__ == "__main__":
 
     if draw_site_locations_map:
         # draw observation sites map
-        data = noaa_ocs.get_all_NOAA_airborne_data(get_noaa_COS_data_path())
+        data = noaa_obs_tools.load_NOAA_airborne_data(
+            get_noaa_COS_data_path())
         location_map = data.plot_obs_site_locations()
         n_amer_domain = domain.STEM_Domain()
         n_amer_domain.get_STEM_perimeter_latlon()
         location_map.map.plot(n_amer_domain.bnd_lon,
                               n_amer_domain.bnd_lat,
                               latlon=True)
-        location_map.fig.savefig(os.path.join(os.getenv('HOME'),
-                                              'plots',
-                                              'noaa_obs_sites_STEMdomain.pdf'))
+        location_map.fig.savefig(os.path.join(
+            data_paths.get_path('plot_dir'),
+            'noaa_obs_sites_STEMdomain.pdf'))
         plt.close(location_map.fig)
 
     if draw_observation_altitude_histograms:
@@ -6,6 +6,7 @@ import os
 import os.path
 import shutil
 from stem_pytools import NERSC_data_paths as ndp
+import data_paths
 
 
 def Get_Human_Readable(size, precision=2):
@@ -65,5 +66,6 @@ def make_data_archive(root_dir, runs):
 if __name__ == "__main__":
     runs = ndp.get_Spatial_Paper_runs()
     total = get_spatial_paper_data_total(runs)
-    archive_dir = os.path.join(os.getenv('SCRATCH'), 'SpatialPaperData')
+    archive_dir = os.path.join(data_paths.get_path('output_dir'),
+                               'SpatialPaperData')
     make_data_archive(archive_dir, runs)
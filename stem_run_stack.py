@@ -0,0 +1,394 @@
+"""Many STEM runs' [COS] fields stacked in a single on-disk array.
+
+StemRunStack stores the daily [COS] of every run in one
+[model, t, z, x, y] numpy memmap.  Runs with climatological
+boundaries (the ", clim" variants used throughout the spatial paper)
+are not stored: they are the constant-boundary run with the
+constant boundary [COS] replaced by the climatological boundaries
+run's [COS],
+
+    run[:-1] - const_bounds + climatological_bnd
+
+and are computed from the stack when accessed.  All of them can be
+computed at once into one array (StemRunStack.clim_all).
+
+Composite runs (e.g. CASA-GFED3 plus an anthropogenic run) are
+declared in a RunCatalog as expressions of stored runs (Source, Run,
+Sum, Scale, Clim).  They are evaluated only when a reduction of them
+is requested, and only the reduction is cached.
+"""
+
+import os
+import atexit
+import tempfile
+from collections import OrderedDict
+import numpy as np
+
+CLIM_SUFFIX = ', clim'
+
+
+def _remove_tmp(fname):
+    """delete a temporary stack file if it still exists"""
+    if os.path.exists(fname):
+        os.remove(fname)
+
+
+class StemRunStack(object):
+    """[model, t, z, x, y] stack of STEM [COS] fields with lazy
+    climatological boundaries variants
+
+    ATTRIBUTES:
+    keys_base (list): keys of the stored runs, in stack order
+    data (numpy.memmap): the stacked fields, shape
+       [model, t, z, x, y].  Runs shorter than the longest run are
+       NaN-padded at the end.
+    nt (list): number of time steps of each stored run, in stack
+       order; runs are returned without the padding
+    clim_key (string): key of the climatological boundaries run
+    const_bounds (float): [COS] of the constant boundaries
+    masked (bool): True if any run was a masked array; runs are then
+       returned as masked arrays with masked values stored as NaN
+
+    A StemRunStack is a context manager; leaving the with block calls
+    close().  Temporary stack files are also deleted at interpreter
+    exit if close() was never called.
+    """
+
+    def __init__(self, runs, fname=None, clim_key='climatological_bnd',
+                 const_bounds=4.5e-10, exclude=(), dtype=None):
+        """create a StemRunStack
+
+        ARGS:
+        runs (dict): [COS] arrays of shape [t, z, x, y] (or [t, x, y]),
+           keyed by run name.  The arrays are copied into the stack
+           one at a time, so runs may be a dict-like object that
+           loads its values on access.
+        fname (string): full path of the .npy file to hold the stack.
+           Default is a temporary file in $SCRATCH (or the system
+           temporary directory), deleted by close() or at exit.
+        clim_key (string): key of the climatological boundaries run.
+           If it is not in runs no ", clim" variants are available.
+        const_bounds (float): [COS] of the constant boundaries,
+           subtracted from each run in the ", clim" variants
+        exclude (sequence): keys of runs not to store
+        dtype: data type of the stack.  Default is the floating point
+           type of the runs (float64 for float64 or integer runs);
+           'f4' halves the size of the stack at the cost of float32
+           precision.
+        """
+        self.keys_base = [k for k in runs.keys() if k not in exclude]
+        self.clim_key = clim_key
+        self.const_bounds = const_bounds
+        shapes = [np.shape(runs[k]) for k in self.keys_base]
+        if dtype is None:
+            # floating point, so the padding can be NaN
+            dtype = np.promote_types(
+                np.result_type(*[runs[k] for k in self.keys_base]), 'f4')
+        self.nt = [s[0] for s in shapes]
+        shape = (len(self.keys_base), max(self.nt)) + shapes[0][1:]
+
+        self._tmp = fname is None
+        if fname is None:
+            fd, fname = tempfile.mkstemp(
+                suffix='.npy', prefix='stem_run_stack_',
+                dir=os.getenv('SCRATCH') or tempfile.gettempdir())
+            os.close(fd)
+            atexit.register(_remove_tmp, fname)
+        self.fname = fname
+        self.data = np.lib.format.open_memmap(fname, mode='w+',
+                                              dtype=dtype, shape=shape)
+        self.masked = False
+        for i, k in enumerate(self.keys_base):
+            self.masked = self.masked or np.ma.isMaskedArray(runs[k])
+            v = np.ma.filled(np.ma.asarray(runs[k], dtype=dtype), np.nan)
+            self.data[i, :v.shape[0]] = v
+            self.data[i, v.shape[0]:] = np.nan
+        self.data.flush()
+
+    def has_clim(self):
+        """True if the stack contains the climatological boundaries run"""
+        return self.clim_key in self.keys_base
+
+    def clim_keys(self):
+        """keys of the ", clim" variants"""
+        if not self.has_clim():
+            return []
+        return [k + CLIM_SUFFIX for k in self.keys_base
+                if k != self.clim_key]
+
+    def keys(self):
+        return self.keys_base + self.clim_keys()
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def _run(self, i, drop_last=False):
+        """return stored run i without its padding (and without its
+        last time step if drop_last)"""
+        return self.data[i, :self.nt[i] - int(drop_last)]
+
+    def clim_run(self):
+        """return the climatological boundaries run's [COS], shape
+        [t-1, z, x, y] (it is one time step shorter than the others)"""
+        return self._run(self.keys_base.index(self.clim_key))
+
+    def _clim(self, i, out=None):
+        """return the ", clim" variant of stored run i, computed in the
+        order run[:-1] - const_bounds + climatological_bnd"""
+        out = np.subtract(self._run(i, drop_last=True), self.const_bounds,
+                          out=out)
+        out += self.clim_run()
+        return out
+
+    def _wrap(self, arr):
+        """mask NaNs (without copying arr) if the inputs were masked"""
+        if self.masked:
+            return np.ma.masked_array(arr, mask=np.isnan(arr))
+        return arr
+
+    def __getitem__(self, key):
+        """return a run's [COS].  Stored runs are returned as views of
+        the stack; ", clim" variants are computed."""
+        if key in self.keys_base:
+            return self._wrap(self._run(self.keys_base.index(key)))
+        if key.endswith(CLIM_SUFFIX) and self.has_clim():
+            base = key[:-len(CLIM_SUFFIX)]
+            if base in self.keys_base and base != self.clim_key:
+                return self._wrap(self._clim(self.keys_base.index(base)))
+        raise KeyError(key)
+
+    def items(self):
+        """iterate over (key, [COS]) pairs, computing one ", clim"
+        variant at a time"""
+        for k in self.keys():
+            yield k, self[k]
+
+    def clim_all(self, out=None):
+        """compute every ", clim" variant
+
+        ARGS:
+        out (numpy.ndarray): optional output array (e.g. a memmap) of
+           shape [n_clim, t-1, z, x, y]
+
+        RETURNS:
+        array of shape [n_clim, t-1, z, x, y], ordered as clim_keys()
+        """
+        rows = [i for i, k in enumerate(self.keys_base)
+                if k != self.clim_key]
+        clim = self.clim_run()
+        if out is None:
+            out = np.empty((len(rows),) + clim.shape, dtype=self.data.dtype)
+        # fill out one run at a time so that no second full-size
+        # temporary is allocated
+        for j, i in enumerate(rows):
+            self._clim(i, out=out[j])
+        return out
+
+    def close(self):
+        """release the memmap, deleting it if it is a temporary file.
+        Closing more than once is harmless."""
+        self.data = None
+        if self._tmp:
+            _remove_tmp(self.fname)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+
+def _copy(arr):
+    """copy arr, preserving its mask if it is a masked array"""
+    if np.ma.isMaskedArray(arr):
+        return np.ma.array(arr, copy=True)
+    return np.array(arr, copy=True)
+
+
+class RunExpr(object):
+    """a STEM run defined as an expression of other runs
+
+    Expressions are built from Source and Run leaves with +, * (by a
+    scalar) and clim(); nothing is computed until evaluate is called.
+    """
+
+    def __add__(self, other):
+        return Sum(self, other)
+
+    def __mul__(self, factor):
+        return Scale(self, factor)
+
+    __rmul__ = __mul__
+
+    def clim(self):
+        """the climatological boundaries variant of this run"""
+        return Clim(self)
+
+    def evaluate(self, catalog):
+        """return this run's [COS] array
+
+        ARGS:
+        catalog (RunCatalog): catalog in which to resolve run keys
+        """
+        raise NotImplementedError
+
+
+class Source(RunExpr):
+    """a run as stored in the catalog's source (e.g. a StemRunStack)"""
+
+    def __init__(self, key):
+        self.key = key
+
+    def evaluate(self, catalog):
+        return catalog.source[self.key]
+
+    def __repr__(self):
+        return 'Source({!r})'.format(self.key)
+
+
+class Run(RunExpr):
+    """a run looked up by key in the catalog: a derived run if one is
+    defined with that key, otherwise the source run"""
+
+    def __init__(self, key):
+        self.key = key
+
+    def evaluate(self, catalog):
+        return catalog[self.key]
+
+    def __repr__(self):
+        return 'Run({!r})'.format(self.key)
+
+
+class Sum(RunExpr):
+    """the sum of two or more runs"""
+
+    def __init__(self, *terms):
+        self.terms = terms
+
+    def evaluate(self, catalog):
+        # accumulate into one buffer rather than allocating a
+        # temporary per term
+        out = _copy(self.terms[0].evaluate(catalog))
+        for t in self.terms[1:]:
+            out += t.evaluate(catalog)
+        return out
+
+    def __repr__(self):
+        return 'Sum({})'.format(', '.join(repr(t) for t in self.terms))
+
+
+class Scale(RunExpr):
+    """a run multiplied by a constant"""
+
+    def __init__(self, expr, factor):
+        self.expr = expr
+        self.factor = factor
+
+    def evaluate(self, catalog):
+        return self.expr.evaluate(catalog) * self.factor
+
+    def __repr__(self):
+        return 'Scale({!r}, {!r})'.format(self.expr, self.factor)
+
+
+class Clim(RunExpr):
+    """a run with the constant boundaries replaced by the
+    climatological boundaries (see StemRunStack)"""
+
+    def __init__(self, expr):
+        self.expr = expr
+
+    def evaluate(self, catalog):
+        out = _copy(self.expr.evaluate(catalog)[:-1])
+        out -= catalog.source.const_bounds
+        out += catalog.source.clim_run()
+        return out
+
+    def __repr__(self):
+        return 'Clim({!r})'.format(self.expr)
+
+
+class RunCatalog(object):
+    """source runs plus lazily evaluated derived runs, with cached
+    reductions
+
+    Full [t, z, x, y] arrays of derived runs are never kept; only
+    reductions requested through reduce() (e.g. July-August mean
+    drawdown maps, or drawdown at the NOAA sites) are cached.
+
+    ATTRIBUTES:
+    source (StemRunStack): the stored runs
+    derived (OrderedDict): RunExpr objects keyed by run name.  A
+       derived run may reuse the key of a source run (e.g. to apply a
+       unit correction); Source(key) still refers to the stored run.
+    """
+
+    def __init__(self, source, derived=None, add_clim=True):
+        """create a RunCatalog
+
+        ARGS:
+        source (StemRunStack): the stored runs
+        derived (list): (key, RunExpr) pairs, in the order the runs
+           should be listed
+        add_clim (bool): if True (default) and source has a
+           climatological boundaries run, define "<key>, clim" as
+           Clim(Run(key)) for every run in the catalog
+        """
+        self.source = source
+        self.derived = OrderedDict(derived or [])
+        self._cache = {}
+        if add_clim and source.has_clim():
+            for k in self.keys():
+                if (k != source.clim_key and
+                        k + CLIM_SUFFIX not in self.derived):
+                    self.derived[k + CLIM_SUFFIX] = Clim(Run(k))
+
+    def keys(self):
+        keys = list(self.source.keys_base)
+        keys += [k for k in self.derived.keys() if k not in keys]
+        return keys
+
+    def __contains__(self, key):
+        return key in self.source.keys_base or key in self.derived
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __getitem__(self, key):
+        """evaluate and return a run's [COS] array (not cached)"""
+        if key in self.derived:
+            return self.derived[key].evaluate(self)
+        if key in self.source.keys_base:
+            return self.source[key]
+        raise KeyError(key)
+
+    def reduce(self, key, func, name=None):
+        """return func applied to a run's [COS], caching the result
+
+        ARGS:
+        key (string): run key
+        func (function): reduction taking the [COS] array
+        name (string): name under which to cache the reduction.
+           Default is func.__name__.
+
+        RETURNS:
+        the return value of func
+        """
+        cache_key = (key, name or func.__name__)
+        if cache_key not in self._cache:
+            self._cache[cache_key] = func(self[key])
+        return self._cache[cache_key]
+
+    def reduce_all(self, func, name=None, keys=None):
+        """return dict of func applied to every run (see reduce)"""
+        if keys is None:
+            keys = self.keys()
+        return dict((k, self.reduce(k, func, name)) for k in keys)
@@ -0,0 +1,630 @@
+"""Synthetic STEM and NOAA input files, for running, profiling and
+scaling the pipeline without the NERSC data.
+
+The files have the layout of the real ones -- I/O API headers and
+TFLAG, the same variable names, units, dimensions and time steps -- so
+they are read by the same code (stem_pytools parsers, ioapi_tools,
+time_integrator, noaa_ocs) as the real data:
+
+    - GRIDDESC.txt, describing the grid (ARCNAGRID)
+    - TOPO-124x124.nc: LAT, LON and TOPO of the grid
+    - wrfheight-124x124-22levs.nc: AGLHEIGHT of the STEM layer tops
+    - AQOUT files: hourly CO2_TRACER1 [COS] (ppbv), [t, 22, row, col],
+      with a midday near-surface drawdown
+    - GPP and fCOS files: hourly surface fluxes, [t, 1, row, col]
+    - lateral (BNDARY3) and top boundary [COS] files
+    - NOAA airborne event files, ocs_<site>_aircraft-pfp_1_hats_event.txt
+
+The grid size and the period are configurable, from the 124 x 124 STEM
+grid up to 1000 x 1000 and several years.  Larger grids cover the same
+North American domain at a finer resolution; the files keep the names
+the code expects (e.g. TOPO-124x124.nc) whatever their size.
+
+write_fixture writes a complete set of inputs for a list of STEM runs
+(by default the runs of the spatial paper) and a run registry, read by
+local_data_paths, that takes the place of
+stem_pytools.NERSC_data_paths.get_runs().
+
+The values are smooth fields plus seeded noise: realistic enough in
+size and in the shape of the data (diurnal cycle, vertical gradient,
+missing values) that every stage of the pipeline does its full amount
+of work, but not meaningful.  Large fields are generated and written a
+block of records at a time, so memory use does not grow with the file
+size.
+"""
+
+import os
+import os.path
+import json
+import argparse
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+
+import ioapi_tools
+import local_data_paths
+import data_paths
+
+EARTH_RADIUS = 6370000.0  # m, the WRF / STEM sphere
+# NOAA airborne sites: (code, longitude, latitude)
+NOAA_SITES = [('THD', -124.15, 41.05),
+              ('PFA', -147.29, 65.07),
+              ('ESP', -126.80, 49.38),
+              ('TGC', -97.50, 27.73),
+              ('NHA', -70.63, 42.95),
+              ('SCA', -79.55, 32.77),
+              ('CMA', -74.32, 38.83),
+              ('WBI', -91.35, 41.73),
+              ('HIL', -87.50, 40.07),
+              ('AAO', -88.35, 40.05),
+              ('OIL', -88.10, 41.90),
+              ('DND', -99.00, 48.38),
+              ('LEF', -90.27, 45.95),
+              ('SGP', -97.50, 36.80),
+              ('CAR', -104.30, 40.37),
+              ('BNE', -96.50, 40.80),
+              ('ETL', -104.99, 54.35),
+              ('WGC', -121.49, 38.27)]
+# columns of the NOAA event files, as listed in their data_fields
+# header line
+NOAA_FIELDS = ['sample_site_code', 'sample_year', 'sample_month',
+               'sample_day', 'sample_hour', 'sample_minute',
+               'sample_seconds', 'sample_id', 'sample_method',
+               'parameter_formula', 'analysis_group_abbr', 'analysis_value',
+               'analysis_uncertainty', 'analysis_flag',
+               'analysis_instrument', 'analysis_year', 'analysis_month',
+               'analysis_day', 'analysis_hour', 'analysis_minute',
+               'analysis_seconds', 'sample_latitude', 'sample_longitude',
+               'sample_altitude', 'event_number']
+
+
+def make_grid(nrows=124, ncols=124, xcell=None, lat_center=50.0,
+              lon_center=-98.0, gdnam='ARCNAGRID'):
+    """return the parameters of a north polar stereographic grid
+    centered on (lon_center, lat_center), in the form returned by
+    ioapi_tools.parse_griddesc.  The defaults match the size and
+    resolution of the 60 km North American STEM grid (ARCNAGRID).
+
+    xcell (float): cell size, m.  Default is the size that makes ncols
+       cells span the width of the 124 x 124, 60 km grid.
+    """
+    if xcell is None:
+        xcell = 124 * 60000.0 / ncols
+    # distance of the grid center from the pole on the projection
+    # plane (true at the pole)
+    r_c = 2.0 * EARTH_RADIUS * np.tan(np.radians(90.0 - lat_center) / 2.0)
+    return {'GDNAM': gdnam,
+            'GDTYP': 6,
+            'P_ALP': 1.0,
+            'P_BET': 90.0,
+            'P_GAM': lon_center,
+            'XCENT': lon_center,
+            'YCENT': 90.0,
+            'XORIG': -0.5 * ncols * xcell,
+            'YORIG': -r_c - 0.5 * nrows * xcell,
+            'XCELL': xcell,
+            'YCELL': xcell,
+            'NCOLS': ncols,
+            'NROWS': nrows,
+            'NTHIK': 1}
+
+
+def grid_lonlat(grid):
+    """return (lon, lat), each [NROWS, NCOLS], of the cell centers of a
+    grid from make_grid"""
+    x = grid['XORIG'] + grid['XCELL'] * (np.arange(grid['NCOLS']) + 0.5)
+    y = grid['YORIG'] + grid['YCELL'] * (np.arange(grid['NROWS']) + 0.5)
+    x, y = np.meshgrid(x, y)
+    r = np.hypot(x, y)
+    lat = 90.0 - 2.0 * np.degrees(np.arctan(r / (2.0 * EARTH_RADIUS)))
+    lon = grid['XCENT'] + np.degrees(np.arctan2(x, -y))
+    return lon, lat
+
+
+def _spatial_pattern(grid, seed=0):
+    """a smooth field between 0 and 1 over the grid"""
+    rng = np.random.RandomState(seed)
+    lon, lat = grid_lonlat(grid)
+    kx, ky, phase = rng.uniform(0.5, 2.0), rng.uniform(0.5, 2.0), \
+        rng.uniform(0, np.pi)
+    return 0.5 + 0.5 * (np.sin(np.radians(lon) * 4 * kx + phase) *
+                        np.cos(np.radians(lat) * 4 * ky))
+
+
+def _daylight(hours_utc, lon):
+    """0 - 1 diurnal cycle of sunlight; hours_utc [t], lon [row, col]
+    -> [t, row, col]"""
+    local = (hours_utc[:, np.newaxis, np.newaxis] + lon / 15.0) % 24
+    return np.clip(np.sin(np.pi * (local - 6.0) / 12.0), 0.0, None)
+
+
+def layer_heights(nlays=22, z_top=16000.0):
+    """heights above ground (m) of the tops of nlays layers, stretched
+    so that the lowest layers are thinnest"""
+    return z_top * (np.expm1(np.linspace(0, 3, nlays + 1)[1:]) /
+                    np.expm1(3.0))
+
+
+def write_topo(fname, grid):
+    """write a TOPO file (LAT, LON, TOPO) for grid"""
+    lon, lat = grid_lonlat(grid)
+    topo = 1500.0 * _spatial_pattern(grid, seed=1)
+    ioapi_tools.write_ioapi(
+        fname, grid,
+        data={'LAT': lat[np.newaxis, np.newaxis, ...],
+              'LON': lon[np.newaxis, np.newaxis, ...],
+              'TOPO': topo[np.newaxis, np.newaxis, ...]},
+        units={'LAT': 'degrees', 'LON': 'degrees', 'TOPO': 'm'},
+        desc={'LAT': 'latitude', 'LON': 'longitude',
+              'TOPO': 'surface elevation'},
+        fdesc='synthetic TOPO', upnam='synthetic_data', zlib=False)
+
+
+def write_wrfheight(fname, grid, nlays=22):
+    """write a time-independent wrfheight file: AGLHEIGHT, the height
+    above ground (m) of the top of each layer"""
+    z = layer_heights(nlays)[:, np.newaxis, np.newaxis]
+    agl = np.broadcast_to(z, (nlays, grid['NROWS'], grid['NCOLS']))
+    ioapi_tools.write_ioapi(
+        fname, grid, data={'AGLHEIGHT': agl[np.newaxis, ...]},
+        units={'AGLHEIGHT': 'm'},
+        desc={'AGLHEIGHT': 'height of layer top above ground'},
+        fdesc='synthetic wrfheight', upnam='synthetic_data', zlib=False)
+
+
+def write_griddesc(fname, grid):
+    """write a GRIDDESC file describing grid, readable by
+    ioapi_tools.parse_griddesc and the I/O API library"""
+    coord_name = 'SYNTH_' + grid['GDNAM']
+    lines = ["' '",
+             "'{}'".format(coord_name),
+             '  {GDTYP:d} {P_ALP:0.6f} {P_BET:0.6f} {P_GAM:0.6f} '
+             '{XCENT:0.6f} {YCENT:0.6f}'.format(**grid),
+             "' '",
+             "'{}'".format(grid['GDNAM']),
+             "'{}' {XORIG:0.3f} {YORIG:0.3f} {XCELL:0.3f} {YCELL:0.3f} "
+             "{NCOLS:d} {NROWS:d} {NTHIK:d}".format(coord_name, **grid),
+             "' '"]
+    with open(fname, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def _chunk_tsteps(tstep, nlays, grid, max_values=2 ** 23):
+    """number of records to generate at once: whole days where that
+    keeps a block under max_values values (64 MB in float64), fewer for
+    large grids"""
+    per_day = max(1, 86400 // ioapi_tools.tstep_to_seconds(tstep))
+    per_record = nlays * grid['NROWS'] * grid['NCOLS']
+    n = max(1, max_values // per_record)
+    return per_day * (n // per_day) if n >= per_day else n
+
+
+def _record_hours(t0, tstep, i0, n):
+    """UTC hour of day (fractional) of records i0 ... i0 + n - 1"""
+    dt = ioapi_tools.tstep_to_seconds(tstep)
+    s = t0.hour * 3600 + t0.minute * 60 + t0.second + \
+        dt * np.arange(i0, i0 + n)
+    return (s % 86400) / 3600.0
+
+
+def _n_records(ndays, tstep):
+    return int(ndays * 86400 // ioapi_tools.tstep_to_seconds(tstep))
+
+
+def write_aqout(fname, grid, t0=datetime(2008, 7, 1), ndays=62, nlays=22,
+                drawdown=0.03, background=0.45, noise=0.002, tstep=10000,
+                seed=0, fmt='NETCDF3_64BIT_OFFSET'):
+    """write a STEM AQOUT file of [COS] (CO2_TRACER1, ppbv)
+
+    [COS] is background minus a drawdown that peaks at midday, is
+    largest in the lowest layer and decays with height.
+
+    ARGS:
+    fname (string): full path of the file to create
+    grid (dict): grid parameters (see make_grid)
+    t0 (datetime.datetime): time of the first record
+    ndays (int): number of days of records; may span several years
+    nlays (int): number of layers
+    drawdown (float): midday surface drawdown at the strongest cells,
+       ppbv.  Negative values make a source (e.g. anthropogenic
+       emissions).
+    background (float): [COS] away from the surface, ppbv
+    noise (float): standard deviation of the added noise, ppbv
+    tstep (int): I/O API time step (HHMMSS); default hourly
+    seed (int): random seed
+    fmt (string): netCDF format; STEM writes 64-bit offset netCDF3
+    """
+    rng = np.random.RandomState(seed)
+    lon, lat = grid_lonlat(grid)
+    pattern = _spatial_pattern(grid, seed)
+    profile = np.exp(-np.arange(nlays) / 3.0)[:, np.newaxis, np.newaxis]
+    sdate, stime = ioapi_tools.datetime_to_ioapi(t0)
+    nt = _n_records(ndays, tstep)
+    chunk = _chunk_tsteps(tstep, nlays, grid)
+    with ioapi_tools.IOAPIWriter(
+            fname, grid, [('CO2_TRACER1', 'ppbv', 'COS')], nlays=nlays,
+            sdate=sdate, stime=stime, tstep=tstep,
+            fdesc='synthetic STEM AQOUT', upnam='synthetic_data',
+            fmt=fmt) as w:
+        for i0 in range(0, nt, chunk):
+            hours = _record_hours(t0, tstep, i0, min(chunk, nt - i0))
+            dd = drawdown * (_daylight(hours, lon) * pattern)
+            cos = background - dd[:, np.newaxis, ...] * profile
+            cos += rng.normal(0.0, noise, cos.shape)
+            w.write_var('CO2_TRACER1', cos.astype('f4'), t0=i0)
+
+
+def write_surface_flux(fname, grid, varname, units, desc,
+                       t0=datetime(2008, 7, 1), ndays=62, peak=1.0,
+                       diurnal=True, missing_frac=0.0, tstep=10000,
+                       seed=0):
+    """write a surface flux file, [t, 1, row, col]
+
+    The flux is peak times a smooth spatial pattern, times the diurnal
+    cycle of sunlight if diurnal is True.  A fraction missing_frac of
+    the cells (the same cells every record, e.g. ocean) is set to NaN.
+
+    ARGS:
+    fname (string): full path of the file to create
+    grid (dict): grid parameters (see make_grid)
+    varname, units, desc (string): the flux variable
+    t0 (datetime.datetime): time of the first record
+    ndays (int): number of days of records
+    peak (float): flux at midday at the strongest cells
+    diurnal (bool): if False the flux is constant in time
+    missing_frac (float): fraction of the cells set to NaN
+    tstep (int): I/O API time step (HHMMSS); default hourly
+    seed (int): random seed
+    """
+    rng = np.random.RandomState(seed)
+    lon, lat = grid_lonlat(grid)
+    pattern = peak * _spatial_pattern(grid, seed)
+    pattern[rng.uniform(size=pattern.shape) < missing_frac] = np.nan
+    sdate, stime = ioapi_tools.datetime_to_ioapi(t0)
+    nt = _n_records(ndays, tstep)
+    chunk = _chunk_tsteps(tstep, 1, grid)
+    with ioapi_tools.IOAPIWriter(
+            fname, grid, [(varname, units, desc)], sdate=sdate,
+            stime=stime, tstep=tstep, fdesc='synthetic ' + desc,
+            upnam='synthetic_data',
+            chunk_tsteps=min(chunk, 86400 //
+                             ioapi_tools.tstep_to_seconds(tstep))) as w:
+        for i0 in range(0, nt, chunk):
+            n = min(chunk, nt - i0)
+            if diurnal:
+                flux = _daylight(_record_hours(t0, tstep, i0, n), lon) * \
+                    pattern
+            else:
+                flux = np.repeat(pattern[np.newaxis, ...], n, axis=0)
+            w.write_var(varname, flux[:, np.newaxis, ...].astype('f4'),
+                        t0=i0)
+
+
+def cos_profile_ppbv(nlays, surface=0.47, top=0.50):
+    """[COS] (ppbv) increasing from surface in the lowest layer to top
+    in the highest"""
+    return surface + (top - surface) * np.sqrt(np.linspace(0, 1, nlays))
+
+
+def write_lateral_boundary(fname, grid, t0=datetime(2008, 7, 1), ndays=62,
+                           nlays=22, tstep=60000, seed=0):
+    """write a lateral boundary file (BNDARY3) of [COS] (CO2_TRACER1,
+    ppbv), [t, nlays, perimeter], varying slowly around
+    cos_profile_ppbv
+
+    ARGS:
+    fname (string): full path of the file to create
+    grid (dict): grid parameters (see make_grid)
+    t0 (datetime.datetime): time of the first record
+    ndays (int): number of days of records
+    nlays (int): number of layers
+    tstep (int): I/O API time step (HHMMSS); default 6 hours
+    seed (int): random seed
+    """
+    rng = np.random.RandomState(seed)
+    nperim = 2 * grid['NTHIK'] * (grid['NCOLS'] + grid['NROWS'] +
+                                  2 * grid['NTHIK'])
+    profile = cos_profile_ppbv(nlays)[:, np.newaxis]
+    # a different phase of a seasonal swing along the perimeter
+    phase = np.linspace(0, 2 * np.pi, nperim)[np.newaxis, :]
+    sdate, stime = ioapi_tools.datetime_to_ioapi(t0)
+    nt = _n_records(ndays, tstep)
+    dt_days = ioapi_tools.tstep_to_seconds(tstep) / 86400.0
+    with ioapi_tools.IOAPIWriter(
+            fname, grid, [('CO2_TRACER1', 'ppbv', 'boundary COS')],
+            ftype=ioapi_tools.BNDARY3, nlays=nlays, sdate=sdate,
+            stime=stime, tstep=tstep, fdesc='synthetic lateral boundary',
+            upnam='synthetic_data') as w:
+        for t in range(nt):
+            day = t * dt_days
+            bnd = profile * (1.0 + 0.02 * np.sin(2 * np.pi * day / 365.0 +
+                                                 phase))
+            bnd += rng.normal(0.0, 0.001, bnd.shape)
+            w.write_timestep(t, {'CO2_TRACER1': bnd.astype('f4')})
+
+
+def write_top_boundary(fname, grid, nlays=22):
+    """write a time-independent top boundary file of [COS]
+    (CO2_TRACER1, ppbv), [1, 1, row, col]: the top of
+    cos_profile_ppbv, varying smoothly over the grid"""
+    top = cos_profile_ppbv(nlays)[-1] * (
+        0.99 + 0.02 * _spatial_pattern(grid, seed=2))
+    ioapi_tools.write_ioapi(
+        fname, grid, data={'CO2_TRACER1': top[np.newaxis, np.newaxis, ...]},
+        units={'CO2_TRACER1': 'ppbv'},
+        desc={'CO2_TRACER1': 'climatological [COS]'},
+        fdesc='synthetic top boundary', upnam='synthetic_data', zlib=False)
+
+
+def write_noaa_event_files(noaa_dir, sites=NOAA_SITES, years=(2008,),
+                           flights_per_month=4, seed=0):
+    """write NOAA airborne [COS] event files (HATS text format), one per
+    site, named ocs_<site>_aircraft-pfp_1_hats_event.txt
+
+    Each flight samples 12 altitudes between 300 and 8000 m around
+    midday local time.  Observed [COS] is 500 ppt aloft with a
+    near-surface drawdown that is strongest in July and August.  About
+    2% of the samples are flagged with missing values (-999.99).
+
+    ARGS:
+    noaa_dir (string): directory in which to write the files
+    sites (list): (code, longitude, latitude) of each site
+    years (list): years of the observations
+    flights_per_month (int): number of flights per site and month
+    seed (int): random seed
+
+    RETURNS:
+    list of the full paths of the files written
+    """
+    rng = np.random.RandomState(seed)
+    if not os.path.isdir(noaa_dir):
+        os.makedirs(noaa_dir)
+    altitudes = np.linspace(300.0, 8000.0, 12)
+    fnames = []
+    for code, lon, lat in sites:
+        rows = []
+        event = 0
+        for year, month in [(y, m) for y in years for m in range(1, 13)]:
+            days = np.sort(rng.choice(np.arange(1, 29), flights_per_month,
+                                      replace=False))
+            # summer drawdown, ppt
+            season = 40.0 * np.exp(-((month - 7.5) / 1.5) ** 2)
+            for day in days:
+                t = datetime(year, month, day, 18) + timedelta(
+                    minutes=int(rng.randint(0, 120)))
+                for alt in altitudes:
+                    t_sample = t + timedelta(minutes=int(alt / 200.0))
+                    value = (500.0 - season * np.exp(-alt / 1500.0) +
+                             rng.normal(0.0, 5.0))
+                    if rng.uniform() < 0.02:
+                        value = -999.99
+                    event += 1
+                    rows.append(
+                        '{site} {t:%Y %m %d %H %M %S} {sid} P ocs HATS '
+                        '{val:0.2f} -999.99 ... PR1 {t:%Y %m %d %H %M %S} '
+                        '{lat:0.4f} {lon:0.4f} {alt:0.1f} {ev}'.format(
+                            site=code, t=t_sample,
+                            sid='{}-{:02d}'.format(3000 + event % 997,
+                                                   event % 12 + 1),
+                            val=value, lat=lat + rng.normal(0.0, 0.02),
+                            lon=lon + rng.normal(0.0, 0.02), alt=alt,
+                            ev=event))
+        fname = os.path.join(
+            noaa_dir,
+            'ocs_{}_aircraft-pfp_1_hats_event.txt'.format(code.lower()))
+        header = ['# number_of_header_lines: 4',
+                  '# comment: synthetic data written by synthetic_data.py',
+                  '# comment: site {} ({:0.2f}, {:0.2f})'.format(code, lon,
+                                                                 lat),
+                  '# data_fields: ' + ' '.join(NOAA_FIELDS)]
+        with open(fname, 'w') as f:
+            f.write('\n'.join(header + rows) + '\n')
+        fnames.append(fname)
+    return fnames
+
+
+# the STEM runs written by write_fixture: (key, model, flux component,
+# run lists the run belongs to; see local_data_paths)
+RUNS = [('SiB_calc', 'SiB calc', 'plant', ('spatial_paper',)),
+        ('SiB_mech', 'SiB mech', 'plant', ('spatial_paper',)),
+        ('casa_gfed_161', 'CASA-GFED3 LRU1.61', 'plant',
+         ('spatial_paper', 'BASC')),
+        ('casa_gfed_C4pctLRU', 'CASA-GFED3', 'plant',
+         ('spatial_paper', 'C3C4')),
+        ('canibis_161', 'Can-IBIS LRU1.61', 'plant',
+         ('spatial_paper', 'BASC')),
+        ('canibis_C4pctLRU', 'Can-IBIS', 'plant',
+         ('spatial_paper', 'C3C4')),
+        ('Fsoil_Kettle', 'Kettle soil', 'soil', ('spatial_paper',)),
+        ('Fsoil_Hybrid5Feb', 'Whelan-Kettle hybrid soil', 'soil',
+         ('spatial_paper',)),
+        ('Anthro_Andrew', 'Zumkehr anthropogenic', 'anthro',
+         ('spatial_paper',)),
+        ('Anthro_Kettle', 'Kettle anthropogenic', 'anthro',
+         ('spatial_paper',)),
+        ('climatological_bnd', 'climatological boundaries', 'bounds',
+         ('spatial_paper',))]
+# per flux component: midday surface [COS] drawdown (ppbv), peak COS
+# flux (mol m-2 s-1; None for no flux file), whether the flux has a
+# diurnal cycle, and whether the run has a GPP file.  Plant uptake
+# draws [COS] down; soil uptake is weaker and anthropogenic emissions
+# are a source.
+COMPONENTS = {'plant': (0.03, -5e-11, True, True),
+              'soil': (0.005, -1e-11, True, False),
+              'anthro': (-0.004, 2e-12, False, False),
+              'bounds': (0.0, None, False, False)}
+FIXTURE_NAME = 'fixture.json'
+
+
+def write_fixture(root, grid=None, t0=datetime(2008, 7, 1), ndays=62,
+                  nlays=22, runs=None, tstep=10000, seed=0):
+    """write a complete set of synthetic inputs and a run registry
+
+    The directory layout follows the NERSC one, so that $PROJ=<root>
+    and $SARIKA_INPUT=<root>/Data/STEM_124x124_NA_inputs point the
+    existing code at the synthetic files, and
+    $STEM_RUNS_REGISTRY=<root>/stem_runs.json lets local_data_paths
+    stand in for NERSC_data_paths:
+
+        Data/STEM_124x124_NA_inputs/GRIDDESC.txt
+        Data/STEM_124x124_NA_inputs/TOPO-124x124.nc
+        Data/STEM_124x124_NA_inputs/wrfheight-124x124-22levs.nc
+        Data/STEM_124x124_NA_inputs/bdv-124x124-cos-climatological.nc
+        Data/STEM_124x124_NA_inputs/upbound_124x124-climatological_124x124.nc
+        Data/NOAA_95244993/ocs_<site>_aircraft-pfp_1_hats_event.txt
+        runs/<key>/AQOUT-<key>.nc, GPP-<key>.nc, fCOS-<key>.nc
+        stem_runs.json
+        fixture.json
+
+    Each hourly 22-layer AQOUT file of 62 days is 2 GB on the 124 x 124
+    grid and 130 GB on a 1000 x 1000 grid; restrict runs accordingly.
+
+    ARGS:
+    root (string): directory to write the files to
+    grid (dict): grid parameters; default make_grid()
+    t0 (datetime.datetime): time of the first record
+    ndays (int): number of days of data; may span several years
+    nlays (int): number of layers
+    runs (list): keys (see RUNS) of the runs to write; default all
+    tstep (int): I/O API time step (HHMMSS) of the AQOUT, GPP and fCOS
+       files; default hourly
+    seed (int): random seed
+
+    RETURNS:
+    dict of name -> full path of the files and directories written:
+       input_dir, noaa_dir, griddesc, topo, wrfheight, lateral_bdy,
+       top_bdy and registry
+    """
+    if grid is None:
+        grid = make_grid()
+    if runs is None:
+        runs = [r[0] for r in RUNS]
+    root = os.path.abspath(root)
+    input_dir = os.path.join(root, 'Data', 'STEM_124x124_NA_inputs')
+    paths = {'input_dir': input_dir,
+             'noaa_dir': os.path.join(root, 'Data', 'NOAA_95244993'),
+             'griddesc': os.path.join(input_dir, 'GRIDDESC.txt'),
+             'topo': os.path.join(input_dir, 'TOPO-124x124.nc'),
+             'wrfheight': os.path.join(input_dir,
+                                       'wrfheight-124x124-22levs.nc'),
+             'lateral_bdy': os.path.join(
+                 input_dir, 'bdv-124x124-cos-climatological.nc'),
+             'top_bdy': os.path.join(
+                 input_dir, 'upbound_124x124-climatological_124x124.nc'),
+             'registry': os.path.join(root,
+                                      local_data_paths.REGISTRY_NAME)}
+    if not os.path.isdir(input_dir):
+        os.makedirs(input_dir)
+    t1 = t0 + timedelta(days=ndays)
+    write_griddesc(paths['griddesc'], grid)
+    write_topo(paths['topo'], grid)
+    write_wrfheight(paths['wrfheight'], grid, nlays)
+    write_lateral_boundary(paths['lateral_bdy'], grid, t0=t0, ndays=ndays,
+                           nlays=nlays, seed=seed)
+    write_top_boundary(paths['top_bdy'], grid, nlays)
+    write_noaa_event_files(paths['noaa_dir'],
+                           years=range(t0.year, t1.year + 1), seed=seed)
+
+    stem_runs = OrderedDict()
+    for i, (key, model, component, groups) in enumerate(RUNS):
+        if key not in runs:
+            continue
+        drawdown, fcos_peak, diurnal, has_gpp = COMPONENTS[component]
+        run_dir = os.path.join(root, 'runs', key)
+        if not os.path.isdir(run_dir):
+            os.makedirs(run_dir)
+        run = local_data_paths.STEMRun(
+            model, aqout_path=os.path.join(run_dir,
+                                           'AQOUT-{}.nc'.format(key)),
+            groups=groups)
+        print('writing {}'.format(run_dir))
+        write_aqout(run.aqout_path, grid, t0=t0, ndays=ndays, nlays=nlays,
+                    drawdown=drawdown, tstep=tstep, seed=seed + i)
+        if has_gpp:
+            run.gpp_path = os.path.join(run_dir, 'GPP-{}.nc'.format(key))
+            run.gppraw_path = run.gpp_path
+            write_surface_flux(run.gpp_path, grid, 'GPP', 'mol m-2 s-1',
+                               'GPP', t0=t0, ndays=ndays, peak=2e-5,
+                               missing_frac=0.3, tstep=tstep, seed=seed + i)
+        if fcos_peak is not None:
+            run.fcos_path = os.path.join(run_dir, 'fCOS-{}.nc'.format(key))
+            write_surface_flux(run.fcos_path, grid, 'cos', 'mol m-2 s-1',
+                               'COS {} flux'.format(component), t0=t0,
+                               ndays=ndays, peak=fcos_peak,
+                               diurnal=diurnal, missing_frac=0.3,
+                               tstep=tstep, seed=seed + i)
+        stem_runs[key] = run
+    local_data_paths.write_registry(paths['registry'], stem_runs)
+
+    params = OrderedDict([('nrows', grid['NROWS']),
+                          ('ncols', grid['NCOLS']),
+                          ('nlays', nlays),
+                          ('t0', t0.isoformat()),
+                          ('ndays', ndays),
+                          ('tstep', tstep),
+                          ('runs', list(stem_runs.keys())),
+                          ('seed', seed)])
+    with open(os.path.join(root, FIXTURE_NAME), 'w') as f:
+        json.dump(OrderedDict([('params', params), ('paths', paths)]), f,
+                  indent=2)
+    return paths
+
+
+def read_fixture(root):
+    """return (params, paths) of the fixture written to root by
+    write_fixture, or (None, None) if there is none"""
+    fname = os.path.join(root, FIXTURE_NAME)
+    if not os.path.exists(fname):
+        return None, None
+    with open(fname) as f:
+        fixture = json.load(f, object_pairs_hook=OrderedDict)
+    return fixture['params'], fixture['paths']
+
+
+def use_fixture(paths):
+    """point the pipeline's inputs at a fixture: the environment
+    variables the data_paths defaults are built from ($PROJ and
+    $SARIKA_INPUT), the GRIDDESC file (COS_PATH_GRIDDESC and
+    COS_PATH_IOAPI_GRIDDESC) and the run registry
+    ($STEM_RUNS_REGISTRY).  The data_paths registry of the
+    process is rebuilt.
+
+    ARGS:
+    paths (dict): as returned by write_fixture or read_fixture
+    """
+    os.environ['PROJ'] = os.path.dirname(os.path.dirname(
+        paths['input_dir']))
+    os.environ['SARIKA_INPUT'] = paths['input_dir']
+    os.environ[data_paths.OVERRIDE_PREFIX + 'GRIDDESC'] = paths['griddesc']
+    os.environ[data_paths.OVERRIDE_PREFIX + 'IOAPI_GRIDDESC'] = \
+        paths['griddesc']
+    os.environ[local_data_paths.REGISTRY_ENV] = paths['registry']
+    data_paths.reset()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='write synthetic STEM and NOAA inputs and a run '
+        'registry')
+    parser.add_argument('root', help='directory to write the files to')
+    parser.add_argument('--nrows', type=int, default=124)
+    parser.add_argument('--ncols', type=int, default=124)
+    parser.add_argument('--nlays', type=int, default=22)
+    parser.add_argument('--t0', default='2008-07-01',
+                        help='first day, YYYY-MM-DD (default 2008-07-01)')
+    parser.add_argument('--ndays', type=int, default=62,
+                        help='days of data (default 62)')
+    parser.add_argument('--tstep', type=int, default=10000,
+                        help='time step, HHMMSS (default 10000)')
+    parser.add_argument('--runs', default=None,
+                        help='comma-separated run keys (default all: '
+                        '{})'.format(', '.join(r[0] for r in RUNS)))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    paths = write_fixture(
+        args.root, grid=make_grid(args.nrows, args.ncols),
+        t0=datetime.strptime(args.t0, '%Y-%m-%d'), ndays=args.ndays,
+        nlays=args.nlays, tstep=args.tstep, seed=args.seed,
+        runs=args.runs.split(',') if args.runs else None)
+    for k in sorted(paths.keys()):
+        print('{}: {}'.format(k, paths[k]))
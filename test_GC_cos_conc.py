@@ -8,10 +8,11 @@ import os.path
 from stem_pytools import aqout_postprocess as aq
 from stem_pytools.calc_drawdown import calc_STEM_COS_drawdown
 import gradient_bar_plots as gbp
+import data_paths
 
 
 def get_cos_conc():
-    cpickle_fname = os.path.join(os.getenv('SCRATCH'),
+    cpickle_fname = os.path.join(data_paths.get_path('output_dir'),
                                  '2015-11-16_all_runs.cpickle')
     cos_conc_daily = aq.load_aqout_data(cpickle_fname)
     keys_to_remove = ['casa_gfed_pctm_bnd', 'casa_gfed_KV']
@@ -56,27 +57,29 @@ def draw_histogram(data, xlab_str, ylab_str, title_str, nbins=50):
 
 if __name__ == "__main__":
     try:
-        data = get_cos_conc()
+        # the runs are stacked in a temporary file; the with block
+        # deletes it
+        with get_cos_conc() as data:
+            d = data['casa_gfed_161'] - data['casa_gfed_161, GC']
+            molecules_cm3_2_ppt = 1e12
+            fig = draw_histogram(d * molecules_cm3_2_ppt,
+                                 xlab_str='[COS], ppt',
+                                 ylab_str='number of grid cells',
+                                 title_str=r'$\Delta$[COS]: CASA GFED3 - CASA GFED3, GC')
+            fig.savefig(os.path.join(data_paths.get_path('plot_dir'),
+                                     'GC_diff.png'))
+            plt.close(fig)
 
-        d = data['casa_gfed_161'] - data['casa_gfed_161, GC']
-        molecules_cm3_2_ppt = 1e12
-        fig = draw_histogram(d * molecules_cm3_2_ppt,
-                             xlab_str='[COS], ppt',
-                             ylab_str='number of grid cells',
-                             title_str=r'$\Delta$[COS]: CASA GFED3 - CASA GFED3, GC')
-        fig.savefig(os.path.join(os.getenv('HOME'), 'plots', 'GC_diff.png'))
-        plt.close(fig)
+            d_dd = (calc_STEM_COS_drawdown(data['casa_gfed_161']) -
+                    calc_STEM_COS_drawdown(data['casa_gfed_161, GC']))
 
-        d_dd = (calc_STEM_COS_drawdown(data['casa_gfed_161']) -
-                calc_STEM_COS_drawdown(data['casa_gfed_161, GC']))
-
-        fig = draw_histogram(d_dd,
-                             xlab_str='COS vertical drawdown (ppt)',
-                             ylab_str='number of grid cells',
-                             title_str=r'$\Delta$drawdown: CASA GFED3 - CASA GFED3, GC')
-        fig.savefig(os.path.join(os.getenv('HOME'),
-                                 'plots', 'GC_dd_diff.png'))
-        plt.close(fig)
+            fig = draw_histogram(d_dd,
+                                 xlab_str='COS vertical drawdown (ppt)',
+                                 ylab_str='number of grid cells',
+                                 title_str=r'$\Delta$drawdown: CASA GFED3 - CASA GFED3, GC')
+            fig.savefig(os.path.join(data_paths.get_path('plot_dir'),
+                                     'GC_dd_diff.png'))
+            plt.close(fig)
     finally:
         sys.stdout.write('closing all figures')
         sys.stdout.flush
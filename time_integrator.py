@@ -0,0 +1,304 @@
+"""Integrate gridded flux time series over calendar time windows.
+
+The soil and plant flux comparisons integrate fluxes over July and
+August 2008 by summing every time step and multiplying by a
+hard-coded time step length and number of months.  TimeIntegrator
+instead takes the record timestamps of a flux file, gives each record
+its own length (so monthly records of 30 and 31 days, or files with
+irregular time steps, are weighted correctly), and integrates over any
+number of TimeWindows, including windows that start or end part way
+through a record.
+
+The integrals are computed from one pass over the data: the flux is
+accumulated as a running (cumulative) time integral, and only the
+values of that cumulative integral at the window edges are kept.  A
+window's integral is the difference of the cumulative integral at its
+two edges.  Data can be added a chunk of time steps at a time, so a
+full year of fluxes can be reduced to monthly and seasonal totals with
+a single read of the file (see integrate_ioapi).
+
+NaN (or masked) values are excluded from the integrals; the seconds of
+valid data in each window are tracked alongside.  Time outside the
+records (before the first one or after the end of the last) has no
+data; TimeIntegrator warns when a window reaches into it.
+"""
+
+import calendar
+import warnings
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+import netCDF4
+
+import ioapi_tools
+
+
+class TimeWindow(object):
+    """a calendar time window [t0, t1)
+
+    ATTRIBUTES:
+    name (string): name of the window (e.g. 'JulAug', 'Jan', 'JJA')
+    t0 (datetime.datetime): start of the window
+    t1 (datetime.datetime): end of the window (exclusive)
+    """
+
+    def __init__(self, name, t0, t1):
+        self.name = name
+        self.t0 = t0
+        self.t1 = t1
+
+    def seconds(self):
+        return (self.t1 - self.t0).total_seconds()
+
+    def months(self):
+        """length of the window in calendar months; a partial month
+        counts as its fraction of that month's length"""
+        n = 0.0
+        y, m = self.t0.year, self.t0.month
+        while datetime(y, m, 1) < self.t1:
+            m0 = datetime(y, m, 1)
+            ndays = calendar.monthrange(y, m)[1]
+            y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+            m1 = datetime(y, m, 1)
+            overlap = (min(m1, self.t1) - max(m0, self.t0)).total_seconds()
+            n += max(overlap, 0.0) / (ndays * 24 * 60 * 60)
+        return n
+
+    def __repr__(self):
+        return 'TimeWindow({!r}, {!r}, {!r})'.format(self.name, self.t0,
+                                                     self.t1)
+
+
+# July and August 2008, the period of the spatial paper
+JULAUG_2008 = TimeWindow('JulAug', datetime(2008, 7, 1),
+                         datetime(2008, 9, 1))
+
+
+def monthly_windows(year):
+    """the twelve calendar months of year, named Jan ... Dec"""
+    windows = []
+    for m in range(1, 13):
+        t1 = datetime(year + 1, 1, 1) if m == 12 else datetime(year, m + 1, 1)
+        windows.append(TimeWindow(calendar.month_abbr[m],
+                                  datetime(year, m, 1), t1))
+    return windows
+
+
+def seasonal_windows(year):
+    """the meteorological seasons of year: DJF (December of the
+    previous year through February), MAM, JJA and SON"""
+    return [TimeWindow('DJF', datetime(year - 1, 12, 1),
+                       datetime(year, 3, 1)),
+            TimeWindow('MAM', datetime(year, 3, 1), datetime(year, 6, 1)),
+            TimeWindow('JJA', datetime(year, 6, 1), datetime(year, 9, 1)),
+            TimeWindow('SON', datetime(year, 9, 1), datetime(year, 12, 1))]
+
+
+def _seconds(t):
+    """datetime64 / datetime -> seconds since 1970 as int64"""
+    return np.asarray(t, dtype='datetime64[s]').astype('i8')
+
+
+class TimeIntegrator(object):
+    """time integrals of a flux over many TimeWindows from a single
+    pass over the flux data
+
+    Each record i covers [times[i], times[i + 1]); the last record ends
+    at t_end.  Data are added in time order with add(), in chunks of
+    any size.
+    """
+
+    def __init__(self, times, windows, tstep_seconds=None, t_end=None):
+        """
+        ARGS:
+        times (array-like): start time of each record (datetime64,
+           datetime.datetime, ...)
+        windows (list): TimeWindow objects
+        tstep_seconds (float): length of the last record, seconds.
+           Ignored if t_end is given.  Default is the length of the
+           second to last record.
+        t_end (datetime.datetime): end of the last record
+        """
+        starts = _seconds(times)
+        if t_end is not None:
+            end = _seconds(t_end)
+        elif tstep_seconds is not None:
+            end = starts[-1] + int(tstep_seconds)
+        elif starts.size > 1:
+            end = 2 * starts[-1] - starts[-2]
+        else:
+            raise ValueError('the length of a single record requires '
+                             'tstep_seconds or t_end')
+        self.windows = list(windows)
+        for w in self.windows:
+            if _seconds(w.t0) < starts[0] or _seconds(w.t1) > end:
+                warnings.warn(('window {} ({} - {}) extends beyond the '
+                               'records ({} - {}); the time outside them '
+                               'has no data').format(
+                                   w.name, w.t0, w.t1,
+                                   np.array(starts[0]).astype('M8[s]'),
+                                   np.array(end).astype('M8[s]')))
+        self.nt = starts.size
+        self.dt = (np.append(starts[1:], end) - starts).astype('f8')
+
+        # cumulative integral is evaluated at each distinct window edge:
+        # record _k[j] (-1 if the edge precedes the data) plus _offset[j]
+        # seconds into it
+        edges = sorted(set([_seconds(w.t0).item() for w in self.windows] +
+                           [_seconds(w.t1).item() for w in self.windows]))
+        self._edge_idx = dict((e, j) for j, e in enumerate(edges))
+        edges = np.array(edges, dtype='i8')
+        self._k = np.searchsorted(starts, edges, side='right') - 1
+        k = np.maximum(self._k, 0)
+        self._offset = np.clip(edges - starts[k], 0, self.dt[k])
+        self._n_added = 0
+        self._cum = None
+
+    def add(self, data, valid=None):
+        """add the next block of records
+
+        ARGS:
+        data (array-like): [n, ...] flux values of the next n records.
+           Masked values and NaNs are excluded.
+        valid (array): optional boolean array shaped as data; False
+           values are excluded as well
+
+        RETURNS:
+        self
+        """
+        if np.ma.isMaskedArray(data):
+            data = np.ma.filled(data.astype('f8'), np.nan)
+        data = np.asarray(data, dtype='f8')
+        ok = ~np.isnan(data)
+        if valid is not None:
+            ok &= valid
+        n = data.shape[0]
+        i0 = self._n_added
+        if i0 + n > self.nt:
+            raise ValueError('more records added than timestamps given')
+        dt = self.dt[i0:i0 + n].reshape((n,) + (1,) * (data.ndim - 1))
+        f = np.where(ok, data, 0.0)
+        if self._cum is None:
+            shape = (len(self._offset),) + data.shape[1:]
+            # cumulative integral of the flux and of the valid time at
+            # the window edges, and running totals to the current record
+            self._cum = np.zeros(shape)
+            self._cum_valid = np.zeros(shape)
+            self._total = np.zeros(data.shape[1:])
+            self._total_valid = np.zeros(data.shape[1:])
+        for vals, cum, total in ((f, self._cum, self._total),
+                                 (ok.astype('f8'), self._cum_valid,
+                                  self._total_valid)):
+            inc = vals * dt
+            # running total at the start of each record of the block
+            start = np.cumsum(inc, axis=0)
+            start -= inc
+            start += total
+            for j in np.flatnonzero((self._k >= i0) & (self._k < i0 + n)):
+                r = self._k[j] - i0
+                cum[j] = start[r] + vals[r] * self._offset[j]
+            total[...] = start[-1] + inc[-1]
+        self._n_added += n
+        return self
+
+    def _diff(self, cum, w):
+        if self._n_added != self.nt:
+            raise ValueError('{} of {} records added'.format(
+                self._n_added, self.nt))
+        j0 = self._edge_idx[_seconds(w.t0).item()]
+        j1 = self._edge_idx[_seconds(w.t1).item()]
+        return cum[j1] - cum[j0]
+
+    def valid_seconds(self):
+        """OrderedDict of window name -> seconds of valid data"""
+        return OrderedDict((w.name, self._diff(self._cum_valid, w))
+                           for w in self.windows)
+
+    def totals(self):
+        """OrderedDict of window name -> time integral of the flux
+        (flux units x seconds); NaN where the window has no valid
+        data"""
+        out = OrderedDict()
+        for w in self.windows:
+            tot = self._diff(self._cum, w)
+            tot[self._diff(self._cum_valid, w) == 0] = np.nan
+            out[w.name] = tot
+        return out
+
+    def per_month(self):
+        """OrderedDict of window name -> time integral divided by the
+        length of the window in calendar months"""
+        return OrderedDict((w.name, tot / w.months()) for w, tot in
+                           zip(self.windows, self.totals().values()))
+
+    def means(self):
+        """OrderedDict of window name -> time-weighted mean flux over
+        the valid data in the window"""
+        out = OrderedDict()
+        for (name, tot), secs in zip(self.totals().items(),
+                                     self.valid_seconds().values()):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out[name] = tot / secs
+        return out
+
+
+def integrate(data, times, windows, **kwargs):
+    """integrate an in-memory [time, ...] flux array over windows
+
+    ARGS:
+    data (array-like): [time, ...] fluxes
+    times (array-like): start time of each record
+    windows (list): TimeWindow objects
+    **kwargs: passed on to TimeIntegrator (tstep_seconds, t_end)
+
+    RETURNS:
+    TimeIntegrator with all data added
+    """
+    return TimeIntegrator(times, windows, **kwargs).add(data)
+
+
+def integrate_ioapi(fname, varname, windows, chunk_tsteps=24, layer=0,
+                    t_end=None):
+    """integrate a variable of an I/O API file over windows, reading the
+    file chunk_tsteps records at a time
+
+    Only the records overlapping the windows are read: from the record
+    containing the earliest window start (which may begin before it,
+    e.g. a monthly record starting on 30 June) to the record containing
+    the latest window end.
+
+    ARGS:
+    fname (string): full path of the I/O API file
+    varname (string): variable to integrate
+    windows (list): TimeWindow objects
+    chunk_tsteps (int): number of records read at once
+    layer (int): zero-based layer to integrate
+    t_end (datetime.datetime): end of the last record of the file.
+       Default is the last record's timestamp plus the file's TSTEP.
+
+    RETURNS:
+    TimeIntegrator with all records of the file added
+    """
+    nc = netCDF4.Dataset(fname, 'r')
+    try:
+        times = ioapi_tools.get_tflag_datetimes(nc)
+        starts = _seconds(times)
+        r0 = np.searchsorted(starts, min(_seconds(w.t0) for w in windows),
+                             side='right') - 1
+        r0 = max(r0, 0)
+        r1 = np.searchsorted(starts, max(_seconds(w.t1) for w in windows),
+                             side='left')
+        r1 = max(r1, r0 + 1)
+        if r1 < times.size:
+            # the last record read ends where the next one starts
+            t_end = times[r1]
+        ti = TimeIntegrator(times[r0:r1], windows,
+                            tstep_seconds=ioapi_tools.tstep_to_seconds(
+                                nc.TSTEP),
+                            t_end=t_end)
+        v = nc.variables[varname]
+        for i0 in range(r0, r1, chunk_tsteps):
+            ti.add(v[i0:min(i0 + chunk_tsteps, r1), layer, ...])
+    finally:
+        nc.close()
+    return ti